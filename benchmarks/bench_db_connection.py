@@ -0,0 +1,99 @@
+"""
+Benchmark: connect-per-call vs. the persistent GameDatabase connection.
+
+Runs the same mix of get_user / update_credits / record_game calls against
+both implementations and prints operations per second.
+
+    python benchmarks/bench_db_connection.py --ops 3000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+import aiosqlite
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.config.settings import INITIAL_CREDITS
+from src.database.db_manager import GameDatabase
+from src.database.user_cache import UserRecord
+
+
+class ConnectPerCallDatabase(GameDatabase):
+    """The previous behaviour: every method opens and closes its own connection."""
+
+    async def get_user(self, user_id: int, username: str = None):
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)) as cursor:
+                user = await cursor.fetchone()
+            if user is None:
+                await db.execute(
+                    'INSERT INTO users (user_id, username, credits) VALUES (?, ?, ?)',
+                    (user_id, username, INITIAL_CREDITS)
+                )
+                await db.commit()
+                return UserRecord(user_id, username, INITIAL_CREDITS)
+            return UserRecord.from_row(user)
+
+    async def update_credits(self, user_id: int, new_credits: int):
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute('UPDATE users SET credits = ? WHERE user_id = ?', (new_credits, user_id))
+            await db.commit()
+
+    async def record_game(self, user_id, category, bet_amount, guessed_number,
+                          winning_number, won, payout):
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute('''
+                INSERT INTO game_history
+                (user_id, category, bet_amount, guessed_number, winning_number, won, payout)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, category, bet_amount, guessed_number, winning_number, won, payout))
+            await db.execute('''
+                UPDATE users SET games_played = games_played + 1,
+                    games_won = games_won + ?, total_wagered = total_wagered + ?,
+                    total_winnings = total_winnings + ?
+                WHERE user_id = ?
+            ''', (1 if won else 0, bet_amount, payout, user_id))
+            await db.commit()
+
+
+async def run_workload(db, ops: int, users: int, seed: int):
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    for _ in range(ops // 3):
+        user_id = rng.randrange(users)
+        user = await db.get_user(user_id, f"user{user_id}")
+        await db.update_credits(user_id, user.credits - 10)
+        await db.record_game(user_id, 'easy', 10, 5, rng.randint(1, 10), False, 0)
+    return (ops // 3) * 3 / (time.perf_counter() - start)
+
+
+async def bench(label, cls, ops, users, seed):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = cls(os.path.join(tmp, 'bench.db'))
+        await db.init_db()
+        rate = await run_workload(db, ops, users, seed)
+        await db.close()
+    print(f"{label:<20} {rate:>10.0f} ops/sec")
+    return rate
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ops', type=int, default=3000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    before = await bench('connect-per-call', ConnectPerCallDatabase, args.ops, args.users, args.seed)
+    after = await bench('persistent', GameDatabase, args.ops, args.users, args.seed)
+    print(f"speedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+"""
+Benchmark: update latency with webhook ingress vs. long polling.
+
+Runs a real TelegramGameBot against the in-process Bot API stand-in and
+measures, for each update, the time from Telegram having the update to the
+bot's reply arriving back at Telegram. Updates arrive open-loop at --rate
+per second. In webhook mode a local HTTP client plays Telegram and POSTs
+updates to the webhook server. --rtt-ms adds a simulated network round
+trip to every hop.
+
+    python benchmarks/bench_ingress.py --updates 200 --rate 10 --rtt-ms 40
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fake_telegram import FakeTelegramRequest, command_update
+from src.bot.telegram_bot import TelegramGameBot
+
+SECRET = 'bench-secret'
+
+
+async def post_update(port, path, data):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(data).encode()
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"X-Telegram-Bot-Api-Secret-Token: {SECRET}\r\nConnection: close\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    status = await reader.readline()
+    writer.close()
+    return int(status.split()[1])
+
+
+async def run(mode, updates, rate, rtt, tmp):
+    request = FakeTelegramRequest(latency=rtt / 2)
+    bot = TelegramGameBot(os.path.join(tmp, f"{mode}.db"), mode='external',
+                          request=request, get_updates_request=request, metrics_port=0)
+    replies = {}
+    request.on_send = lambda method, params: replies[params['chat_id']].set_result(time.perf_counter())
+
+    await bot.start_bot()
+    if mode == 'webhook':
+        await bot.start_webhook(url='', secret_token=SECRET, port=0)
+    else:
+        await bot.application.updater.start_polling(poll_interval=0, timeout=10)
+
+    async def deliver(user_id):
+        data = command_update(user_id, '/balance')
+        start = time.perf_counter()
+        if mode == 'webhook':
+            await asyncio.sleep(rtt / 2)  # Telegram -> bot
+            assert await post_update(bot.webhook.port, bot.webhook.path, data) == 200
+        else:
+            request.pending_updates.put_nowait(data)
+        return await replies[user_id] - start
+
+    # Open-loop arrivals, so updates also land while a getUpdates call is in flight
+    rng = random.Random(1)
+    loop = asyncio.get_running_loop()
+    tasks = []
+    for user_id in range(1, updates + 1):
+        replies[user_id] = loop.create_future()
+        tasks.append(asyncio.create_task(deliver(user_id)))
+        await asyncio.sleep(rng.expovariate(rate))
+    latencies = await asyncio.gather(*tasks)
+
+    await bot.stop_bot()
+    return latencies
+
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    print(f"{label:<8} mean {statistics.mean(latencies) * 1000:7.2f} ms  "
+          f"p50 {p(0.50):7.2f} ms  p95 {p(0.95):7.2f} ms  p99 {p(0.99):7.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--updates', type=int, default=300)
+    parser.add_argument('--rate', type=float, default=10.0, help="updates per second")
+    parser.add_argument('--rtt-ms', type=float, default=40.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ('polling', 'webhook'):
+            report(mode, await run(mode, args.updates, args.rate, args.rtt_ms / 1000, tmp))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
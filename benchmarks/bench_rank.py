@@ -0,0 +1,94 @@
+"""
+Benchmark: /rank via the in-memory order-statistic index vs. SQL COUNT(*).
+
+Fills a users table with synthetic balances, then times rank lookups both
+ways, plus building the index at startup and applying balance changes.
+
+    python benchmarks/bench_rank.py --users 1000000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.database.db_manager import GameDatabase
+
+
+def populate(path, users, seed):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE users (
+            user_id INTEGER PRIMARY KEY, username TEXT, credits INTEGER,
+            games_played INTEGER DEFAULT 0, games_won INTEGER DEFAULT 0,
+            total_wagered INTEGER DEFAULT 0, total_winnings INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Most players sit near the starting balance, with a long tail of winners
+    rows = ((i, f"user{i}", int(rng.lognormvariate(9.2, 1.0))) for i in range(users))
+    conn.executemany('INSERT INTO users (user_id, username, credits) VALUES (?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+
+def time_per_call(fn, args):
+    start = time.perf_counter()
+    for arg in args:
+        fn(arg)
+    return (time.perf_counter() - start) / len(args)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        start = time.perf_counter()
+        populate(path, args.users, args.seed)
+        print(f"populated {args.users} users in {time.perf_counter() - start:.1f}s")
+
+        db = GameDatabase(path)
+        start = time.perf_counter()
+        await db.init_db()  # creates the credits index and builds the rank index
+        print(f"init_db incl. index builds: {time.perf_counter() - start:.2f}s")
+
+        rng = random.Random(args.seed + 1)
+        probes = [int(rng.lognormvariate(9.2, 1.0)) for _ in range(args.queries)]
+
+        conn = sqlite3.connect(path)
+        sql_count = 'SELECT COUNT(*) FROM users WHERE credits > ?'
+        sql = time_per_call(lambda c: conn.execute(sql_count, (c,)).fetchone(), probes)
+        conn.execute('DROP INDEX idx_users_leaderboard')
+        sql_scan = time_per_call(lambda c: conn.execute(sql_count, (c,)).fetchone(), probes[:20])
+        conn.close()
+
+        index = db.rank_index
+        fenwick = time_per_call(index.rank, probes * 50)
+        moves = [(c, c + rng.randint(-500, 500)) for c in probes * 50]
+        update = time_per_call(lambda m: index.move(*m), moves)
+
+        for credits in probes[:20]:
+            assert index.rank(credits) >= 1
+        await db.close()
+
+    print(f"SQL COUNT(*), full scan:    {sql_scan * 1e6:>12.1f} us/query")
+    print(f"SQL COUNT(*), credits index:{sql * 1e6:>12.1f} us/query")
+    print(f"rank index lookup:          {fenwick * 1e6:>12.1f} us/query")
+    print(f"rank index balance update:  {update * 1e6:>12.1f} us/update")
+    print(f"speedup vs indexed SQL: {sql / fenwick:.0f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+"""
+Benchmark: settlement latency under concurrent analytics reads, with and without the reader pool.
+
+Runs settle_game calls for random users while other tasks keep reading
+uncached leaderboard pages, per-category stats and history pages, against
+a database of synthetic users and games. Reports settlement latency
+percentiles and read throughput for each reader pool size; with size 0
+every read shares the writer connection's thread, as before the pool.
+Category stats and history wait for the user's pending history rows, which
+the writer flushes between settlements. More reader threads than cores
+slow the writer down.
+
+    python benchmarks/bench_read_pool.py --users 100000 --games 500000 --pool-sizes 0 4
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.database.db_manager import GameDatabase
+
+CATEGORIES = ('easy', 'medium', 'hard')
+
+
+async def create(path, users, games, seed):
+    """Users and games on the current schema, with their category rollups."""
+    database = GameDatabase(path, read_pool_size=0)
+    await database.init_db()
+    rng = random.Random(seed)
+    db = database._conn
+    await db.executemany('INSERT INTO users (user_id, username, credits) VALUES (?, ?, ?)',
+                         [(i, f"user{i}", int(rng.lognormvariate(9.2, 1.0)) + 1000000)
+                          for i in range(1, users + 1)])
+    await db.executemany(
+        'INSERT INTO game_history (user_id, category, bet_amount, guessed_number, winning_number, won, payout) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(rng.randint(1, users), rng.choice(CATEGORIES), 100, 3, 4, 0, 0) for _ in range(games)]
+    )
+    await db.execute('''
+        INSERT INTO user_category_stats (user_id, category, games, wins, wagered, payout)
+        SELECT user_id, category, COUNT(*), SUM(won), SUM(bet_amount), SUM(payout)
+        FROM game_history GROUP BY user_id, category
+    ''')
+    await db.commit()
+    await database.close()
+
+
+async def run(path, pool_size, args):
+    database = GameDatabase(path, read_pool_size=pool_size)
+    await database.init_db()
+    rng = random.Random(args.seed)
+    latencies = []
+    reads = 0
+    deadline = time.perf_counter() + args.seconds
+
+    async def settle():
+        while time.perf_counter() < deadline:
+            user_id = rng.randint(1, args.users)
+            start = time.perf_counter()
+            await database.settle_game(user_id, 'easy', 10, 3, 4, False, 0)
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(args.settle_interval_ms / 1000)
+
+    async def analytics():
+        nonlocal reads
+        while time.perf_counter() < deadline:
+            user_id = rng.randint(1, args.users)
+            # User records are cached after the first read; drop them to keep reads going to SQLite
+            database.user_cache.invalidate(user_id)
+            await database.get_leaderboard(args.leaderboard_limit)
+            await database.get_category_stats(user_id)
+            await database.get_history(user_id)
+            await database.get_user_stats(user_id)
+            reads += 4
+
+    await asyncio.gather(*(settle() for _ in range(args.settlers)), *(analytics() for _ in range(args.readers)))
+    await database.close()
+    latencies.sort()
+    return latencies, reads
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--games', type=int, default=500000)
+    parser.add_argument('--pool-sizes', type=int, nargs='+', default=[0, 4])
+    parser.add_argument('--readers', type=int, default=8, help="tasks reading in a loop")
+    parser.add_argument('--settlers', type=int, default=4, help="tasks settling games")
+    parser.add_argument('--settle-interval-ms', type=float, default=5)
+    parser.add_argument('--leaderboard-limit', type=int, default=2000, help="beyond the cached top")
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, 'template.db')
+        await create(template, args.users, args.games, args.seed)
+        print(f"{args.users} users, {args.games} games, {args.readers} readers, {args.settlers} settlers, "
+              f"{args.seconds:g}s per run")
+        for pool_size in args.pool_sizes:
+            path = os.path.join(tmp, f'pool{pool_size}.db')
+            shutil.copy(template, path)
+            latencies, reads = await run(path, pool_size, args)
+            print(f"reader pool {pool_size}:  settle_game {len(latencies)}x  "
+                  f"p50 {percentile(latencies, 0.5):7.2f} ms  p99 {percentile(latencies, 0.99):7.2f} ms  "
+                  f"max {latencies[-1] * 1000:7.2f} ms   reads {reads / args.seconds:7.0f}/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+"""
+Micro-benchmark: per-update message rendering, string building vs. MessageRenderer.
+
+Renders the texts and keyboards of one pass through the game flow (category
+list, bet selection, game started, result) the way the handlers used to,
+and through the precompiled templates, and checks both produce the same output.
+
+    python benchmarks/bench_render.py --iterations 20000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from src.bot.rendering import MessageRenderer
+from src.config.settings import CATEGORIES
+from src.game.game_logic import NumberGuessingGame
+
+
+def legacy_flow(game, category, credits, bet_amount, result):
+    """The handlers' previous rendering code, one update at a time."""
+    out = []
+
+    keyboard = []
+    for category_id, info in CATEGORIES.items():
+        button_text = f"{info['emoji']} {info['name']} ({info['multiplier']}x)"
+        keyboard.append([InlineKeyboardButton(button_text, callback_data=f"category_{category_id}")])
+    message = f"🎮 **Choose Your Game Category**\n\n"
+    message += f"💳 **Your Credits:** {credits}\n\n"
+    message += "Select a category to start playing:"
+    out.append((message, InlineKeyboardMarkup(keyboard)))
+
+    info = CATEGORIES[category]
+    keyboard = []
+    for bet in [10, 25, 50, 100]:
+        if bet <= credits:
+            keyboard.append([InlineKeyboardButton(f"{bet} credits", callback_data=f"bet_{category}_{bet}")])
+    keyboard.append([InlineKeyboardButton("💭 Custom Amount", callback_data=f"custom_bet_{category}")])
+    message = f"🎯 **{info['emoji']} {info['name']} Selected**\n\n"
+    message += f"📊 **Range:** {info['range'][0]}-{info['range'][1]}\n"
+    message += f"💎 **Win Multiplier:** {info['multiplier']}x\n"
+    message += f"💰 **Your Credits:** {credits}\n\n"
+    message += "Choose your bet amount:"
+    out.append((message, InlineKeyboardMarkup(keyboard)))
+
+    min_num, max_num = info['range']
+    message = f"🎮 **Game Started!**\n\n"
+    message += f"🎯 **Category:** {info['emoji']} {info['name']}\n"
+    message += f"💰 **Bet Amount:** {bet_amount} credits\n"
+    message += f"🎲 **Multiplier:** {info['multiplier']}x\n\n"
+    message += f"🔢 **Choose a number between {min_num} and {max_num}:**\n"
+    message += "Type your guess in the chat!"
+    out.append((message, None))
+
+    keyboard = [[InlineKeyboardButton(f"🎯 Play Again ({info['emoji']} {info['name']})",
+                                      callback_data=f"play_again_{category}")]]
+    out.append((game.format_game_result(result), InlineKeyboardMarkup(keyboard)))
+    return out
+
+
+def renderer_flow(renderer, category, credits, bet_amount, result):
+    return [
+        (renderer.choose_category(credits), renderer.category_keyboard),
+        renderer.category_selected(category, credits),
+        (renderer.game_started(category, bet_amount), None),
+        renderer.game_result(result),
+    ]
+
+
+def make_inputs(count, seed):
+    rng = random.Random(seed)
+    inputs = []
+    for _ in range(count):
+        category = rng.choice(list(CATEGORIES))
+        credits = rng.choice([5, 30, 80, 10000, rng.randrange(1, 50000)])
+        bet_amount = rng.randint(1, 100)
+        low, high = CATEGORIES[category]['range']
+        guess, winning = rng.randint(low, high), rng.randint(low, high)
+        won = rng.random() < 0.3
+        result = {
+            'won': won, 'guess': guess, 'winning_number': guess if won else winning,
+            'bet_amount': bet_amount, 'payout': bet_amount * CATEGORIES[category]['multiplier'] if won else 0,
+            'category': category, 'new_credits': credits, 'category_info': CATEGORIES[category],
+        }
+        inputs.append((category, credits, bet_amount, result))
+    return inputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    game = NumberGuessingGame(database=None)
+    renderer = MessageRenderer(game)
+    inputs = make_inputs(args.iterations, args.seed)
+
+    for item in inputs[:500]:
+        assert legacy_flow(game, *item) == renderer_flow(renderer, *item)
+
+    timings = {}
+    for label, flow, target in (('string building', legacy_flow, game),
+                                ('precompiled', renderer_flow, renderer)):
+        start = time.perf_counter()
+        for item in inputs:
+            flow(target, *item)
+        timings[label] = (time.perf_counter() - start) / args.iterations
+        # Each flow renders four messages, i.e. four updates
+        print(f"{label:<16} {timings[label] / 4 * 1e6:>8.2f} us per update")
+
+    print(f"speedup: {timings['string building'] / timings['precompiled']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
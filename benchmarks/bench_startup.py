@@ -0,0 +1,125 @@
+"""
+Benchmark: bot cold start, first boot after an upgrade vs. a routine restart.
+
+Measures importing the bot module in a fresh interpreter, then times the
+phases of start_bot() against a database of synthetic users and games with
+an unversioned schema: once as the first boot, which runs every migration
+and sets the command menu, and once as a restart, which should do neither
+and loads its indexes from the warm-restart snapshot the first run left.
+Bot API calls go to an in-process fake with a simulated round trip.
+
+    python benchmarks/bench_startup.py --users 100000 --games 200000 --rtt-ms 100
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import src.bot.telegram_bot; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def measure_import(repeat):
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout
+        timings.append(float(output.split()[-1]))
+    return statistics.median(timings)
+
+
+def populate(path, users, games, seed):
+    """A database as the bot created it before schema versioning."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE users (
+            user_id INTEGER PRIMARY KEY, username TEXT, credits INTEGER DEFAULT 10000,
+            games_played INTEGER DEFAULT 0, games_won INTEGER DEFAULT 0,
+            total_wagered INTEGER DEFAULT 0, total_winnings INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE game_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, category TEXT,
+            bet_amount INTEGER, guessed_number INTEGER, winning_number INTEGER,
+            won BOOLEAN, payout INTEGER, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.executemany('INSERT INTO users (user_id, username, credits) VALUES (?, ?, ?)',
+                     ((i, f"user{i}", int(rng.lognormvariate(9.2, 1.0))) for i in range(1, users + 1)))
+    conn.executemany(
+        'INSERT INTO game_history (user_id, category, bet_amount, guessed_number, winning_number, won, payout) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        ((rng.randint(1, users), 'easy', 100, 3, 4, 0, 0) for _ in range(games))
+    )
+    conn.commit()
+    conn.close()
+
+
+def timed(phases, name, func):
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            phases[name] = time.perf_counter() - start
+    return wrapper
+
+
+async def boot(path, rtt):
+    from fake_telegram import FakeTelegramRequest
+    from src.bot.telegram_bot import TelegramGameBot
+
+    request = FakeTelegramRequest(latency=rtt / 2)
+    bot = TelegramGameBot(path, mode='external', request=request, get_updates_request=request, metrics_port=0)
+    phases = {}
+    bot.db.init_db = timed(phases, 'init_db', bot.db.init_db)
+    bot.application.initialize = timed(phases, 'initialize (getMe)', bot.application.initialize)
+    bot.setup_bot_commands = timed(phases, 'setup_bot_commands', bot.setup_bot_commands)
+    start = time.perf_counter()
+    await bot.start_bot()
+    phases['start_bot total'] = time.perf_counter() - start
+    await bot.stop_bot()
+    return phases, dict(request.calls)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--games', type=int, default=200000)
+    parser.add_argument('--rtt-ms', type=float, default=100, help="simulated Bot API round trip")
+    parser.add_argument('--repeat', type=int, default=5, help="fresh-interpreter import measurements")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"import src.bot.telegram_bot: {measure_import(args.repeat) * 1000:.0f} ms (median of {args.repeat})")
+
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'startup.db')
+        populate(path, args.users, args.games, args.seed)
+        print(f"{args.users} users, {args.games} games, {args.rtt_ms:g} ms Bot API round trip")
+        for label in ('first boot', 'restart'):
+            phases, calls = await boot(path, args.rtt_ms / 1000)
+            timings = ', '.join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in phases.items())
+            print(f"{label:<10}  {timings}  API calls {calls}")
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(__file__))
+    asyncio.run(main())
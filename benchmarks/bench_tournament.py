@@ -0,0 +1,79 @@
+"""
+Benchmark: a shared-draw tournament round with tens of thousands of entrants.
+
+Every simulated user enters one round with a random category, bet and
+guess; the round is then closed and settled in one transaction. Reports
+entry throughput and settlement time, and checks that the balances and the
+game_history rows add up.
+
+    python benchmarks/bench_tournament.py --entrants 50000
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.config.settings import CATEGORIES, INITIAL_CREDITS
+from src.database.db_manager import GameDatabase
+from src.game.tournament import TournamentManager
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entrants', type=int, default=50000)
+    parser.add_argument('--concurrency', type=int, default=500, help="entries in flight at once")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = GameDatabase(os.path.join(tmp, 'tournament.db'))
+        await db.init_db()
+        notified = []
+
+        async def notify(round_, results):
+            notified.extend(results)
+
+        manager = TournamentManager(db, notify=notify, window=3600)
+        slots = asyncio.Semaphore(args.concurrency)
+
+        async def enter(user_id):
+            category = rng.choice(list(CATEGORIES))
+            low, high = CATEGORIES[category]['range']
+            async with slots:
+                round_, _ = await manager.enter(user_id, f"player{user_id}", category,
+                                                rng.choice((10, 25, 50, 100)), rng.randint(low, high))
+            assert round_ is not None
+
+        start = time.perf_counter()
+        await asyncio.gather(*(enter(user_id) for user_id in range(1, args.entrants + 1)))
+        entering = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await manager.stop()
+        settling = time.perf_counter() - start
+
+        async with db._conn.execute('SELECT SUM(credits), SUM(games_played) FROM users') as cursor:
+            total_credits, games_played = await cursor.fetchone()
+        async with db._conn.execute('SELECT COUNT(*), SUM(payout - bet_amount) FROM game_history') as cursor:
+            history_rows, net = await cursor.fetchone()
+        await db.close()
+
+    assert games_played == history_rows == len(notified) == args.entrants
+    assert total_credits == args.entrants * INITIAL_CREDITS + net
+    winners = sum(1 for game, _ in notified if game[5])
+
+    print(f"{args.entrants} entries in {entering:.2f}s -> {args.entrants / entering:.0f} entries/s")
+    print(f"settled {args.entrants} bets ({winners} winners) in {settling * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
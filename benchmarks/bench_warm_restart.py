@@ -0,0 +1,111 @@
+"""
+Benchmark: writing and loading the warm-restart snapshot.
+
+Fills a memory session store, the user cache and the rank index with
+synthetic entries, then times write_snapshot() and load_snapshot() plus
+restoring into fresh stores, as stop_bot() and start_bot() do. Also
+times lookups served from the mapped snapshot against ordinary cache hits,
+and checks every restored session and record against the original.
+
+    python benchmarks/bench_warm_restart.py --sessions 1000000 --users 100000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.bot.snapshot import load_snapshot, write_snapshot
+from src.database.db_manager import GameDatabase
+from src.database.user_cache import UserCache, UserRecord
+from src.game.session_store import MemorySessionStore
+
+STAGES = ('waiting_for_guess', 'waiting_for_custom_bet')
+CATEGORIES = ('easy', 'medium', 'hard')
+
+
+def populate(database, sessions, session_count, user_count, seed):
+    rng = random.Random(seed)
+    user_ids = rng.sample(range(1, 50 * max(session_count, user_count)), max(session_count, user_count))
+    for user_id in user_ids[:session_count]:
+        stage = rng.choice(STAGES)
+        bet = rng.randint(1, 5000) if stage == 'waiting_for_guess' else None
+        sessions._put(user_id, stage, rng.choice(CATEGORIES), bet)
+    for user_id in user_ids[:user_count]:
+        username = f"user{user_id}" if rng.random() < 0.8 else None
+        database.user_cache.put(UserRecord(user_id, username, int(rng.lognormvariate(9.2, 1.0)),
+                                           rng.randint(0, 500), rng.randint(0, 100)))
+    database.rank_index.build(record.credits for record in database.user_cache.export()[1])
+    return user_ids
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<32} {(time.perf_counter() - start) * 1000:8.1f} ms")
+    return result
+
+
+async def check(user_ids, sessions, restored_sessions, cache, restored_cache):
+    for user_id in user_ids:
+        before, after = await sessions.get(user_id), await restored_sessions.get(user_id)
+        if before is not None:
+            assert (before.stage, before.category, before.bet_amount) == \
+                (after.stage, after.category, after.bet_amount)
+            assert abs(before.expires_at - after.expires_at) < 1.0
+        before, after = cache.peek(user_id), restored_cache.get(user_id)
+        if before is not None:
+            assert (before.username, before.stats()) == (after.username, after.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=100000, help="cached user records (default: USER_CACHE_SIZE)")
+    parser.add_argument('--lookups', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'warm.db')
+        sqlite3.connect(db_path).close()
+        path = db_path + '.warm'
+
+        database = GameDatabase(db_path)
+        database.user_cache = UserCache(max_size=args.users)
+        sessions = MemorySessionStore(max_sessions=args.sessions)
+        user_ids = timed("populate", populate, database, sessions, args.sessions, args.users, args.seed)
+        print(f"{args.sessions} sessions, {args.users} cached users, {database.rank_index.total} ranked balances")
+
+        size = timed("write_snapshot", write_snapshot, path, database, sessions)
+        print(f"{'snapshot size':<32} {size / 1e6:8.1f} MB")
+
+        restored = GameDatabase(db_path)
+        restored.user_cache = UserCache(max_size=args.users)
+        restored_sessions = MemorySessionStore(max_sessions=args.sessions)
+
+        def load():
+            warm = load_snapshot(path, db_path)
+            warm.restore_rank_index(restored.rank_index)
+            warm.restore_user_cache(restored.user_cache)
+            warm.restore_sessions(restored_sessions)
+            return warm
+
+        timed("load_snapshot + restore", load)
+        assert restored.rank_index.total == database.rank_index.total
+
+        sample = random.Random(args.seed + 1).sample(user_ids[:args.users], min(args.lookups, args.users))
+        timed(f"{len(sample)} first lookups (snapshot)", lambda: [restored.user_cache.get(u) for u in sample])
+        timed(f"{len(sample)} repeat lookups (cache)", lambda: [restored.user_cache.get(u) for u in sample])
+        asyncio.run(check(user_ids, sessions, restored_sessions, database.user_cache, restored.user_cache))
+        print("restored sessions and records match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+In-process stand-in for the Telegram Bot API, used by the benchmarks.
+
+FakeTelegramRequest plugs into python-telegram-bot as the request layer, so
+a real TelegramGameBot runs end to end without touching the network. It
+answers the API methods the bot uses, serves getUpdates from an in-memory
+queue with long-polling semantics, and can add a simulated one-way network
+delay to every call.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+
+from telegram.request import BaseRequest
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+
+class FakeTelegramRequest(BaseRequest):
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.pending_updates = asyncio.Queue()
+        self.calls = Counter()
+        self.on_send = None  # callback(method, params) when a message send arrives
+        self._message_ids = itertools.count(1000)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        if self.latency:
+            await asyncio.sleep(self.latency)  # request travelling to Telegram
+        self.calls[api_method] += 1
+        result = await self._answer(api_method, params)
+        if self.latency:
+            await asyncio.sleep(self.latency)  # response travelling back
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+    async def _answer(self, api_method, params):
+        if api_method == 'getMe':
+            return BOT_USER
+        if api_method == 'getUpdates':
+            return await self._get_updates(params.get('timeout') or 0)
+        if api_method in ('sendMessage', 'editMessageText'):
+            if self.on_send is not None:
+                self.on_send(api_method, params)
+            message_id = params.get('message_id') or next(self._message_ids)
+            return {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': params.get('chat_id'), 'type': 'private'},
+                'from': BOT_USER,
+                'text': params.get('text', ''),
+            }
+        return True
+
+    async def _get_updates(self, timeout):
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(self.pending_updates.get(), timeout))
+        except asyncio.TimeoutError:
+            return updates
+        while not self.pending_updates.empty():
+            updates.append(self.pending_updates.get_nowait())
+        return updates
+
+
+_update_ids = itertools.count(1)
+
+
+def _user(user_id):
+    return {'id': user_id, 'is_bot': False, 'first_name': f"Player{user_id}", 'username': f"player{user_id}"}
+
+
+def _message(user_id, text, message_id):
+    return {
+        'message_id': message_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': _user(user_id),
+        'text': text,
+    }
+
+
+def command_update(user_id, command):
+    """An update carrying a /command message from a private chat."""
+    message = _message(user_id, command, next(_update_ids))
+    message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command.split()[0])}]
+    return {'update_id': next(_update_ids), 'message': message}
+
+
+def text_update(user_id, text):
+    """An update carrying a plain text message from a private chat."""
+    return {'update_id': next(_update_ids), 'message': _message(user_id, text, next(_update_ids))}
+
+
+def callback_update(user_id, data, message_id=1):
+    """An update carrying an inline button press on one of the bot's messages."""
+    message = _message(user_id, '', message_id)
+    message['from'] = BOT_USER
+    return {
+        'update_id': next(_update_ids),
+        'callback_query': {
+            'id': str(next(_update_ids)),
+            'from': _user(user_id),
+            'chat_instance': str(user_id),
+            'message': message,
+            'data': data,
+        },
+    }
@@ -0,0 +1,334 @@
+"""
+End-to-end load test: synthetic users playing through a real TelegramGameBot.
+
+Every simulated user sends /start, picks a category and a bet with the
+inline buttons, types a guess, and then plays further rounds through the
+Play Again button. Updates go through the application's update processor
+into Application.process_update, exactly as polled updates would, while the
+Bot API is replaced by the in-process stand-in, so nothing touches the
+network. Reports throughput, end-to-end and handler latency percentiles,
+SQL statements per update and peak RSS.
+
+With --shards N, the updates go through a sharded deployment instead (see
+src/bot/sharding.py): a ShardDispatcher polls them from the stand-in and
+routes them over the pipes to N shard worker processes sharing one
+database. Each worker reports every handled update back over a Unix
+socket, so end-to-end latency includes polling, routing and the pipe
+transport; handler latency and the other counters are combined over the
+workers, and peak RSS is summed over all processes.
+
+    python benchmarks/load_test.py --users 2000 --rounds 3
+    python benchmarks/load_test.py --users 8000 --shards 4
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+from fake_telegram import FakeTelegramRequest, callback_update, command_update, text_update
+from src.bot.sharding import ShardDispatcher, run_worker
+from src.bot.telegram_bot import TelegramGameBot
+from src.config.settings import CATEGORIES
+from src.monitoring.instruments import DB_QUERY_LATENCY
+
+
+class LoadTest:
+    def __init__(self, bot, rounds, seed):
+        self.bot = bot
+        self.application = bot.application
+        self.rounds = rounds
+        self.rng = random.Random(seed)
+        self.latencies = []  # update handed to the processor -> fully handled
+        self.handler_latencies = []  # time spent inside process_update
+        self._statement_counts = []
+
+    @property
+    def statements(self):
+        return sum(count[0] for count in self._statement_counts)
+
+    async def count_statements(self, database):
+        """Count the statements run on the writer and every reader connection."""
+        for connection in (database._conn, *database.readers.connections):
+            # Each callback runs on its connection's own thread, so each gets its own counter
+            count = [0]
+
+            def trace(statement, count=count):
+                count[0] += 1
+            self._statement_counts.append(count)
+            await connection.set_trace_callback(trace)
+
+    async def send(self, data):
+        update = Update.de_json(data, self.application.bot)
+        start = time.perf_counter()
+        await self.application.update_processor.process_update(update, self._handle(update))
+        self.latencies.append(time.perf_counter() - start)
+
+    async def _handle(self, update):
+        start = time.perf_counter()
+        await self.application.process_update(update)
+        self.handler_latencies.append(time.perf_counter() - start)
+
+    async def play(self, user_id):
+        category = self.rng.choice(list(CATEGORIES))
+        low, high = CATEGORIES[category]['range']
+
+        await self.send(command_update(user_id, '/start'))
+        await self.send(callback_update(user_id, 'start_play'))
+        await self.send(callback_update(user_id, f"category_{category}"))
+        for round_number in range(self.rounds):
+            if round_number:
+                await self.send(callback_update(user_id, f"play_again_{category}"))
+            await self.send(callback_update(user_id, f"bet_{category}_10"))
+            await self.send(text_update(user_id, str(self.rng.randint(low, high))))
+
+
+class ShardedLoadTest(LoadTest):
+    """Plays through a ShardDispatcher: updates are polled from the stand-in and handled by the workers."""
+
+    def __init__(self, dispatcher, request, rounds, seed):
+        super().__init__(dispatcher, rounds, seed)
+        self.request = request
+        self.handled = {}  # update_id -> future resolved when a worker reports it handled
+
+    async def send(self, data):
+        handled = self.handled[data['update_id']] = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        self.request.pending_updates.put_nowait(data)
+        await handled
+        self.latencies.append(time.perf_counter() - start)
+
+
+class ShardWorkerBot(TelegramGameBot):
+    """A shard worker's bot that reports each handled update to the load test over `report`."""
+
+    def __init__(self, *args, report, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.report = report
+        self.test = LoadTest(self, 0, 0)
+        self._started = {}
+        # Around the bot's own handlers, which are all in group 0
+        self.application.add_handler(TypeHandler(Update, self._begin), group=-1)
+        self.application.add_handler(TypeHandler(Update, self._end), group=1)
+
+    async def start_bot(self):
+        await super().start_bot()
+        await self.test.count_statements(self.db)
+
+    async def _begin(self, update, context):
+        self._started[update.update_id] = time.perf_counter()
+
+    async def _end(self, update, context):
+        self.test.handler_latencies.append(time.perf_counter() - self._started.pop(update.update_id))
+        self.report.write(f"{update.update_id}\n".encode())
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+
+def bot_results(bot, request, test):
+    """The counters of one bot process."""
+    return {
+        'handler_latencies': test.handler_latencies,
+        'statements': test.statements,
+        'bot_api_calls': dict(request.calls),
+        'outbox': bot.outbox.stats(),
+        'db_query': {values[0]: (child.count, child.sum)
+                     for values, child in DB_QUERY_LATENCY._children.items() if child.count},
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+async def play_all(test, args):
+    """Play every user, `args.concurrency` at a time. Returns the elapsed seconds."""
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def user(user_id):
+        async with slots:
+            await test.play(user_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(user_id) for user_id in range(1, args.users + 1)))
+    return time.perf_counter() - start
+
+
+async def run(args, db_path):
+    """Play every user through one bot. Returns the raw results."""
+    request = FakeTelegramRequest(latency=args.latency_ms / 1000)
+    bot = TelegramGameBot(db_path, mode='external', request=request, get_updates_request=request, metrics_port=0)
+    if not args.telegram_limits:
+        bot.outbox.global_rate = bot.outbox.chat_rate = 0
+    await bot.start_bot()
+    test = LoadTest(bot, args.rounds, args.seed)
+    await test.count_statements(bot.db)
+    elapsed = await play_all(test, args)
+    await bot.stop_bot()
+    return {'seconds': elapsed, 'latencies': test.latencies, **bot_results(bot, request, test)}
+
+
+async def run_sharded(args, db_path, tmp):
+    """Play every user through a ShardDispatcher and args.shards worker processes. Returns the raw results."""
+    request = FakeTelegramRequest()
+    dispatcher = ShardDispatcher(args.shards, db_path, mode='polling', request=request,
+                                 get_updates_request=request, metrics_port=0)
+    test = ShardedLoadTest(dispatcher, request, args.rounds, args.seed)
+    parts = []
+    connected = asyncio.Semaphore(0)
+    disconnected = asyncio.Semaphore(0)
+
+    async def worker_reports(reader, writer):
+        # One connection per worker: a line per handled update, then its results
+        connected.release()
+        try:
+            while line := await reader.readline():
+                if line.startswith(b'{'):
+                    parts.append(json.loads(line))
+                else:
+                    test.handled.pop(int(line)).set_result(None)
+        finally:
+            writer.close()
+            disconnected.release()
+
+    socket_path = os.path.join(tmp, 'reports.sock')
+    # The results line carries every handler latency of the worker
+    server = await asyncio.start_unix_server(worker_reports, socket_path, limit=64 * 1024 * 1024)
+    options = ['--latency-ms', str(args.latency_ms), '--report-socket', socket_path]
+    options += ['--telegram-limits'] * args.telegram_limits + ['--log'] * args.log
+    for worker in dispatcher.workers:
+        worker.command = [sys.executable, os.path.abspath(__file__), *options, '--shard-worker']
+
+    await dispatcher.start_bot()
+    # Start the clock once every worker's bot is up
+    for _ in dispatcher.workers:
+        await connected.acquire()
+    elapsed = await play_all(test, args)
+    await dispatcher.stop_bot()
+    for _ in dispatcher.workers:
+        await disconnected.acquire()
+    server.close()
+    await server.wait_closed()
+
+    combined = {
+        'seconds': elapsed,
+        'latencies': test.latencies,
+        'handler_latencies': [], 'statements': 0,
+        'bot_api_calls': dict(request.calls), 'outbox': {}, 'db_query': {},
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    for part in parts:
+        combined['handler_latencies'] += part['handler_latencies']
+        combined['statements'] += part['statements']
+        combined['peak_rss_mb'] += part['peak_rss_mb']
+        for key in ('bot_api_calls', 'outbox'):
+            for name, value in part[key].items():
+                combined[key][name] = combined[key].get(name, 0) + value
+        for name, (calls, total) in part['db_query'].items():
+            previous = combined['db_query'].get(name, (0, 0.0))
+            combined['db_query'][name] = (previous[0] + calls, previous[1] + total)
+    return combined
+
+
+async def shard_worker(args):
+    """Entry point of a worker process started by run_sharded's dispatcher."""
+    index, count, db_path = int(args.shard_worker[0]), int(args.shard_worker[1]), args.shard_worker[2]
+    _, report = await asyncio.open_unix_connection(args.report_socket)
+    request = FakeTelegramRequest(latency=args.latency_ms / 1000)
+    bot = ShardWorkerBot(db_path, mode='external', request=request, get_updates_request=request,
+                         metrics_port=0, shard=(index, count), report=report)
+    if not args.telegram_limits:
+        bot.outbox.global_rate = bot.outbox.chat_rate = 0
+    await run_worker(index, count, db_path, bot=bot)
+    report.write(json.dumps(bot_results(bot, request, bot.test)).encode() + b'\n')
+    report.close()
+    await report.wait_closed()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=3, help="games per user")
+    parser.add_argument('--concurrency', type=int, default=500, help="users playing at once, over all shards")
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                        help="simulated one-way Bot API latency")
+    parser.add_argument('--shards', type=int, default=0,
+                        help="route the updates through a dispatcher to this many shard worker processes")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--telegram-limits', action='store_true',
+                        help="keep the outbound send rate limits (draining then takes minutes)")
+    parser.add_argument('--json', help="also write the results to this file")
+    parser.add_argument('--log', action='store_true', help="keep the bot's INFO logging on")
+    # Used by the dispatcher to start the worker processes of --shards
+    parser.add_argument('--report-socket', help=argparse.SUPPRESS)
+    parser.add_argument('--shard-worker', nargs=3, metavar=('INDEX', 'COUNT', 'DB_PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if not args.log:
+        logging.disable(logging.INFO)
+    if args.shard_worker:
+        asyncio.run(shard_worker(args))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'load.db')
+        if args.shards:
+            raw = asyncio.run(run_sharded(args, db_path, tmp))
+        else:
+            raw = asyncio.run(run(args, db_path))
+
+    elapsed = raw['seconds']
+    outbox = raw['outbox']
+    updates = len(raw['latencies'])
+    latencies = sorted(raw['latencies'])
+    handler = sorted(raw['handler_latencies'])
+    results = {
+        'users': args.users,
+        'shards': args.shards,
+        'updates': updates,
+        'seconds': round(elapsed, 3),
+        'updates_per_sec': round(updates / elapsed, 1),
+        'latency_ms': {q: round(percentile(latencies, p), 3)
+                       for q, p in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99))},
+        'handler_latency_ms': {q: round(percentile(handler, p), 3)
+                               for q, p in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99))},
+        'sql_statements_per_update': round(raw['statements'] / updates, 2),
+        'bot_api_calls': raw['bot_api_calls'],
+        'outbox': outbox,
+        'db_query_ms': {
+            query: {'calls': calls, 'mean': round(total / calls * 1000, 3)}
+            for query, (calls, total) in raw['db_query'].items()
+        },
+        'peak_rss_mb': round(raw['peak_rss_mb'], 1),
+    }
+
+    shards = f" over {args.shards} shards" if args.shards else ""
+    print(f"{updates} updates from {args.users} users{shards} in {elapsed:.2f}s "
+          f"-> {results['updates_per_sec']} updates/s")
+    for label, key in (('end-to-end', 'latency_ms'), ('handler', 'handler_latency_ms')):
+        q = results[key]
+        print(f"{label:<11} latency  p50 {q['p50']:8.2f} ms  p95 {q['p95']:8.2f} ms  p99 {q['p99']:8.2f} ms")
+    print(f"SQL statements per update: {results['sql_statements_per_update']}")
+    print(f"Bot API calls: {results['bot_api_calls']}")
+    print(f"outbox: {outbox}")
+    print("GameDatabase calls: " + ", ".join(
+        f"{query} {q['calls']}x {q['mean']:.2f} ms" for query, q in results['db_query_ms'].items()
+    ))
+    print(f"peak RSS: {results['peak_rss_mb']} MB")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -34,6 +34,9 @@ setup(
     ],
     python_requires=">=3.8",
     install_requires=requirements,
+    extras_require={
+        "simulation": ["numpy"],
+    },
     entry_points={
         "console_scripts": [
             "telegram-game-bot=src.bot.telegram_bot:main",
@@ -0,0 +1,408 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict, deque
+from datetime import timedelta
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+
+from ..config.settings import (
+    SEND_GLOBAL_RATE, SEND_GLOBAL_BURST, SEND_CHAT_RATE, SEND_CHAT_BURST,
+    SEND_MAX_IN_FLIGHT, SEND_QUEUE_SIZE
+)
+from ..monitoring.instruments import SEND_LATENCY, SEND_RESULTS
+
+logger = logging.getLogger(__name__)
+
+# Send priorities, lower goes first
+PRIORITY_ANSWER = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BULK = 2
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate` tokens per second."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until a token is available, 0 if one is available now."""
+        if now < self.updated:
+            # Paused by a flood-control response
+            return self.updated - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, until):
+        """Hand out no tokens before `until`, and a single one then."""
+        self.tokens = 1
+        self.updated = max(self.updated, until)
+
+    def full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class OutboundOp:
+    __slots__ = ('method', 'message_id', 'kwargs', 'priority', 'attempts')
+
+    def __init__(self, method, kwargs, priority, message_id=None):
+        self.method = method
+        self.kwargs = kwargs
+        self.priority = priority
+        self.message_id = message_id
+        self.attempts = 0
+
+    def content(self):
+        return self.kwargs.get('text'), self.kwargs.get('reply_markup')
+
+
+class ChatQueue:
+    """Pending sends of one chat, sent strictly in order, one at a time."""
+
+    __slots__ = ('key', 'ops', 'edits', 'sent', 'limited', 'bucket', 'scheduled', 'last_active')
+
+    SENT_HISTORY = 8
+
+    def __init__(self, key, limited, bucket, now):
+        self.key = key
+        self.ops = deque()
+        self.edits = {}  # message_id -> queued edit, for coalescing
+        self.sent = OrderedDict()  # message_id -> (text, reply_markup) last sent
+        self.limited = limited  # False for callback answers, which no bucket limits
+        self.bucket = bucket  # None when sends to this chat have no per-chat limit
+        self.scheduled = False  # waiting in the scheduler's heaps or being sent
+        self.last_active = now
+
+    def remember(self, message_id, content):
+        self.sent[message_id] = content
+        self.sent.move_to_end(message_id)
+        if len(self.sent) > self.SENT_HISTORY:
+            self.sent.popitem(last=False)
+
+
+class SendScheduler:
+    """Outbound queue for every message the bot sends.
+
+    Handlers enqueue sends and return; a background task sends them under a
+    global token bucket and a per-chat one, so bursts are smoothed out
+    instead of running into Telegram's flood limits. Sends within a chat
+    keep their order. Among chats that may send, the one whose next send has
+    the highest priority goes first. A queued edit of a message is replaced
+    by a newer edit of the same message, and edits that would not change
+    the message are dropped. Callback query answers are not messages: they
+    have their own per-chat lane outside both buckets. A rate of 0 disables
+    the corresponding limit.
+    """
+
+    MAX_ATTEMPTS = 3
+    CHAT_IDLE_SECONDS = 60
+
+    def __init__(self, bot, global_rate=SEND_GLOBAL_RATE, global_burst=SEND_GLOBAL_BURST,
+                 chat_rate=SEND_CHAT_RATE, chat_burst=SEND_CHAT_BURST,
+                 max_in_flight=SEND_MAX_IN_FLIGHT, queue_size=SEND_QUEUE_SIZE):
+        self.bot = bot
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._global = None
+        self._chats = OrderedDict()  # key -> ChatQueue, least recently used first
+        self._ready = []  # (priority, seq, chat)
+        self._delayed = []  # (ready_at, seq, chat)
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._capacity = asyncio.Semaphore(queue_size)
+        self._sending = asyncio.Semaphore(max_in_flight)
+        self._in_flight = set()
+        self._below = []  # (count, future) of wait_below() callers
+        self._task = None
+        self.pending = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.skipped = 0
+        self.retried = 0
+        self.failed = 0
+
+    def start(self):
+        """Start the background send task."""
+        if self._task is not None:
+            return
+        now = asyncio.get_running_loop().time()
+        if self.global_rate > 0:
+            self._global = TokenBucket(self.global_rate, self.global_burst, now)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Send everything still queued, then stop the send task."""
+        if self._task is None:
+            return
+        await self._idle.wait()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def send_message(self, chat_id, text, priority=PRIORITY_INTERACTIVE, **kwargs):
+        """Queue a sendMessage call."""
+        op = OutboundOp('send_message', dict(kwargs, chat_id=chat_id, text=text), priority)
+        await self._enqueue(chat_id, op)
+
+    async def edit_message_text(self, chat_id, message_id, text, priority=PRIORITY_INTERACTIVE, **kwargs):
+        """Queue an editMessageText call, replacing a queued edit of the same message."""
+        op = OutboundOp('edit_message_text',
+                        dict(kwargs, chat_id=chat_id, message_id=message_id, text=text),
+                        priority, message_id)
+        await self._enqueue(chat_id, op)
+
+    async def answer_callback_query(self, chat_id, callback_query_id, **kwargs):
+        """Queue an answerCallbackQuery call."""
+        op = OutboundOp('answer_callback_query',
+                        dict(kwargs, callback_query_id=callback_query_id), PRIORITY_ANSWER)
+        await self._enqueue(('answer', chat_id), op)
+
+    async def reply(self, message, text, **kwargs):
+        """Queue a message to the chat `message` came from."""
+        await self.send_message(message.chat_id, text, **kwargs)
+
+    async def edit(self, query, text, **kwargs):
+        """Queue an edit of the message a callback query's button belongs to."""
+        await self.edit_message_text(query.message.chat_id, query.message.message_id, text, **kwargs)
+
+    async def answer(self, query, **kwargs):
+        """Queue the answer to a callback query."""
+        chat_id = query.message.chat_id if query.message else query.from_user.id
+        await self.answer_callback_query(chat_id, query.id, **kwargs)
+
+    async def wait_below(self, count):
+        """Wait until fewer than `count` sends are queued or in flight."""
+        while self.pending >= count:
+            waiter = asyncio.get_running_loop().create_future()
+            self._below.append((count, waiter))
+            await waiter
+
+    def stats(self):
+        return {
+            'pending': self.pending,
+            'chats': len(self._chats),
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'skipped': self.skipped,
+            'retried': self.retried,
+            'failed': self.failed,
+        }
+
+    def _chat(self, key, now):
+        chat = self._chats.get(key)
+        if chat is None:
+            limited = not isinstance(key, tuple)
+            bucket = None
+            if self.chat_rate > 0 and limited:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst, now)
+            chat = self._chats[key] = ChatQueue(key, limited, bucket, now)
+        else:
+            self._chats.move_to_end(key)
+        chat.last_active = now
+        return chat
+
+    async def _enqueue(self, key, op):
+        await self._capacity.acquire()
+        chat = self._chat(key, asyncio.get_running_loop().time())
+        if op.message_id is not None:
+            queued = chat.edits.get(op.message_id)
+            if queued is not None:
+                queued.kwargs = op.kwargs
+                queued.priority = min(queued.priority, op.priority)
+                self.coalesced += 1
+                self._capacity.release()
+                return
+            if chat.sent.get(op.message_id) == op.content():
+                self.skipped += 1
+                self._capacity.release()
+                return
+            chat.edits[op.message_id] = op
+
+        chat.ops.append(op)
+        self.pending += 1
+        self._idle.clear()
+        if not chat.scheduled:
+            chat.scheduled = True
+            heapq.heappush(self._ready, (op.priority, next(self._seq), chat))
+            self._wakeup.set()
+
+    def _reschedule(self, chat, now, delay=0):
+        """Put a chat back in line after its send finished, or retire it if it has nothing queued."""
+        if not chat.ops:
+            chat.scheduled = False
+            chat.last_active = now
+            return
+        if delay > 0:
+            heapq.heappush(self._delayed, (now + delay, next(self._seq), chat))
+        else:
+            heapq.heappush(self._ready, (chat.ops[0].priority, next(self._seq), chat))
+        self._wakeup.set()
+
+    def _finish(self):
+        self.pending -= 1
+        self._capacity.release()
+        if not self.pending:
+            self._idle.set()
+        if self._below:
+            waiting = []
+            for count, waiter in self._below:
+                if self.pending < count:
+                    if not waiter.done():
+                        waiter.set_result(None)
+                else:
+                    waiting.append((count, waiter))
+            self._below = waiting
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_sweep = loop.time() + self.CHAT_IDLE_SECONDS
+        while True:
+            now = loop.time()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, seq, chat = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (chat.ops[0].priority, seq, chat))
+            if now >= next_sweep:
+                self._sweep_idle_chats(now)
+                next_sweep = now + self.CHAT_IDLE_SECONDS
+
+            if not self._ready:
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, seq, chat = self._ready[0]
+            op = chat.ops[0]
+
+            if op.message_id is not None and chat.sent.get(op.message_id) == op.content():
+                heapq.heappop(self._ready)
+                chat.ops.popleft()
+                chat.edits.pop(op.message_id, None)
+                self.skipped += 1
+                self._finish()
+                self._reschedule(chat, now)
+                continue
+
+            if chat.limited:
+                wait = chat.bucket.wait_time(now) if chat.bucket is not None else 0
+                if not wait and self._global is not None:
+                    wait = self._global.wait_time(now)
+                if wait:
+                    # Set the chat aside; answers and other chats keep going meanwhile
+                    heapq.heappop(self._ready)
+                    heapq.heappush(self._delayed, (now + wait, seq, chat))
+                    continue
+                if self._global is not None:
+                    self._global.take(now)
+                if chat.bucket is not None:
+                    chat.bucket.take(now)
+
+            heapq.heappop(self._ready)
+            chat.ops.popleft()
+            if op.message_id is not None and chat.edits.get(op.message_id) is op:
+                del chat.edits[op.message_id]
+
+            await self._sending.acquire()
+            task = asyncio.create_task(self._send(chat, op))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, chat, op):
+        loop = asyncio.get_running_loop()
+        retry_in = None
+        result = 'ok'
+        start = time.perf_counter()
+        try:
+            await getattr(self.bot, op.method)(**op.kwargs)
+        except RetryAfter as e:
+            result = 'flood_control'
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            logger.warning(f"Flood control on chat {chat.key}, retrying in {retry_after}s")
+            self.retried += 1
+            chat.ops.appendleft(op)
+            if chat.bucket is not None:
+                chat.bucket.pause(loop.time() + retry_after)
+            retry_in = retry_after
+        except BadRequest as e:
+            if 'not modified' in str(e).lower():
+                result = 'not_modified'
+                self.skipped += 1
+                chat.remember(op.message_id, op.content())
+            else:
+                result = 'rejected'
+                logger.warning(f"{op.method} to chat {chat.key} rejected: {e}")
+                self.failed += 1
+        except NetworkError as e:
+            op.attempts += 1
+            if op.attempts < self.MAX_ATTEMPTS:
+                result = 'retried'
+                logger.warning(f"{op.method} to chat {chat.key} failed ({e}), retrying")
+                self.retried += 1
+                chat.ops.appendleft(op)
+                retry_in = 0.5 * op.attempts
+            else:
+                result = 'dropped'
+                logger.error(f"Dropped {op.method} to chat {chat.key} after {self.MAX_ATTEMPTS} attempts: {e}")
+                self.failed += 1
+        except TelegramError as e:
+            result = 'failed'
+            logger.warning(f"{op.method} to chat {chat.key} failed: {e}")
+            self.failed += 1
+        except Exception:
+            result = 'failed'
+            logger.exception(f"Unexpected error in {op.method} to chat {chat.key}")
+            self.failed += 1
+        else:
+            self.sent += 1
+            if op.message_id is not None:
+                chat.remember(op.message_id, op.content())
+        finally:
+            SEND_LATENCY.labels(op.method).observe(time.perf_counter() - start)
+            SEND_RESULTS.labels(op.method, result).inc()
+            self._sending.release()
+            if retry_in is None:
+                self._finish()
+            self._reschedule(chat, loop.time(), retry_in or 0)
+
+    def _sweep_idle_chats(self, now):
+        """Forget chats that have sent nothing for CHAT_IDLE_SECONDS."""
+        cutoff = now - self.CHAT_IDLE_SECONDS
+        while self._chats:
+            chat = next(iter(self._chats.values()))
+            if chat.scheduled or chat.last_active > cutoff:
+                break
+            if chat.bucket is not None and not chat.bucket.full(now):
+                break
+            self._chats.popitem(last=False)
@@ -0,0 +1,325 @@
+from bisect import bisect_right
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from ..config.settings import CATEGORIES, MIN_BET, TOURNAMENT_WINDOW
+
+# Bet buttons offered after choosing a category, in ascending order
+SUGGESTED_BETS = (10, 25, 50, 100)
+
+
+def _literal(text):
+    """Escape text so it can be embedded in a str.format template."""
+    return text.replace('{', '{{').replace('}', '}}')
+
+
+class MessageRenderer:
+    """Precomputed message texts and inline keyboards.
+
+    Everything that depends only on configuration is rendered once at
+    startup. Per request, only the dynamic fields (credits, bet, guess...)
+    are filled into templates whose static parts are already joined, and
+    keyboards are shared, immutable InlineKeyboardMarkup objects.
+    """
+
+    def __init__(self, game):
+        self.categories_info = game.get_categories_info()
+        self.help_text = game.get_game_help()
+
+        self._welcome = (
+            "🎮 **Welcome to Number Guessing Game, {first_name}!**\n\n"
+            "You start with 10,000 credits! Try your luck in our exciting number guessing game.\n\n"
+            + _literal(self.categories_info)
+            + "💡 **Tip:** Click the menu button (☰) next to the text input or type `/` to see all available commands!"
+        ).format
+        self.start_keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton("🎯 Play Game", callback_data="start_play")],
+            [InlineKeyboardButton("❓ Help", callback_data="start_help")]
+        ])
+
+        self._choose_category = (
+            "🎮 **Choose Your Game Category**\n\n"
+            "💳 **Your Credits:** {credits}\n\n"
+            "Select a category to start playing:"
+        ).format
+        self.category_keyboard = InlineKeyboardMarkup([
+            [InlineKeyboardButton(
+                f"{category['emoji']} {category['name']} ({category['multiplier']}x)",
+                callback_data=f"category_{category_id}"
+            )]
+            for category_id, category in CATEGORIES.items()
+        ])
+
+        self.game_over = (
+            "💀 **Game Over!** You've run out of credits!\n\n"
+            "Use `/reset` to get 10,000 credits and continue playing."
+        )
+        self.autoplay_usage = (
+            "🤖 **Auto-Play**\n\n"
+            "Usage: `/autoplay <category> <bet> <rounds> [guess|random]`\n"
+            f"Categories: {', '.join(f'`{category_id}`' for category_id in CATEGORIES)}\n\n"
+            "Example: `/autoplay easy 10 50 7` bets 10 credits on 7, fifty times.\n"
+            "Leave out the guess to guess a random number every round."
+        )
+
+        self._tournament_help = (
+            "Join with `/tournament <category> <bet> <guess>`, e.g. `/tournament medium 50 42`.\n"
+            "One number is drawn per category when the round closes, "
+            "and everyone who guessed it wins the usual multiplier."
+        )
+        self.tournament_no_round = (
+            "🏟️ **Tournament**\n\n"
+            f"No round is open. The first entry opens one for {TOURNAMENT_WINDOW} seconds.\n\n"
+            + self._tournament_help
+        )
+        self._tournament_status = (
+            "🏟️ **Tournament Round Open**\n\n"
+            "⏳ **Closes in:** {seconds}s\n"
+            "👥 **Entrants:** {entrants}\n\n"
+            + _literal(self._tournament_help)
+        ).format
+
+        self.no_history = "📜 No games played yet. Use `/play` to start a new game!"
+
+        self._category_selected = {}
+        self._bet_keyboards = {}
+        self._custom_bet = {}
+        self._game_started = {}
+        self._result = {}
+        self._autoplay = {}
+        self._tournament_entered = {}
+        self._history_line = {}
+        self._breakdown = {}
+        self._tournament_result = {}
+        self._play_again_keyboards = {}
+        for category_id, category in CATEGORIES.items():
+            self._compile_category(category_id, category)
+
+    def _compile_category(self, category_id, category):
+        title = _literal(f"{category['emoji']} {category['name']}")
+        min_num, max_num = category['range']
+        multiplier = category['multiplier']
+
+        self._category_selected[category_id] = (
+            f"🎯 **{title} Selected**\n\n"
+            f"📊 **Range:** {min_num}-{max_num}\n"
+            f"💎 **Win Multiplier:** {multiplier}x\n"
+            "💰 **Your Credits:** {credits}\n\n"
+            "Choose your bet amount:"
+        ).format
+
+        # One keyboard for every number of affordable suggested bets
+        custom_row = [InlineKeyboardButton("💭 Custom Amount", callback_data=f"custom_bet_{category_id}")]
+        bet_rows = [
+            [InlineKeyboardButton(f"{bet} credits", callback_data=f"bet_{category_id}_{bet}")]
+            for bet in SUGGESTED_BETS
+        ]
+        self._bet_keyboards[category_id] = [
+            InlineKeyboardMarkup(bet_rows[:count] + [custom_row])
+            for count in range(len(SUGGESTED_BETS) + 1)
+        ]
+
+        self._custom_bet[category_id] = (
+            "💭 **Custom Bet Amount**\n\n"
+            f"🎯 **Category:** {title}\n"
+            "💰 **Your Credits:** {credits}\n"
+            f"📊 **Range:** {min_num}-{max_num}\n"
+            f"💎 **Win Multiplier:** {multiplier}x\n\n"
+            f"Please type your custom bet amount (minimum {MIN_BET}, maximum {{credits}}):"
+        ).format
+
+        self._game_started[category_id] = (
+            "🎮 **Game Started!**\n\n"
+            f"🎯 **Category:** {title}\n"
+            "💰 **Bet Amount:** {bet_amount} credits\n"
+            f"🎲 **Multiplier:** {multiplier}x\n\n"
+            f"🔢 **Choose a number between {min_num} and {max_num}:**\n"
+            "Type your guess in the chat!"
+        ).format
+
+        head = (
+            f"🎯 **Category:** {title}\n"
+            "🔢 **Your Guess:** {guess}\n"
+            "🎲 **Winning Number:** {winning_number}\n"
+            "💰 **Bet Amount:** {bet_amount} credits\n\n"
+        )
+        tail = "\n💳 **New Balance:** {new_credits} credits"
+        self._result[category_id] = {
+            True: (
+                "🎉 **Game Result**\n\n" + head
+                + "🏆 **YOU WON!**\n"
+                + f"💎 **Payout:** {{payout}} credits ({multiplier}x)\n" + tail
+            ).format,
+            False: (
+                "😞 **Game Result**\n\n" + head
+                + "💸 **You Lost!**\n"
+                + "❌ **Lost:** {bet_amount} credits\n" + tail
+            ).format,
+        }
+        autoplay = (
+            "🤖 **Auto-Play Finished**\n\n"
+            f"🎯 **Category:** {title}\n"
+            "🔢 **Guess:** {guess}\n"
+            "🎮 **Rounds Played:** {played}/{rounds}\n"
+            "💰 **Bet Amount:** {bet_amount} credits\n"
+            "🏆 **Wins:** {wins}\n\n"
+            "💸 **Wagered:** {wagered} credits\n"
+            "💎 **Winnings:** {paid} credits\n"
+            "📊 **Net:** {net:+d} credits\n" + tail
+        )
+        self._autoplay[category_id] = {
+            False: autoplay.format,
+            True: (autoplay + "\n\n⚠️ Stopped early: not enough credits for another bet.").format,
+        }
+        self._tournament_entered[category_id] = (
+            "🏟️ **You're In!**\n\n"
+            f"🎯 **Category:** {title}\n"
+            "🔢 **Your Guess:** {guess}\n"
+            "💰 **Bet Amount:** {bet_amount} credits (held until the draw)\n"
+            "💳 **Balance:** {credits} credits\n\n"
+            "⏳ The round closes in {seconds}s with {entrants} entrants so far."
+        ).format
+        head = (
+            f"🎯 **Category:** {title}\n"
+            "🔢 **Your Guess:** {guess}\n"
+            "🎲 **Winning Number:** {winning_number}\n"
+            "💰 **Bet Amount:** {bet_amount} credits\n\n"
+        )
+        self._tournament_result[category_id] = {
+            True: (
+                "🏟️🎉 **Tournament Result**\n\n" + head
+                + "🏆 **YOU WON!**\n"
+                + f"💎 **Payout:** {{payout}} credits ({multiplier}x)\n" + tail
+            ).format,
+            False: (
+                "🏟️ **Tournament Result**\n\n" + head
+                + "💸 **Not this time.**\n" + tail
+            ).format,
+        }
+        history_line = (
+            "{emoji} `#{game_id}` " + title + ": guessed {guess}, drew {winning_number}\n"
+            "      💰 {bet_amount} credits → {net:+d} · 🕒 {timestamp}"
+        )
+        self._history_line[category_id] = {
+            True: history_line.replace('{emoji}', '🏆').format,
+            False: history_line.replace('{emoji}', '💸').format,
+        }
+        self._breakdown[category_id] = (
+            f"{title}: " + "{games} games, {wins} wins ({win_rate:.1f}%), net {net:+d}"
+        ).format
+        self._play_again_keyboards[category_id] = InlineKeyboardMarkup([[InlineKeyboardButton(
+            f"🎯 Play Again ({category['emoji']} {category['name']})",
+            callback_data=f"play_again_{category_id}"
+        )]])
+
+    def welcome(self, first_name):
+        return self._welcome(first_name=first_name)
+
+    def choose_category(self, credits):
+        return self._choose_category(credits=credits)
+
+    def category_selected(self, category, credits):
+        """Return the bet selection text and keyboard for a category."""
+        affordable = bisect_right(SUGGESTED_BETS, credits)
+        return (self._category_selected[category](credits=credits),
+                self._bet_keyboards[category][affordable])
+
+    def custom_bet(self, category, credits):
+        return self._custom_bet[category](credits=credits)
+
+    def game_started(self, category, bet_amount):
+        return self._game_started[category](bet_amount=bet_amount)
+
+    def game_result(self, result):
+        """Return the result text and Play Again keyboard for a finished game."""
+        category = result['category']
+        text = self._result[category][result['won']](
+            guess=result['guess'],
+            winning_number=result['winning_number'],
+            bet_amount=result['bet_amount'],
+            payout=result['payout'],
+            new_credits=result['new_credits'],
+        )
+        return text, self._play_again_keyboards[category]
+
+    def autoplay_summary(self, result):
+        """Return the summary text and Play Again keyboard for an autoplay batch."""
+        category = result['category']
+        guess = result['guess']
+        text = self._autoplay[category][result['stopped_early']](
+            guess=guess if guess is not None else "random",
+            played=result['played'],
+            rounds=result['rounds'],
+            bet_amount=result['bet_amount'],
+            wins=result['wins'],
+            wagered=result['wagered'],
+            paid=result['paid'],
+            net=result['net'],
+            new_credits=result['new_credits'],
+        )
+        return text, self._play_again_keyboards[category]
+
+    def tournament_status(self, round_, now):
+        if round_ is None:
+            return self.tournament_no_round
+        return self._tournament_status(seconds=max(0, round(round_.closes_at - now)), entrants=len(round_))
+
+    def tournament_entered(self, round_, category, bet_amount, guess, credits, now):
+        return self._tournament_entered[category](
+            guess=guess,
+            bet_amount=bet_amount,
+            credits=credits,
+            seconds=max(0, round(round_.closes_at - now)),
+            entrants=len(round_),
+        )
+
+    def tournament_result(self, game, credits):
+        """Result text for one settled tournament entry."""
+        user_id, category, bet_amount, guess, winning_number, won, payout = game
+        return self._tournament_result[category][won](
+            guess=guess,
+            winning_number=winning_number,
+            bet_amount=bet_amount,
+            payout=payout,
+            new_credits=credits,
+        )
+
+    def history_page(self, rows, has_older, has_newer):
+        """Return the text and navigation keyboard for a page of game history."""
+        if not rows:
+            return self.no_history, None
+
+        lines = ["📜 **Your Game History**\n"]
+        for game_id, category, bet_amount, guess, winning_number, won, payout, timestamp in rows:
+            if category not in self._history_line:
+                continue
+            lines.append(self._history_line[category][bool(won)](
+                game_id=game_id,
+                guess=guess,
+                winning_number=winning_number,
+                bet_amount=bet_amount,
+                net=payout - bet_amount,
+                timestamp=timestamp,
+            ))
+
+        buttons = []
+        if has_newer:
+            buttons.append(InlineKeyboardButton("⬅️ Newer", callback_data=f"history_newer_{rows[0][0]}"))
+        if has_older:
+            buttons.append(InlineKeyboardButton("Older ➡️", callback_data=f"history_older_{rows[-1][0]}"))
+        return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+    def category_breakdown(self, rows):
+        """Per-category lines for /stats from (category, games, wins, wagered, payout) rows."""
+        by_category = {row[0]: row for row in rows}
+        lines = []
+        for category_id in CATEGORIES:
+            row = by_category.get(category_id)
+            if row is None or not row[1]:
+                continue
+            _, games, wins, wagered, payout = row
+            lines.append(self._breakdown[category_id](
+                games=games, wins=wins, win_rate=wins / games * 100, net=payout - wagered
+            ))
+        if not lines:
+            return ""
+        return "\n\n📂 **By Category:**\n" + "\n".join(lines)
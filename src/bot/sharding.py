@@ -0,0 +1,277 @@
+"""
+Sharded deployment: one ingress process in front of SHARD_COUNT worker processes.
+
+The ingress process receives updates by polling or through the webhook like
+a single bot would, but does not handle them. ShardRouter writes each update
+as a line of JSON to the stdin pipe of worker user_id % SHARD_COUNT, in
+arrival order, so every user's updates reach one worker and stay in order.
+Each worker is a TelegramGameBot in 'external' mode with its own session
+store, user cache and send queue; all of them share the database file. A
+worker that exits is restarted, and its updates wait in its queue meanwhile.
+
+Sharing the database between processes has these caveats:
+- each worker runs its own tournament rounds, among its own users;
+- the leaderboard and ranks show other workers' changes only after the next
+  refresh, every SHARD_REFRESH_INTERVAL seconds;
+- only worker 0 compacts game history into the archive;
+- the global send rate limit is split evenly between the workers.
+
+Worker k serves its metrics on METRICS_PORT + 1 + k.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+
+from telegram import Update
+from telegram.ext import Application, BaseUpdateProcessor
+
+from ..config.settings import (
+    BOT_TOKEN, BOT_MODE, DATABASE_PATH, METRICS_PORT, SHARD_COUNT, SHARD_QUEUE_SIZE
+)
+from ..monitoring.instruments import QUEUE_DEPTH, SHARD_RESTARTS
+from .update_processor import PerUserUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+LINE_LIMIT = 16 * 1024 * 1024  # Longest update a worker reads, in bytes
+
+
+class ShardWorker:
+    """A worker process, restarted whenever it exits, and the updates waiting for it."""
+
+    RESTART_DELAY = 1.0
+    MAX_RESTART_DELAY = 60.0
+
+    def __init__(self, index, count, db_path, queue_size=SHARD_QUEUE_SIZE):
+        self.index = index
+        self.count = count
+        self.db_path = db_path
+        # Encoded updates; when full, the router and in turn the ingress wait
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        # The worker entry point, as an argv prefix
+        self.command = [sys.executable, '-m', __name__]
+        self.process = None
+        self._line = None  # Taken from the queue but not written to a worker yet
+        self._stopping = False
+        self._supervisor = None
+
+    def start(self):
+        self._supervisor = asyncio.create_task(self._supervise())
+
+    async def stop(self):
+        """Hand the worker every queued update, then let it finish them and exit."""
+        await self.queue.join()
+        self._stopping = True
+        process = self.process
+        if process is not None and process.returncode is None:
+            # End of input: the worker stops its bot, finishing the updates it has
+            process.stdin.close()
+            await self._supervisor
+        else:
+            self._supervisor.cancel()
+            try:
+                await self._supervisor
+            except asyncio.CancelledError:
+                pass
+        self._supervisor = None
+
+    async def _supervise(self):
+        delay = self.RESTART_DELAY
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (ROOT, os.getenv('PYTHONPATH')))))
+        while True:
+            started = time.monotonic()
+            self.process = process = await asyncio.create_subprocess_exec(
+                *self.command, str(self.index), str(self.count), self.db_path,
+                stdin=asyncio.subprocess.PIPE, env=env
+            )
+            forwarder = asyncio.create_task(self._forward(process))
+            returncode = await process.wait()
+            forwarder.cancel()
+            try:
+                await forwarder
+            except asyncio.CancelledError:
+                pass
+            if self._stopping:
+                logger.info(f"Shard worker {self.index} exited with code {returncode}")
+                return
+
+            SHARD_RESTARTS.labels(f"shard_{self.index}").inc()
+            # Back off while the worker keeps dying soon after starting
+            if time.monotonic() - started > self.MAX_RESTART_DELAY:
+                delay = self.RESTART_DELAY
+            logger.error(f"Shard worker {self.index} exited with code {returncode}; "
+                         f"restarting in {delay:g}s with {self.queue.qsize()} updates waiting")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.MAX_RESTART_DELAY)
+
+    async def _forward(self, process):
+        try:
+            while True:
+                if self._line is None:
+                    self._line = await self.queue.get()
+                process.stdin.write(self._line)
+                await process.stdin.drain()
+                self._line = None
+                self.queue.task_done()
+        except (BrokenPipeError, ConnectionResetError):
+            # The worker died; its replacement gets the line that was not written
+            pass
+
+
+class ShardRouter(BaseUpdateProcessor):
+    """Update processor of the ingress process: queues each update for its user's worker."""
+
+    def __init__(self, workers):
+        # One update at a time, so each worker's queue is in arrival order
+        super().__init__(1)
+        self.workers = workers
+
+    async def do_process_update(self, update, coroutine):
+        coroutine.close()  # The ingress application has no handlers
+        key = PerUserUpdateProcessor.update_key(update) or 0
+        worker = self.workers[key % len(self.workers)]
+        await worker.queue.put(update.to_json().encode() + b'\n')
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+class ShardDispatcher:
+    """The ingress process: receives updates and routes them to the shard workers.
+
+    Has the same start_bot()/stop_bot() interface as TelegramGameBot.
+    """
+
+    def __init__(self, count=SHARD_COUNT, db_path=DATABASE_PATH, mode=BOT_MODE, queue_size=SHARD_QUEUE_SIZE,
+                 request=None, get_updates_request=None, metrics_port=METRICS_PORT):
+        # 'polling' or 'webhook'
+        self.mode = mode
+        db_path = os.path.abspath(db_path)
+        self.workers = [ShardWorker(index, count, db_path, queue_size) for index in range(count)]
+        builder = Application.builder().token(BOT_TOKEN).concurrent_updates(ShardRouter(self.workers))
+        if request is not None:
+            builder = builder.request(request)
+        if get_updates_request is not None:
+            builder = builder.get_updates_request(get_updates_request)
+        self.application = builder.build()
+        self.webhook = None
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+
+    async def start_bot(self):
+        logger.info(f"Starting {len(self.workers)} shard workers...")
+        for worker in self.workers:
+            worker.start()
+        await self.application.initialize()
+        await self.application.start()
+        if self.mode == 'webhook':
+            from .webhook import start_webhook
+
+            self.webhook = await start_webhook(self.application)
+        elif self.mode == 'polling':
+            await self.application.updater.start_polling()
+        await self.start_metrics()
+        logger.info("Dispatcher started successfully!")
+
+    async def start_metrics(self):
+        for worker in self.workers:
+            QUEUE_DEPTH.labels(f"shard_{worker.index}").set_function(worker.queue.qsize)
+        QUEUE_DEPTH.labels('webhook').set_function(
+            lambda: self.webhook.queue.qsize() if self.webhook is not None else 0
+        )
+        if self.metrics_port:
+            from ..monitoring.server import MetricsServer
+
+            self.metrics_server = MetricsServer(port=self.metrics_port)
+            await self.metrics_server.start()
+
+    async def stop_bot(self):
+        """Stop receiving updates, then stop the workers once they have every queued update."""
+        logger.info("Stopping dispatcher...")
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        if self.webhook is not None:
+            await self.webhook.stop()
+        if self.application.updater and self.application.updater.running:
+            await self.application.updater.stop()
+        if self.application.running:
+            await self.application.stop()
+        await asyncio.gather(*(worker.stop() for worker in self.workers if worker._supervisor is not None))
+        await self.application.shutdown()
+        logger.info("Dispatcher stopped.")
+
+
+async def run_worker(index, count, db_path, request=None, bot=None):
+    """Run shard worker `index`: handle the updates read from stdin until it is closed.
+
+    `bot` is an 'external' mode TelegramGameBot for the shard to run instead
+    of a new one, e.g. an instrumented one in a benchmark.
+    """
+    if bot is None:
+        from .telegram_bot import TelegramGameBot
+
+        bot = TelegramGameBot(db_path, mode='external', request=request, get_updates_request=request,
+                              metrics_port=METRICS_PORT + 1 + index if METRICS_PORT else 0, shard=(index, count))
+    application = bot.application
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=LINE_LIMIT)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    # Bounds the updates started but not finished; beyond it the pipe and then the ingress wait
+    slots = asyncio.Semaphore(SHARD_QUEUE_SIZE)
+
+    async def process(update):
+        try:
+            await application.update_processor.process_update(update, application.process_update(update))
+        except Exception:
+            logger.exception("Error while processing routed update")
+        finally:
+            slots.release()
+
+    await bot.start_bot()
+    try:
+        while line := await reader.readline():
+            try:
+                update = Update.de_json(json.loads(line), application.bot)
+            except Exception:
+                logger.exception("Error while decoding routed update")
+                continue
+            # Tasks are started in arrival order, which keeps each user's updates in order
+            await slots.acquire()
+            application.create_task(process(update), update=update)
+    finally:
+        await bot.stop_bot()
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Run one shard worker; started by ShardDispatcher")
+    parser.add_argument('index', type=int)
+    parser.add_argument('count', type=int)
+    parser.add_argument('db_path')
+    args = parser.parse_args()
+
+    # Ctrl-C reaches the whole process group; workers stop when the dispatcher closes their input
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(
+        format=f'%(asctime)s - shard {args.index} - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO, force=True
+    )
+    try:
+        asyncio.run(run_worker(args.index, args.count, args.db_path))
+    except Exception:
+        logger.exception(f"Shard worker {args.index} failed")
+        # Exit for a restart rather than wait on threads left behind, e.g. the database connection's
+        os._exit(1)
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,301 @@
+"""
+Warm-restart snapshot of the in-memory state that is slow to rebuild.
+
+After the database is closed, stop_bot() writes the memory session store,
+the user cache and the credit rank index to one binary file. The file is
+fingerprinted with the size, mtime and inode of the database file and its
+WAL. start_bot() maps the file and uses it only if the fingerprint still
+matches, so that nothing has written to the database in between. If it
+does not match, the bot starts cold. Either way the file is deleted on
+load, so a snapshot is never applied twice.
+
+Rows are stored as columns and are not turned into objects at load: only
+an index from user id to row is built, and a store builds the object for
+a user from the mapped columns when it misses on that user.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from itertools import accumulate
+from operator import attrgetter
+
+from ..database.user_cache import UserRecord
+from ..game.session_store import GameSession, MemorySessionStore
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'GBWARM\r\n'
+VERSION = 1
+# magic, version, catalog bytes, written at (epoch seconds), database fingerprint (size, mtime_ns,
+# inode, WAL size, WAL mtime_ns), sessions, cached users, rank index size, overflow balances, ranked users
+HEADER = struct.Struct('<8sIIdqqqqqqqqqq')
+NO_USERNAME = b'\xff'  # Never valid UTF-8, so no real username encodes to it
+
+
+def database_fingerprint(db_path):
+    """Identify the database's on-disk state; the WAL's fields are -1 if it has none."""
+    stat = os.stat(db_path)
+    try:
+        wal = os.stat(db_path + '-wal')
+        wal_size, wal_mtime = wal.st_size, wal.st_mtime_ns
+    except FileNotFoundError:
+        wal_size, wal_mtime = -1, -1
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino, wal_size, wal_mtime)
+
+
+class SnapshotTable:
+    """Snapshot rows keyed by user id, built into objects one at a time as they are used.
+
+    Each row can be taken once; from then on the store that took it owns
+    the object. Times on built objects are relative to the moment the
+    table was handed to the store.
+    """
+
+    def __init__(self, user_ids, build, lifetime):
+        self._rows = dict(zip(user_ids, range(len(user_ids))))
+        self._build = build
+        self.lifetime = lifetime  # Seconds until every row has expired
+
+    @property
+    def remaining(self):
+        return len(self._rows)
+
+    def take(self, user_id):
+        """Build and return the user's row, or None if there is none or it was taken."""
+        row = self._rows.pop(user_id, None)
+        return None if row is None else self._build(row)
+
+    def discard(self, user_id):
+        """Drop the user's row without building it."""
+        self._rows.pop(user_id, None)
+
+    def take_all(self):
+        """Build every row not taken yet."""
+        rows, self._rows = self._rows, {}
+        return [self._build(row) for row in rows.values()]
+
+
+def _encode(values):
+    # A few distinct strings as (the distinct strings, a byte code per value)
+    values = list(values)
+    distinct = sorted(set(values))
+    if len(distinct) > 256:
+        raise ValueError(f"{len(distinct)} distinct values do not fit a byte code")
+    codes = {value: code for code, value in enumerate(distinct)}
+    return distinct, array('B', map(codes.__getitem__, values))
+
+
+def _padding(size):
+    return b'\0' * (-size % 8)
+
+
+def write_snapshot(path, database, sessions):
+    """Write the snapshot for a database that was just closed. Returns the file size."""
+    written_at = time.time()
+    sections = []
+
+    # Sessions, with expiry as seconds left. Columns are written in the
+    # stores' own order: visiting a million objects by user id instead is
+    # dominated by cache misses, and the loader indexes rows by id anyway.
+    sessions_now, live = sessions.export() if isinstance(sessions, MemorySessionStore) else (0.0, [])
+    stages, stage_codes = _encode(map(attrgetter('stage'), live))
+    categories, category_codes = _encode(map(attrgetter('category'), live))
+    session_expires = array('d', [session.expires_at - sessions_now for session in live])
+    sections += [
+        array('q', [session.user_id for session in live]),
+        array('q', [-1 if session.bet_amount is None else session.bet_amount for session in live]),
+        session_expires,
+        stage_codes,
+        category_codes,
+    ]
+
+    # User cache, with each record's age
+    cache = database.user_cache
+    cache_now, records = cache.export()
+    user_ages = array('d', [cache_now - record.cached_at for record in records])
+    names = [NO_USERNAME if record.username is None else record.username.encode() for record in records]
+    sections += [
+        array('q', [record.user_id for record in records]),
+        array('q', [record.credits for record in records]),
+        array('q', [record.games_played for record in records]),
+        array('q', [record.games_won for record in records]),
+        array('q', [record.total_wagered for record in records]),
+        array('q', [record.total_winnings for record in records]),
+        user_ages,
+        array('q', accumulate(map(len, names), initial=0)),
+        b''.join(names),
+    ]
+
+    # Rank index
+    tree, overflow, ranked = database.rank_index.dump()
+    sections += [tree, array('q', overflow)]
+
+    catalog = json.dumps({
+        'byteorder': sys.byteorder,
+        'stages': stages,
+        'categories': categories,
+        'session_lifetime': max(session_expires, default=0.0),
+        'cache_lifetime': cache.ttl - min(user_ages, default=0.0),
+    }).encode()
+    header = HEADER.pack(
+        MAGIC, VERSION, len(catalog), written_at, *database_fingerprint(database.db_path),
+        len(live), len(records), len(tree), len(overflow), ranked
+    )
+
+    temporary = f"{path}.tmp"
+    with open(temporary, 'wb') as fh:
+        fh.write(header)
+        fh.write(catalog + _padding(len(catalog)))
+        for section in sections:
+            data = section if isinstance(section, bytes) else section.tobytes()
+            fh.write(data)
+            fh.write(_padding(len(data)))
+        size = fh.tell()
+    os.replace(temporary, path)
+    logger.info(f"Wrote warm-restart snapshot of {len(live)} sessions, {len(records)} cached users "
+                f"and {ranked} ranked balances ({size / 1e6:.1f} MB)")
+    return size
+
+
+def load_snapshot(path, db_path):
+    """Map and delete the snapshot at `path`.
+
+    Returns a WarmSnapshot, or None if there is no snapshot or it does not
+    match the database at `db_path`. Call before the database is opened,
+    since opening it changes the fingerprint.
+    """
+    try:
+        fh = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    with fh:
+        os.remove(path)
+        try:
+            data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            logger.warning(f"Ignoring empty warm-restart snapshot {path}")
+            return None
+    try:
+        snapshot = WarmSnapshot(data)
+    except (ValueError, KeyError, struct.error) as e:
+        logger.warning(f"Ignoring unreadable warm-restart snapshot {path}: {e}")
+        return None
+    try:
+        fingerprint = database_fingerprint(db_path)
+    except FileNotFoundError:
+        fingerprint = None
+    if snapshot.fingerprint != fingerprint:
+        logger.info("Database changed since the warm-restart snapshot was written; starting cold")
+        return None
+    return snapshot
+
+
+class WarmSnapshot:
+    """A mapped snapshot file; restores each part into a freshly created store."""
+
+    def __init__(self, data):
+        fields = HEADER.unpack_from(data)
+        magic, version, catalog_size, self.written_at = fields[:4]
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"not a version {VERSION} snapshot")
+        self.fingerprint = fields[4:9]
+        sessions, users, tree_size, overflow_size, self.ranked = fields[9:]
+
+        offset = HEADER.size
+        catalog = json.loads(bytes(data[offset:offset + catalog_size]))
+        if catalog['byteorder'] != sys.byteorder:
+            raise ValueError("written on a machine of different byte order")
+        self._catalog = catalog
+        offset += catalog_size + len(_padding(catalog_size))
+
+        view = memoryview(data)
+
+        def section(typecode, count):
+            nonlocal offset
+            size = count * array(typecode).itemsize
+            if offset + size > len(view):
+                raise ValueError("truncated")
+            column = view[offset:offset + size].cast(typecode)
+            offset += size + len(_padding(size))
+            return column
+
+        self._session_ids = section('q', sessions)
+        self._session_bets = section('q', sessions)
+        self._session_expires = section('d', sessions)
+        self._session_stages = section('B', sessions)
+        self._session_categories = section('B', sessions)
+
+        self._user_ids = section('q', users)
+        self._user_columns = [section('q', users) for _ in range(5)]
+        self._user_ages = section('d', users)
+        self._name_offsets = section('q', users + 1)
+        self._names = section('B', self._name_offsets[users] if users else 0)
+
+        self._tree = section('q', tree_size)
+        self._overflow = section('q', overflow_size)
+
+    @property
+    def downtime(self):
+        """Seconds between writing the snapshot and now."""
+        return max(0.0, time.time() - self.written_at)
+
+    def restore_sessions(self, store):
+        """Hand the sessions to a memory session store; other backends keep their own."""
+        if not isinstance(store, MemorySessionStore) or not len(self._session_ids):
+            return
+        downtime = self.downtime
+        user_ids = self._session_ids
+        bets = self._session_bets
+        expires = self._session_expires
+        stage_codes = self._session_stages
+        category_codes = self._session_categories
+        stages = self._catalog['stages']
+        categories = self._catalog['categories']
+
+        def build(row):
+            bet = bets[row]
+            return GameSession(user_ids[row], stages[stage_codes[row]], categories[category_codes[row]],
+                               None if bet < 0 else bet, expires[row] - downtime)
+
+        table = SnapshotTable(user_ids, build, self._catalog['session_lifetime'] - downtime)
+        if table.lifetime > 0:
+            store.restore(table)
+            logger.info(f"Restored {len(user_ids)} game sessions from the warm-restart snapshot")
+
+    def restore_user_cache(self, cache):
+        """Hand the cached user records to an empty UserCache."""
+        if not len(self._user_ids):
+            return
+        downtime = self.downtime
+        user_ids = self._user_ids
+        credits, games_played, games_won, total_wagered, total_winnings = self._user_columns
+        ages = self._user_ages
+        offsets = self._name_offsets
+        names = self._names
+
+        def build(row):
+            name = bytes(names[offsets[row]:offsets[row + 1]])
+            record = UserRecord(user_ids[row], None if name == NO_USERNAME else name.decode(),
+                                credits[row], games_played[row], games_won[row],
+                                total_wagered[row], total_winnings[row])
+            record.cached_at = -(ages[row] + downtime)
+            return record
+
+        table = SnapshotTable(user_ids, build, self._catalog['cache_lifetime'] - downtime)
+        if table.lifetime > 0:
+            cache.restore(table)
+            logger.info(f"Restored {len(user_ids)} cached users from the warm-restart snapshot")
+
+    def restore_rank_index(self, index):
+        """Load the rank index; False if it was built with a different size."""
+        if len(self._tree) != index.max_credits + 1:
+            return False
+        index.restore(self._tree, self._overflow, self.ranked)
+        logger.info(f"Rank index of {self.ranked} users loaded from the warm-restart snapshot")
+        return True
@@ -1,12 +1,28 @@
 import logging
 import asyncio
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand
+import hashlib
+import json
+import time
+from telegram import Update, BotCommand
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, ContextTypes, filters
 from telegram.constants import ParseMode
 
-from ..config.settings import BOT_TOKEN, CATEGORIES, MIN_BET
+from ..config.settings import (
+    BOT_TOKEN, BOT_MODE, DATABASE_PATH, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_PORT,
+    TOURNAMENT_NOTIFY_BATCH, METRICS_PORT, ADMIN_USER_IDS, PROFILE_ENABLED, WARM_RESTART, WARM_SNAPSHOT_PATH,
+    SHARD_COUNT, SHARD_REFRESH_INTERVAL
+)
 from ..database.db_manager import GameDatabase
 from ..game.game_logic import NumberGuessingGame
+from ..game.tournament import TournamentManager
+from ..monitoring.instruments import (
+    ACTIVE_SESSIONS, ACTIVE_USERS, DB_CONNECTIONS, DB_CONNECTIONS_IN_USE, QUEUE_DEPTH, instrument_handler
+)
+from ..monitoring.profiler import UpdateProfiler, profile_step
+from .outbound import PRIORITY_BULK, SendScheduler
+from .rendering import MessageRenderer
+from .snapshot import load_snapshot, write_snapshot
+from .update_processor import PerUserUpdateProcessor
 
 # Set up logging
 logging.basicConfig(
@@ -16,41 +32,99 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class TelegramGameBot:
-    def __init__(self):
-        self.db = GameDatabase()
+    def __init__(self, db_path=DATABASE_PATH, mode=BOT_MODE, request=None, get_updates_request=None,
+                 metrics_port=METRICS_PORT, shard=None):
+        # (index, count) when this is one worker of a sharded deployment, see sharding.py
+        self.shard = shard
+        self.db = GameDatabase(db_path, shard=shard)
         self.game = NumberGuessingGame(self.db)
-        self.application = Application.builder().token(BOT_TOKEN).build()
+        self.renderer = MessageRenderer(self.game)
+        self.tournaments = TournamentManager(self.db, notify=self.notify_tournament_results, shard=shard)
+        # 'polling', 'webhook', or 'external' when the caller feeds updates itself
+        self.mode = mode
+        self.webhook = None
+        self.metrics_port = metrics_port
+        self.metrics_server = None
+        # Warm-restart snapshot, written by stop_bot only after start_bot loaded the database.
+        # Shard workers never match a snapshot: the others keep writing the database.
+        use_snapshot = WARM_RESTART and shard is None
+        self.snapshot_path = (WARM_SNAPSHOT_PATH or f"{db_path}.warm") if use_snapshot else None
+        self._database_loaded = False
+        self._refresher = None
+        
+        # Different users' updates run concurrently, each user's in order
+        self.profiler = UpdateProfiler()
+        update_processor = PerUserUpdateProcessor()
+        update_processor.profiler = self.profiler
+        builder = Application.builder().token(BOT_TOKEN).concurrent_updates(update_processor)
+        # Custom request objects let the bot run against a stand-in for the Bot API
+        if request is not None:
+            builder = builder.request(request)
+        if get_updates_request is not None:
+            builder = builder.get_updates_request(get_updates_request)
+        self.application = builder.build()
+        # Every outgoing message goes through the rate-limited send queue
+        self.outbox = SendScheduler(self.application.bot)
+        if shard is not None:
+            # The global limit is per bot token, so the workers split it
+            self.outbox.global_rate /= shard[1]
+            self.outbox.global_burst = max(1, self.outbox.global_burst // shard[1])
+        # Rendered /leaderboard text and the leaderboard version it was built from
+        self._leaderboard_message = None
+        self._leaderboard_version = None
         self.setup_handlers()
     
     def setup_handlers(self):
         """Set up all command and message handlers."""
-        # Command handlers
-        self.application.add_handler(CommandHandler("start", self.start_command))
-        self.application.add_handler(CommandHandler("help", self.help_command))
-        self.application.add_handler(CommandHandler("play", self.play_command))
-        self.application.add_handler(CommandHandler("balance", self.balance_command))
-        self.application.add_handler(CommandHandler("stats", self.stats_command))
-        self.application.add_handler(CommandHandler("leaderboard", self.leaderboard_command))
-        self.application.add_handler(CommandHandler("reset", self.reset_command))
+        # Command handlers, each timed under its command name
+        commands = {
+            "start": self.start_command,
+            "help": self.help_command,
+            "play": self.play_command,
+            "autoplay": self.autoplay_command,
+            "tournament": self.tournament_command,
+            "balance": self.balance_command,
+            "stats": self.stats_command,
+            "history": self.history_command,
+            "leaderboard": self.leaderboard_command,
+            "rank": self.rank_command,
+            "reset": self.reset_command,
+            "profile": self.profile_command,  # Admins only, not in the command menu
+        }
+        for name, callback in commands.items():
+            self.application.add_handler(CommandHandler(name, instrument_handler(name, callback)))
         
         # Callback query handler for inline buttons
-        self.application.add_handler(CallbackQueryHandler(self.button_callback))
+        self.application.add_handler(CallbackQueryHandler(instrument_handler("button", self.button_callback)))
         
         # Message handler for game inputs
-        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND,
+                                                    instrument_handler("message", self.handle_message)))
     
     async def setup_bot_commands(self):
         """Set up the bot command menu."""
         commands = [
             BotCommand("start", "🎮 Start the bot"),
             BotCommand("play", "🎯 Start a new game"),
+            BotCommand("autoplay", "🤖 Play many rounds at once"),
+            BotCommand("tournament", "🏟️ Join the shared-draw round"),
             BotCommand("balance", "💰 Check your credits"),
             BotCommand("stats", "📊 View your statistics"),
+            BotCommand("history", "📜 Browse your past games"),
             BotCommand("leaderboard", "🏆 See top players"),
+            BotCommand("rank", "📍 See your rank"),
             BotCommand("reset", "🔄 Reset credits to 10,000"),
             BotCommand("help", "❓ Show help information"),
         ]
+        # set_my_commands is a network round trip; skip it when this bot already has this menu
+        digest = hashlib.sha256(json.dumps(
+            [self.application.bot.id, [(command.command, command.description) for command in commands]]
+        ).encode()).hexdigest()
+        if await self.db.get_meta('bot_commands_hash') == digest:
+            logger.info("Bot commands menu unchanged")
+            return
         await self.application.bot.set_my_commands(commands)
+        await self.db.set_meta('bot_commands_hash', digest)
         logger.info("Bot commands menu set up successfully")
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -58,49 +132,97 @@ class TelegramGameBot:
         user = update.effective_user
         await self.db.get_user(user.id, user.username)
         
-        welcome_message = f"🎮 **Welcome to Number Guessing Game, {user.first_name}!**\n\n"
-        welcome_message += "You start with 10,000 credits! Try your luck in our exciting number guessing game.\n\n"
-        welcome_message += self.game.get_categories_info()
-        welcome_message += "💡 **Tip:** Click the menu button (☰) next to the text input or type `/` to see all available commands!"
+        welcome_message = self.renderer.welcome(user.first_name)
         
-        # Create buttons for Play and Help
-        keyboard = [
-            [InlineKeyboardButton("🎯 Play Game", callback_data="start_play")],
-            [InlineKeyboardButton("❓ Help", callback_data="start_help")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(welcome_message, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+        await self.outbox.reply(update.message, welcome_message, reply_markup=self.renderer.start_keyboard,
+                                parse_mode=ParseMode.MARKDOWN)
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command."""
-        help_text = self.game.get_game_help()
-        await update.message.reply_text(help_text, parse_mode=ParseMode.MARKDOWN)
+        await self.outbox.reply(update.message, self.renderer.help_text, parse_mode=ParseMode.MARKDOWN)
     
     async def play_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /play command - show category selection."""
         user = update.effective_user
         user_data = await self.db.get_user(user.id, user.username)
         
-        if user_data['credits'] <= 0:
-            await update.message.reply_text(
-                "😞 You don't have any credits left! Contact the administrator to get more credits.",
+        if user_data.credits <= 0:
+            await self.outbox.reply(
+                update.message, "😞 You don't have any credits left! Contact the administrator to get more credits.",
                 parse_mode=ParseMode.MARKDOWN
             )
             return
         
-        keyboard = []
-        for category_id, category in CATEGORIES.items():
-            button_text = f"{category['emoji']} {category['name']} ({category['multiplier']}x)"
-            keyboard.append([InlineKeyboardButton(button_text, callback_data=f"category_{category_id}")])
+        message = self.renderer.choose_category(user_data.credits)
+        
+        await self.outbox.reply(update.message, message, reply_markup=self.renderer.category_keyboard,
+                                parse_mode=ParseMode.MARKDOWN)
+    
+    async def autoplay_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /autoplay command - play many rounds with the same bet."""
+        user = update.effective_user
+        args = context.args
+        try:
+            category = args[0].lower()
+            bet_amount = int(args[1])
+            rounds = int(args[2])
+            guess = None if len(args) < 4 or args[3].lower() == 'random' else int(args[3])
+        except (IndexError, ValueError):
+            await self.outbox.reply(update.message, self.renderer.autoplay_usage, parse_mode=ParseMode.MARKDOWN)
+            return
+        
+        result, message = await self.game.autoplay(user.id, user.username, category, bet_amount, rounds, guess)
+        
+        if result is None:
+            await self.outbox.reply(update.message, f"❌ {message}", parse_mode=ParseMode.MARKDOWN)
+            return
+        
+        summary, reply_markup = self.renderer.autoplay_summary(result)
+        
+        await self.outbox.reply(update.message, summary, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+        
+        if result['new_credits'] <= 0:
+            await self.outbox.reply(update.message, self.renderer.game_over, parse_mode=ParseMode.MARKDOWN)
+    
+    async def tournament_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /tournament command - show the open round or enter it."""
+        user = update.effective_user
+        args = context.args
+        
+        if not args:
+            message = self.renderer.tournament_status(self.tournaments.current, time.time())
+            await self.outbox.reply(update.message, message, parse_mode=ParseMode.MARKDOWN)
+            return
+        
+        try:
+            category = args[0].lower()
+            bet_amount = int(args[1])
+            guess = int(args[2])
+        except (IndexError, ValueError):
+            message = self.renderer.tournament_status(self.tournaments.current, time.time())
+            await self.outbox.reply(update.message, message, parse_mode=ParseMode.MARKDOWN)
+            return
         
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        round_, result = await self.tournaments.enter(user.id, user.username, category, bet_amount, guess)
         
-        message = f"🎮 **Choose Your Game Category**\n\n"
-        message += f"💳 **Your Credits:** {user_data['credits']}\n\n"
-        message += "Select a category to start playing:"
+        if round_ is None:
+            await self.outbox.reply(update.message, f"❌ {result}", parse_mode=ParseMode.MARKDOWN)
+            return
         
-        await update.message.reply_text(message, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+        message = self.renderer.tournament_entered(round_, category, bet_amount, guess, result, time.time())
+        
+        await self.outbox.reply(update.message, message, parse_mode=ParseMode.MARKDOWN)
+    
+    async def notify_tournament_results(self, round_, results):
+        """Queue every entrant's result, a batch at a time, behind interactive replies."""
+        for start in range(0, len(results), TOURNAMENT_NOTIFY_BATCH):
+            # Keep the send queue short so it never fills up with notifications
+            await self.outbox.wait_below(TOURNAMENT_NOTIFY_BATCH)
+            for game, credits in results[start:start + TOURNAMENT_NOTIFY_BATCH]:
+                await self.outbox.send_message(
+                    game[0], self.renderer.tournament_result(game, credits),
+                    priority=PRIORITY_BULK, parse_mode=ParseMode.MARKDOWN
+                )
     
     async def balance_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /balance command."""
@@ -108,15 +230,15 @@ class TelegramGameBot:
         user_data = await self.db.get_user(user.id, user.username)
         
         message = f"💳 **Your Balance**\n\n"
-        message += f"💰 **Credits:** {user_data['credits']}\n"
-        message += f"🎮 **Games Played:** {user_data['games_played']}\n"
-        message += f"🏆 **Games Won:** {user_data['games_won']}"
+        message += f"💰 **Credits:** {user_data.credits}\n"
+        message += f"🎮 **Games Played:** {user_data.games_played}\n"
+        message += f"🏆 **Games Won:** {user_data.games_won}"
         
-        if user_data['games_played'] > 0:
-            win_rate = (user_data['games_won'] / user_data['games_played']) * 100
+        if user_data.games_played > 0:
+            win_rate = (user_data.games_won / user_data.games_played) * 100
             message += f"\n📊 **Win Rate:** {win_rate:.1f}%"
         
-        await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+        await self.outbox.reply(update.message, message, parse_mode=ParseMode.MARKDOWN)
     
     async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /stats command."""
@@ -124,7 +246,7 @@ class TelegramGameBot:
         stats = await self.db.get_user_stats(user.id)
         
         if not stats:
-            await update.message.reply_text("No statistics available yet. Play some games first!")
+            await self.outbox.reply(update.message, "No statistics available yet. Play some games first!")
             return
         
         credits, games_played, games_won, total_wagered, total_winnings = stats
@@ -142,17 +264,52 @@ class TelegramGameBot:
             
             net_profit = total_winnings - total_wagered
             message += f"📊 **Net Profit:** {net_profit:+d} credits"
+            
+            message += self.renderer.category_breakdown(await self.db.get_category_stats(user.id))
         
-        await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+        await self.outbox.reply(update.message, message, parse_mode=ParseMode.MARKDOWN)
+    
+    async def history_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /history command - show the latest games."""
+        user = update.effective_user
+        rows, has_older, has_newer = await self.db.get_history(user.id)
+        
+        message, reply_markup = self.renderer.history_page(rows, has_older, has_newer)
+        
+        await self.outbox.reply(update.message, message, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
     
     async def leaderboard_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /leaderboard command."""
-        leaderboard = await self.db.get_leaderboard()
+        board = self.db.leaderboard
+        if self._leaderboard_version != board.version:
+            self._leaderboard_message = self.format_leaderboard(await self.db.get_leaderboard())
+            self._leaderboard_version = board.version
         
-        if not leaderboard:
-            await update.message.reply_text("No players on the leaderboard yet!")
+        if self._leaderboard_message is None:
+            await self.outbox.reply(update.message, "No players on the leaderboard yet!")
             return
         
+        await self.outbox.reply(update.message, self._leaderboard_message, parse_mode=ParseMode.MARKDOWN)
+    
+    async def rank_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /rank command."""
+        user = update.effective_user
+        credits, rank, total = await self.db.get_rank(user.id, user.username)
+        
+        top_percent = rank / total * 100
+        
+        message = f"📍 **Your Rank**\n\n"
+        message += f"🏅 **Rank:** #{rank} of {total} players\n"
+        message += f"💰 **Credits:** {credits}\n"
+        message += f"📈 **Percentile:** top {top_percent:.1f}%"
+        
+        await self.outbox.reply(update.message, message, parse_mode=ParseMode.MARKDOWN)
+    
+    def format_leaderboard(self, leaderboard):
+        """Render leaderboard rows, or return None if there are none."""
+        if not leaderboard:
+            return None
+        
         message = "🏆 **Top Players (by Credits)**\n\n"
         
         for i, (username, credits, games_played, games_won) in enumerate(leaderboard, 1):
@@ -164,12 +321,12 @@ class TelegramGameBot:
             message += f"{trophy} **{username_display}**\n"
             message += f"   💰 {credits} credits | 🎮 {games_played} games | 📈 {win_rate:.1f}% win rate\n\n"
         
-        await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+        return message
     
     async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle inline button callbacks."""
         query = update.callback_query
-        await query.answer()
+        await self.outbox.answer(query)
         
         user = query.from_user
         data = query.data
@@ -188,89 +345,62 @@ class TelegramGameBot:
         elif data.startswith("play_again_"):
             category = data.replace("play_again_", "")
             await self.handle_play_again(query, user, category)
+        elif data.startswith("history_"):
+            _, direction, game_id = data.split("_")
+            await self.handle_history_page(query, user, direction, int(game_id))
         elif data == "start_play":
             await self.handle_start_play_button(query, user)
         elif data == "start_help":
             await self.handle_start_help_button(query, user)
     
+    @profile_step
     async def handle_category_selection(self, query, user, category):
         """Handle category selection."""
         user_data = await self.db.get_user(user.id, user.username)
-        category_info = CATEGORIES[category]
-        
-        # Create bet amount buttons
-        suggested_bets = [10, 25, 50, 100]
-        keyboard = []
         
-        for bet in suggested_bets:
-            if bet <= user_data['credits']:
-                keyboard.append([InlineKeyboardButton(f"{bet} credits", callback_data=f"bet_{category}_{bet}")])
+        # Bet amount buttons for the suggested bets the user can afford
+        message, reply_markup = self.renderer.category_selected(category, user_data.credits)
         
-        # Add custom bet option
-        keyboard.append([InlineKeyboardButton("💭 Custom Amount", callback_data=f"custom_bet_{category}")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        message = f"🎯 **{category_info['emoji']} {category_info['name']} Selected**\n\n"
-        message += f"📊 **Range:** {category_info['range'][0]}-{category_info['range'][1]}\n"
-        message += f"💎 **Win Multiplier:** {category_info['multiplier']}x\n"
-        message += f"💰 **Your Credits:** {user_data['credits']}\n\n"
-        message += "Choose your bet amount:"
-        
-        await query.edit_message_text(message, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+        await self.outbox.edit(query, message, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
     
+    @profile_step
     async def handle_bet_selection(self, query, user, category, bet_amount):
         """Handle bet amount selection."""
         user_data = await self.db.get_user(user.id, user.username)
         
         # Validate bet
-        is_valid, message = self.game.validate_bet(user_data['credits'], bet_amount, category)
+        is_valid, message = self.game.validate_bet(user_data.credits, bet_amount, category)
         if not is_valid:
-            await query.edit_message_text(f"❌ {message}", parse_mode=ParseMode.MARKDOWN)
+            await self.outbox.edit(query, f"❌ {message}", parse_mode=ParseMode.MARKDOWN)
             return
         
         # Start game session
-        self.game.start_game_session(user.id, category, bet_amount)
-        
-        category_info = CATEGORIES[category]
-        min_num, max_num = category_info['range']
+        await self.game.start_game_session(user.id, category, bet_amount)
         
-        message = f"🎮 **Game Started!**\n\n"
-        message += f"🎯 **Category:** {category_info['emoji']} {category_info['name']}\n"
-        message += f"💰 **Bet Amount:** {bet_amount} credits\n"
-        message += f"🎲 **Multiplier:** {category_info['multiplier']}x\n\n"
-        message += f"🔢 **Choose a number between {min_num} and {max_num}:**\n"
-        message += "Type your guess in the chat!"
+        message = self.renderer.game_started(category, bet_amount)
         
-        await query.edit_message_text(message, parse_mode=ParseMode.MARKDOWN)
+        await self.outbox.edit(query, message, parse_mode=ParseMode.MARKDOWN)
     
+    @profile_step
     async def handle_custom_bet_selection(self, query, user, category):
         """Handle custom bet amount selection."""
-        category_info = CATEGORIES[category]
         user_data = await self.db.get_user(user.id, user.username)
         
-        message = f"💭 **Custom Bet Amount**\n\n"
-        message += f"🎯 **Category:** {category_info['emoji']} {category_info['name']}\n"
-        message += f"💰 **Your Credits:** {user_data['credits']}\n"
-        message += f"📊 **Range:** {category_info['range'][0]}-{category_info['range'][1]}\n"
-        message += f"💎 **Win Multiplier:** {category_info['multiplier']}x\n\n"
-        message += f"Please type your custom bet amount (minimum {MIN_BET}, maximum {user_data['credits']}):"
+        message = self.renderer.custom_bet(category, user_data.credits)
         
         # Store the category in user session for custom bet
-        self.game.user_sessions[user.id] = {
-            'stage': 'waiting_for_custom_bet',
-            'category': category
-        }
+        await self.game.start_custom_bet_session(user.id, category)
         
-        await query.edit_message_text(message, parse_mode=ParseMode.MARKDOWN)
+        await self.outbox.edit(query, message, parse_mode=ParseMode.MARKDOWN)
     
+    @profile_step
     async def handle_play_again(self, query, user, category):
         """Handle play again button - go back to bet selection."""
         user_data = await self.db.get_user(user.id, user.username)
         
-        if user_data['credits'] <= 0:
-            await query.edit_message_text(
-                "😞 You don't have any credits left! Use `/reset` to get 10,000 credits.",
+        if user_data.credits <= 0:
+            await self.outbox.edit(
+                query, "😞 You don't have any credits left! Use `/reset` to get 10,000 credits.",
                 parse_mode=ParseMode.MARKDOWN
             )
             return
@@ -278,90 +408,92 @@ class TelegramGameBot:
         # Reuse the category selection logic
         await self.handle_category_selection(query, user, category)
     
+    @profile_step
+    async def handle_history_page(self, query, user, direction, game_id):
+        """Handle the Older/Newer buttons under /history."""
+        if direction == "older":
+            page = await self.db.get_history(user.id, before_id=game_id)
+        else:
+            page = await self.db.get_history(user.id, after_id=game_id)
+        
+        message, reply_markup = self.renderer.history_page(*page)
+        
+        await self.outbox.edit(query, message, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    
+    @profile_step
     async def handle_start_play_button(self, query, user):
         """Handle the Play Game button from start message."""
         user_data = await self.db.get_user(user.id, user.username)
         
-        if user_data['credits'] <= 0:
-            await query.edit_message_text(
-                "😞 You don't have any credits left! Use `/reset` to get 10,000 credits.",
+        if user_data.credits <= 0:
+            await self.outbox.edit(
+                query, "😞 You don't have any credits left! Use `/reset` to get 10,000 credits.",
                 parse_mode=ParseMode.MARKDOWN
             )
             return
         
-        keyboard = []
-        for category_id, category in CATEGORIES.items():
-            button_text = f"{category['emoji']} {category['name']} ({category['multiplier']}x)"
-            keyboard.append([InlineKeyboardButton(button_text, callback_data=f"category_{category_id}")])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        message = self.renderer.choose_category(user_data.credits)
         
-        message = f"🎮 **Choose Your Game Category**\n\n"
-        message += f"💳 **Your Credits:** {user_data['credits']}\n\n"
-        message += "Select a category to start playing:"
-        
-        await query.edit_message_text(message, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+        await self.outbox.edit(query, message, reply_markup=self.renderer.category_keyboard,
+                               parse_mode=ParseMode.MARKDOWN)
     
+    @profile_step
     async def handle_start_help_button(self, query, user):
         """Handle the Help button from start message."""
-        help_text = self.game.get_game_help()
-        await query.edit_message_text(help_text, parse_mode=ParseMode.MARKDOWN)
+        await self.outbox.edit(query, self.renderer.help_text, parse_mode=ParseMode.MARKDOWN)
     
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle text messages (mainly for game guesses and custom bet amounts)."""
         user = update.effective_user
-        session = self.game.get_user_session(user.id)
+        session = await self.game.get_user_session(user.id)
         
         if not session:
-            await update.message.reply_text(
-                "No active game session. Use `/play` to start a new game!",
+            await self.outbox.reply(
+                update.message, "No active game session. Use `/play` to start a new game!",
                 parse_mode=ParseMode.MARKDOWN
             )
             return
         
         # Handle custom bet amount input
-        if session.get('stage') == 'waiting_for_custom_bet':
+        if session.stage == 'waiting_for_custom_bet':
             try:
                 bet_amount = int(update.message.text.strip())
-                category = session['category']
+                category = session.category
                 
                 user_data = await self.db.get_user(user.id, user.username)
                 
                 # Validate bet
-                is_valid, message = self.game.validate_bet(user_data['credits'], bet_amount, category)
+                is_valid, message = self.game.validate_bet(user_data.credits, bet_amount, category)
                 if not is_valid:
-                    await update.message.reply_text(f"❌ {message}\nPlease enter a valid amount:", parse_mode=ParseMode.MARKDOWN)
+                    await self.outbox.reply(update.message, f"❌ {message}\nPlease enter a valid amount:", parse_mode=ParseMode.MARKDOWN)
                     return
                 
                 # Start game session
-                self.game.start_game_session(user.id, category, bet_amount)
-                
-                category_info = CATEGORIES[category]
-                min_num, max_num = category_info['range']
+                if not await self.game.confirm_custom_bet(user.id, category, bet_amount):
+                    await self.outbox.reply(
+                        update.message, "No active game session. Use `/play` to start a new game!",
+                        parse_mode=ParseMode.MARKDOWN
+                    )
+                    return
                 
-                game_message = f"🎮 **Game Started!**\n\n"
-                game_message += f"🎯 **Category:** {category_info['emoji']} {category_info['name']}\n"
-                game_message += f"💰 **Bet Amount:** {bet_amount} credits\n"
-                game_message += f"🎲 **Multiplier:** {category_info['multiplier']}x\n\n"
-                game_message += f"🔢 **Choose a number between {min_num} and {max_num}:**\n"
-                game_message += "Type your guess in the chat!"
+                game_message = self.renderer.game_started(category, bet_amount)
                 
-                await update.message.reply_text(game_message, parse_mode=ParseMode.MARKDOWN)
+                await self.outbox.reply(update.message, game_message, parse_mode=ParseMode.MARKDOWN)
                 
             except ValueError:
-                await update.message.reply_text(
-                    "Please enter a valid number for your bet amount!",
+                await self.outbox.reply(
+                    update.message, "Please enter a valid number for your bet amount!",
                     parse_mode=ParseMode.MARKDOWN
                 )
             return
         
         # Handle game guess input
-        if session.get('stage') == 'waiting_for_guess':
+        if session.stage == 'waiting_for_guess':
             try:
                 guess = int(update.message.text.strip())
             except ValueError:
-                await update.message.reply_text(
-                    "Please enter a valid number!",
+                await self.outbox.reply(
+                    update.message, "Please enter a valid number!",
                     parse_mode=ParseMode.MARKDOWN
                 )
                 return
@@ -370,31 +502,22 @@ class TelegramGameBot:
             result, message = await self.game.play_game(user.id, guess)
             
             if result is None:
-                await update.message.reply_text(f"❌ {message}", parse_mode=ParseMode.MARKDOWN)
+                await self.outbox.reply(update.message, f"❌ {message}", parse_mode=ParseMode.MARKDOWN)
                 return
             
             # Send game result with play again button
-            result_message = self.game.format_game_result(result)
-            
-            # Add play again button
-            keyboard = [[InlineKeyboardButton(f"🎯 Play Again ({result['category_info']['emoji']} {result['category_info']['name']})", 
-                                             callback_data=f"play_again_{result['category']}")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            result_message, reply_markup = self.renderer.game_result(result)
             
-            await update.message.reply_text(result_message, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+            await self.outbox.reply(update.message, result_message, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
             
             # If user has no credits left, show game over message
             if result['new_credits'] <= 0:
-                await update.message.reply_text(
-                    "💀 **Game Over!** You've run out of credits!\n\n"
-                    "Use `/reset` to get 10,000 credits and continue playing.",
-                    parse_mode=ParseMode.MARKDOWN
-                )
+                await self.outbox.reply(update.message, self.renderer.game_over, parse_mode=ParseMode.MARKDOWN)
             return
         
         # Default case - no valid session stage
-        await update.message.reply_text(
-            "I don't understand. Use `/play` to start a new game!",
+        await self.outbox.reply(
+            update.message, "I don't understand. Use `/play` to start a new game!",
             parse_mode=ParseMode.MARKDOWN
         )
     
@@ -410,29 +533,134 @@ class TelegramGameBot:
         message += f"💰 **New Balance:** 10,000 credits\n\n"
         message += f"Ready to play again? Use `/play` to start a new game!"
         
-        await update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+        await self.outbox.reply(update.message, message, parse_mode=ParseMode.MARKDOWN)
+    
+    async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /profile [on|off|rate <fraction>|slow <ms>] - control the update profiler."""
+        if update.effective_user.id not in ADMIN_USER_IDS:
+            return
+        
+        args = context.args
+        try:
+            if args and args[0] == 'on':
+                self.profiler.enable()
+            elif args and args[0] == 'off':
+                self.profiler.disable()
+            elif len(args) == 2 and args[0] == 'rate' and 0 <= float(args[1]) <= 1:
+                self.profiler.sample_rate = float(args[1])
+            elif len(args) == 2 and args[0] == 'slow' and float(args[1]) > 0:
+                self.profiler.slow_ms = float(args[1])
+            elif args:
+                raise ValueError(args[0])
+        except ValueError:
+            await self.outbox.reply(update.message, "Usage: /profile [on|off|rate <0-1>|slow <ms>]")
+            return
+        
+        stats = self.profiler.stats()
+        message = (
+            f"Profiler {'on' if stats['enabled'] else 'off'}\n"
+            f"Sampling {stats['sample_rate']:.2%} of updates, plus all over {stats['slow_ms']:g} ms\n"
+            f"Updates traced: {stats['traced']}, profiles written: {stats['dumped']}\n"
+            f"Directory: {stats['directory']}"
+        )
+        await self.outbox.reply(update.message, message)
     
     async def start_bot(self):
         """Start the bot."""
-        await self.db.init_db()
+        warm = load_snapshot(self.snapshot_path, self.db.db_path) if self.snapshot_path else None
+        await self.db.init_db(warm)
+        self._database_loaded = True
+        await self.game.sessions.open()
+        if warm is not None:
+            warm.restore_sessions(self.game.sessions)
         logger.info("Starting bot...")
         await self.application.initialize()
         await self.setup_bot_commands()
         await self.application.start()
-        await self.application.updater.start_polling()
+        self.outbox.start()
+        if self.shard is None or self.shard[0] == 0:
+            self.db.compactor.start()
+        if self.shard is not None:
+            self._refresher = asyncio.create_task(self._refresh_shared_indexes())
+        if self.mode == 'webhook':
+            await self.start_webhook()
+        elif self.mode == 'polling':
+            await self.application.updater.start_polling()
+        await self.start_metrics()
+        if PROFILE_ENABLED:
+            self.profiler.enable()
         logger.info("Bot started successfully!")
     
+    async def start_webhook(self, url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, port=WEBHOOK_PORT):
+        """Receive updates through the local webhook server instead of polling."""
+        from .webhook import start_webhook
+        
+        self.webhook = await start_webhook(self.application, url, secret_token, port)
+    
+    async def _refresh_shared_indexes(self):
+        """In a shard worker, pick up the other workers' balance changes now and then."""
+        while True:
+            await asyncio.sleep(SHARD_REFRESH_INTERVAL)
+            try:
+                await self.db.refresh_indexes()
+            except Exception:
+                logger.exception("Failed to refresh the leaderboard and rank index")
+    
+    async def start_metrics(self):
+        """Report queue depths and active sessions, and serve /metrics unless the port is 0."""
+        QUEUE_DEPTH.labels('outbox').set_function(lambda: self.outbox.pending)
+        QUEUE_DEPTH.labels('history_writer').set_function(lambda: self.db.history_writer.pending)
+        QUEUE_DEPTH.labels('db_write').set_function(lambda: self.db.writes_waiting)
+        QUEUE_DEPTH.labels('db_read').set_function(lambda: self.db.readers.waiting)
+        DB_CONNECTIONS.labels('writer').set(1)
+        DB_CONNECTIONS.labels('reader').set_function(lambda: len(self.db.readers.connections))
+        DB_CONNECTIONS_IN_USE.labels('writer').set_function(lambda: int(self.db.writer_busy))
+        DB_CONNECTIONS_IN_USE.labels('reader').set_function(lambda: self.db.readers.in_use)
+        QUEUE_DEPTH.labels('webhook').set_function(
+            lambda: self.webhook.queue.qsize() if self.webhook is not None else 0
+        )
+        ACTIVE_SESSIONS.set_function(lambda: self.game.sessions.active)
+        ACTIVE_USERS.set_function(lambda: self.application.update_processor.active_users)
+        if self.metrics_port:
+            from ..monitoring.server import MetricsServer
+            
+            self.metrics_server = MetricsServer(port=self.metrics_port)
+            await self.metrics_server.start()
+    
     async def stop_bot(self):
         """Stop the bot."""
         logger.info("Stopping bot...")
-        await self.application.updater.stop()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        if self.webhook is not None:
+            await self.webhook.stop()
+        if self.application.updater and self.application.updater.running:
+            await self.application.updater.stop()
         await self.application.stop()
+        await self.tournaments.stop()
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+        self.profiler.disable()
+        await self.outbox.stop()
         await self.application.shutdown()
+        await self.game.sessions.close()
+        await self.db.close()
+        if self.snapshot_path and self._database_loaded:
+            try:
+                write_snapshot(self.snapshot_path, self.db, self.game.sessions)
+            except OSError:
+                logger.exception("Failed to write the warm-restart snapshot")
         logger.info("Bot stopped.")
 
 async def main():
     """Main function to run the bot."""
-    bot = TelegramGameBot()
+    if SHARD_COUNT > 1:
+        from .sharding import ShardDispatcher
+        
+        bot = ShardDispatcher()
+    else:
+        bot = TelegramGameBot()
     
     try:
         await bot.start_bot()
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from ..config.settings import MAX_CONCURRENT_UPDATES
+
+logger = logging.getLogger(__name__)
+
+
+class _KeyedLock:
+    __slots__ = ('lock', 'waiters')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.waiters = 0  # updates holding or waiting for the lock
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process updates of different users concurrently, each user's in order.
+
+    Game sessions and credit arithmetic assume one update per user at a
+    time, so updates are serialized through a lock per user. Only updates
+    that hold their user's lock count against `max_concurrent_updates`;
+    a user who sends many updates at once does not take slots away from
+    everyone else while they wait. A lock is dropped as soon as no update
+    of its user holds or waits for it.
+    """
+
+    # Accepted updates, running or waiting, before the application's update
+    # tasks block on the base class semaphore
+    MAX_PENDING_FACTOR = 64
+
+    def __init__(self, max_concurrent_updates=MAX_CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates * self.MAX_PENDING_FACTOR)
+        self.max_running = max_concurrent_updates
+        self._running = asyncio.Semaphore(max_concurrent_updates)
+        self._locks = {}
+        # UpdateProfiler wrapped around each update's processing, if set
+        self.profiler = None
+
+    @staticmethod
+    def update_key(update):
+        """Key updates are serialized on: the user, else the chat, else None."""
+        if isinstance(update, Update):
+            if update.effective_user is not None:
+                return update.effective_user.id
+            if update.effective_chat is not None:
+                return update.effective_chat.id
+        return None
+
+    @property
+    def active_users(self):
+        """Number of users with an update running or waiting."""
+        return len(self._locks)
+
+    async def do_process_update(self, update, coroutine):
+        if self.profiler is not None and self.profiler.enabled:
+            coroutine = self.profiler.run(update, coroutine)
+        key = self.update_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = _KeyedLock()
+        entry.waiters += 1
+        try:
+            async with entry.lock:
+                async with self._running:
+                    await coroutine
+        finally:
+            entry.waiters -= 1
+            if not entry.waiters:
+                del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
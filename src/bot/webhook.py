@@ -0,0 +1,190 @@
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+from telegram import Update
+
+from ..config.settings import (
+    WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_MAX_BODY_BYTES
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    503: 'Service Unavailable',
+}
+
+
+class WebhookServer:
+    """Local HTTP endpoint that receives updates pushed by Telegram.
+
+    Each POST is checked against the secret token, decoded and put on a
+    bounded ingress queue, then acknowledged immediately. A worker hands
+    queued updates to the application's update processor. When the queue is
+    full the request is answered with 503, and Telegram retries it later.
+    """
+
+    def __init__(self, application, secret_token, host=WEBHOOK_LISTEN, port=WEBHOOK_PORT,
+                 path=WEBHOOK_PATH, queue_size=WEBHOOK_QUEUE_SIZE):
+        self.application = application
+        self.secret_token = secret_token
+        self.host = host
+        self.port = port
+        self.path = path
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self._slots = asyncio.Semaphore(queue_size)  # updates handed on but not finished
+        self._server = None
+        self._worker = None
+        self.received = 0
+        self.rejected = 0
+
+    async def start(self):
+        """Start listening and processing updates."""
+        self._worker = asyncio.create_task(self._process_updates())
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # Pick up the real port when listening on port 0
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Webhook server listening on {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        """Stop accepting updates and finish processing the queued ones."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._worker is not None:
+            await self.queue.join()
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def _process_updates(self):
+        while True:
+            data = await self.queue.get()
+            try:
+                update = Update.de_json(data, self.application.bot)
+            except Exception:
+                logger.exception("Error while decoding webhook update")
+                self.queue.task_done()
+                continue
+            # Not awaited: the update processor decides what runs concurrently.
+            # Tasks are started in arrival order, which keeps each user's updates in order.
+            await self._slots.acquire()
+            self.application.create_task(self._process_update(update), update=update)
+
+    async def _process_update(self, update):
+        try:
+            await self.application.update_processor.process_update(
+                update, self.application.process_update(update)
+            )
+        except Exception:
+            logger.exception("Error while processing webhook update")
+        finally:
+            self._slots.release()
+            self.queue.task_done()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                status, keep_alive = request
+                await self._respond(writer, status, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except ValueError:
+            # A request or header line longer than the stream limit
+            logger.debug("Dropped webhook connection with an overlong line")
+        except Exception:
+            logger.exception("Error while handling webhook connection")
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        """Read one request and return (status, keep_alive), or None at EOF."""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            return 400, False
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            return 400, False
+        if length < 0:
+            return 400, False
+        if length > WEBHOOK_MAX_BODY_BYTES:
+            return 413, False
+        body = await reader.readexactly(length) if length else b''
+
+        if target.split('?', 1)[0] != self.path:
+            return 404, keep_alive
+        if method != 'POST':
+            return 405, keep_alive
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, ''), self.secret_token):
+            self.rejected += 1
+            return 403, keep_alive
+
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return 400, keep_alive
+
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return 503, keep_alive
+        self.received += 1
+        return 200, keep_alive
+
+    async def _respond(self, writer, status, keep_alive):
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+            f"Content-Length: 0\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+        )
+        await writer.drain()
+
+
+async def start_webhook(application, url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, port=WEBHOOK_PORT):
+    """Start a WebhookServer for `application` and register `url` with Telegram, if set."""
+    secret_token = secret_token or secrets.token_urlsafe(32)
+    server = WebhookServer(application, secret_token, port=port)
+    await server.start()
+    if url:
+        await application.bot.set_webhook(url, secret_token=secret_token)
+        logger.info(f"Webhook registered at {url}")
+    else:
+        logger.warning("WEBHOOK_URL is not set; the webhook was not registered with Telegram")
+    return server
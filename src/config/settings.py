@@ -4,9 +4,17 @@ import os
 # Bot Token - Replace with your actual bot token from @BotFather
 BOT_TOKEN = os.getenv('BOT_TOKEN', '7112631389:AAGHH8YR-sUtqZXnI2nXZ6lfC2seB62J8kk')
 
+# Telegram user ids allowed to run operator commands such as /profile (comma-separated)
+ADMIN_USER_IDS = frozenset(int(uid) for uid in os.getenv('ADMIN_USER_IDS', '').split(',') if uid.strip())
+
 # Game Configuration
 INITIAL_CREDITS = 10000
 MIN_BET = 1
+AUTOPLAY_MAX_ROUNDS = int(os.getenv('AUTOPLAY_MAX_ROUNDS', '1000'))  # Rounds one /autoplay may play
+
+# Tournament rounds: seconds a round takes entries, and result messages queued per batch
+TOURNAMENT_WINDOW = int(os.getenv('TOURNAMENT_WINDOW', '60'))
+TOURNAMENT_NOTIFY_BATCH = int(os.getenv('TOURNAMENT_NOTIFY_BATCH', '500'))
 
 # Categories Configuration
 CATEGORIES = {
@@ -31,4 +39,90 @@ CATEGORIES = {
 }
 
 # Database Configuration
-DATABASE_PATH = 'data/game_bot.db' 
+DATABASE_PATH = 'data/game_bot.db'
+
+# SQLite tuning for the long-lived database connections (cache size is per connection)
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '16384'))
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+# Read-only connections beside the writer; 0 runs reads on the writer too
+DB_READ_POOL_SIZE = int(os.getenv('DB_READ_POOL_SIZE', str(min(4, os.cpu_count() or 1))))
+# A waiting history flush or maintenance write gets the writer after at most this many settlements
+DB_BACKGROUND_WRITE_AFTER = int(os.getenv('DB_BACKGROUND_WRITE_AFTER', '8'))
+
+
+# Write-behind batching for game_history inserts
+HISTORY_FLUSH_INTERVAL_MS = int(os.getenv('HISTORY_FLUSH_INTERVAL_MS', '50'))
+HISTORY_FLUSH_MAX_ROWS = int(os.getenv('HISTORY_FLUSH_MAX_ROWS', '500'))
+HISTORY_QUEUE_SIZE = int(os.getenv('HISTORY_QUEUE_SIZE', '10000'))
+HISTORY_PAGE_SIZE = 10  # Games per /history page
+
+# Retention: older game_history rows move to compressed archive files (0 keeps all history live)
+HISTORY_RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', '90'))
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', '')  # Default: 'archive' next to the database file
+ARCHIVE_INTERVAL = int(os.getenv('ARCHIVE_INTERVAL', '86400'))  # Seconds between compactions
+ARCHIVE_CHUNK_ROWS = 50000  # Rows read from the live table per archive write
+ARCHIVE_CACHE_MEMBERS = 4  # Decompressed archive members kept for /history paging
+
+# In-process cache of user records
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '100000'))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '300'))
+
+# Leaderboard: rows shown, plus extra users tracked in memory below the cut
+LEADERBOARD_SIZE = 10
+LEADERBOARD_SLACK = int(os.getenv('LEADERBOARD_SLACK', '40'))
+
+# Balances below this are ranked exactly by a Fenwick tree; higher ones in a sorted list
+RANK_INDEX_MAX_CREDITS = int(os.getenv('RANK_INDEX_MAX_CREDITS', str(1 << 20)))
+
+# Game sessions: seconds before an abandoned session expires, and a hard cap
+SESSION_TTL = int(os.getenv('SESSION_TTL', '900'))
+MAX_SESSIONS = int(os.getenv('MAX_SESSIONS', '500000'))
+
+# Session storage: 'memory' for a single process, 'sqlite' to share sessions between processes
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'memory')
+SESSION_DB_PATH = os.getenv('SESSION_DB_PATH', 'data/sessions.db')
+
+# Warm restart: on a clean shutdown, snapshot memory sessions, the user cache and the rank index
+WARM_RESTART = os.getenv('WARM_RESTART', 'true').lower() in ('1', 'true', 'yes')
+WARM_SNAPSHOT_PATH = os.getenv('WARM_SNAPSHOT_PATH', '')  # Default: the database path plus '.warm'
+
+# Update ingress: 'polling' (getUpdates) or 'webhook' (Telegram POSTs updates to us)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # Public HTTPS URL Telegram posts to
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # Generated at startup when empty
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+WEBHOOK_MAX_BODY_BYTES = 1024 * 1024
+
+# Updates handled at once; updates from the same user always run one at a time
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '64'))
+
+# Sharded deployment: with SHARD_COUNT > 1, an ingress process routes each user's updates to
+# worker process user_id % SHARD_COUNT; the workers share the database
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '1'))
+SHARD_QUEUE_SIZE = int(os.getenv('SHARD_QUEUE_SIZE', '10000'))  # Updates waiting per worker
+SHARD_REFRESH_INTERVAL = int(os.getenv('SHARD_REFRESH_INTERVAL', '30'))  # Seconds between leaderboard/rank reloads
+
+# Prometheus metrics endpoint on a local port (0 disables it)
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))
+
+# Update profiler: share of updates profiled, and updates at least this slow are always profiled.
+# Also switched on and off at runtime with /profile.
+PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0.01'))
+PROFILE_SLOW_MS = float(os.getenv('PROFILE_SLOW_MS', '500'))
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))  # Stack sampling period
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'data/profiles')
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '200'))  # Oldest dumps are deleted beyond this
+
+# Outbound sends: messages per second across all chats and within one chat (0 disables a limit)
+SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', '30'))
+SEND_GLOBAL_BURST = int(os.getenv('SEND_GLOBAL_BURST', '30'))
+SEND_CHAT_RATE = float(os.getenv('SEND_CHAT_RATE', '1'))
+SEND_CHAT_BURST = int(os.getenv('SEND_CHAT_BURST', '3'))
+SEND_MAX_IN_FLIGHT = int(os.getenv('SEND_MAX_IN_FLIGHT', '32'))
+SEND_QUEUE_SIZE = int(os.getenv('SEND_QUEUE_SIZE', '10000'))
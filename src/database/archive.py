@@ -0,0 +1,365 @@
+"""
+Retention for game_history: old rows move to compressed archive files.
+
+Rows older than HISTORY_RETENTION_DAYS are compacted, oldest first, into
+one append-only gzip file per calendar month under ARCHIVE_DIR. Every
+compaction run appends one gzip member per month it touches, and index.json
+records each member's byte range, id range and row count, and which users it
+holds: their ids, or a bloom filter of them for larger members, so a user's
+history is read from the members that can hold it only. Members indexed
+before user ids were recorded are always read. The archive
+always holds exactly the ids up to its max_id, so a run that died halfway
+is simply repeated: live rows up to max_id are deleted, and anything after
+it is archived again.
+
+The bot compacts every ARCHIVE_INTERVAL seconds; to compact by hand:
+
+    python -m src.database.archive             # compact now
+    python -m src.database.archive --days 30   # keep 30 days live
+"""
+
+import asyncio
+import base64
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from ..config.settings import (
+    ARCHIVE_DIR, ARCHIVE_INTERVAL, ARCHIVE_CHUNK_ROWS, ARCHIVE_CACHE_MEMBERS, DATABASE_PATH,
+    HISTORY_RETENTION_DAYS
+)
+from .pool import WRITE_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+HISTORY_COLUMNS = 'id, user_id, category, bet_amount, guessed_number, winning_number, won, payout, timestamp'
+# Live rows deleted per write transaction after a chunk is archived
+DELETE_BATCH = 5000
+# Members with more users than this index them in a bloom filter instead of a list
+USER_LIST_MAX = 1000
+BLOOM_BITS_PER_USER = 10  # About 1% false positives with BLOOM_HASHES
+BLOOM_HASHES = 7
+
+_MASK64 = (1 << 64) - 1
+
+
+def _bloom_positions(user_id, bits):
+    # splitmix64 of the user id, split into the two hashes of double hashing
+    x = (user_id + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    x ^= x >> 31
+    h1, h2 = x & 0xFFFFFFFF, (x >> 32) | 1
+    return [(h1 + i * h2) % bits for i in range(BLOOM_HASHES)]
+
+
+def user_index(user_ids):
+    """The index entry of a member holding rows of `user_ids`."""
+    user_ids = sorted(set(user_ids))
+    if len(user_ids) <= USER_LIST_MAX:
+        return {'users': user_ids}
+    bits = len(user_ids) * BLOOM_BITS_PER_USER
+    data = bytearray((bits + 7) // 8)
+    for user_id in user_ids:
+        for position in _bloom_positions(user_id, bits):
+            data[position >> 3] |= 1 << (position & 7)
+    return {'user_bloom': {'bits': bits, 'data': base64.b64encode(bytes(data)).decode('ascii')}}
+
+
+class HistoryArchive:
+    """Compressed, append-only store of archived game_history rows.
+
+    Rows are kept as JSON arrays in HISTORY_COLUMNS order, one per line.
+    """
+
+    INDEX = 'index.json'
+
+    def __init__(self, directory, cache_members=ARCHIVE_CACHE_MEMBERS):
+        self.directory = directory
+        self.cache_members = cache_members
+        self._cache = OrderedDict()  # (file, offset) -> {user_id: [rows]}
+        self._cache_lock = threading.Lock()
+        self._user_filters = {}  # (file, offset) -> set of user ids, or (bits, bloom filter bytes)
+        self._load_index()
+
+    @property
+    def max_id(self):
+        """Highest game_history id in the archive; every id up to it is archived."""
+        return self._index['max_id']
+
+    @property
+    def members(self):
+        return self._index['members']
+
+    def _load_index(self):
+        path = os.path.join(self.directory, self.INDEX)
+        try:
+            with open(path, encoding='utf-8') as fh:
+                self._index_mtime = os.fstat(fh.fileno()).st_mtime_ns
+                self._index = json.load(fh)
+        except FileNotFoundError:
+            self._index_mtime = None
+            self._index = {'max_id': 0, 'files': {}, 'members': []}
+
+    def refresh(self):
+        """Reload the index if another process (the compaction CLI) changed it."""
+        try:
+            mtime = os.stat(os.path.join(self.directory, self.INDEX)).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._index_mtime:
+            self._load_index()
+
+    def _save_index(self):
+        path = os.path.join(self.directory, self.INDEX)
+        temp = path + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as fh:
+            json.dump(self._index, fh, indent=1)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(temp, path)
+        self._index_mtime = os.stat(path).st_mtime_ns
+
+    def append(self, rows):
+        """Archive rows, which must continue the archive's id sequence in order.
+
+        Blocking; run it in a thread.
+        """
+        if not rows:
+            return
+        self.refresh()
+        os.makedirs(self.directory, exist_ok=True)
+        months = OrderedDict()
+        for row in rows:
+            months.setdefault(row[8][:7], []).append(row)
+
+        files = self._index['files']
+        for month, month_rows in months.items():
+            name = f"game_history-{month}.ndjson.gz"
+            path = os.path.join(self.directory, name)
+            data = gzip.compress(
+                ''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in month_rows).encode(),
+                compresslevel=6,
+            )
+            size = files.get(name, 0)
+            with open(path, 'ab') as fh:
+                # Drop the tail of a write the index never recorded
+                fh.truncate(size)
+                fh.write(data)
+                fh.flush()
+                os.fsync(fh.fileno())
+            files[name] = size + len(data)
+            self._index['members'].append({
+                'file': name,
+                'offset': size,
+                'length': len(data),
+                'rows': len(month_rows),
+                'min_id': month_rows[0][0],
+                'max_id': month_rows[-1][0],
+                'first': month_rows[0][8],
+                'last': month_rows[-1][8],
+                **user_index(row[1] for row in month_rows),
+            })
+        self._index['max_id'] = rows[-1][0]
+        self._save_index()
+
+    def read_member(self, member):
+        """All rows of one member. Blocking."""
+        with open(os.path.join(self.directory, member['file']), 'rb') as fh:
+            fh.seek(member['offset'])
+            data = gzip.decompress(fh.read(member['length']))
+        return [json.loads(line) for line in data.splitlines()]
+
+    def iter_rows(self):
+        """Every archived row in id order, one member in memory at a time. Blocking."""
+        for member in sorted(self.members, key=lambda member: member['min_id']):
+            yield from self.read_member(member)
+
+    def may_hold(self, member, user_id):
+        """False if the member holds no rows of the user; True may be a bloom filter false positive."""
+        key = (member['file'], member['offset'])
+        users = self._user_filters.get(key)
+        if users is None:
+            if 'users' in member:
+                users = set(member['users'])
+            elif 'user_bloom' in member:
+                bloom = member['user_bloom']
+                users = (bloom['bits'], base64.b64decode(bloom['data']))
+            else:
+                return True
+            self._user_filters[key] = users
+        if isinstance(users, set):
+            return user_id in users
+        bits, data = users
+        return all(data[position >> 3] & (1 << (position & 7)) for position in _bloom_positions(user_id, bits))
+
+    def _user_rows(self, member):
+        key = (member['file'], member['offset'])
+        with self._cache_lock:
+            by_user = self._cache.get(key)
+            if by_user is not None:
+                self._cache.move_to_end(key)
+                return by_user
+        by_user = {}
+        for row in self.read_member(member):
+            by_user.setdefault(row[1], []).append(row)
+        with self._cache_lock:
+            self._cache[key] = by_user
+            if len(self._cache) > self.cache_members:
+                self._cache.popitem(last=False)
+        return by_user
+
+    def user_history(self, user_id, before_id=None, after_id=None, limit=10):
+        """Up to `limit` archived rows of a user, nearest to the keyset bound first.
+
+        With `after_id`, rows after it in ascending id order; otherwise rows
+        before `before_id` (or the newest) in descending order. Blocking.
+        """
+        found = []
+        members = list(self.members)
+        if after_id is not None:
+            members = sorted((m for m in members if m['max_id'] > after_id and self.may_hold(m, user_id)),
+                             key=lambda member: member['min_id'])
+            for member in members:
+                found.extend(row for row in self._user_rows(member).get(user_id, ()) if row[0] > after_id)
+                if len(found) >= limit:
+                    break
+            found.sort()
+        else:
+            members = sorted((m for m in members
+                              if (before_id is None or m['min_id'] < before_id) and self.may_hold(m, user_id)),
+                             key=lambda member: member['max_id'], reverse=True)
+            for member in members:
+                found.extend(row for row in self._user_rows(member).get(user_id, ())
+                             if before_id is None or row[0] < before_id)
+                if len(found) >= limit:
+                    break
+            found.sort(reverse=True)
+        return found[:limit]
+
+
+class HistoryCompactor:
+    """Periodically moves game_history rows older than the retention window into the archive.
+
+    Rows are read through the database's reader pool; live rows are deleted,
+    and the WAL checkpointed, under the write lock at background priority in
+    short transactions, so settlement is never held up for long.
+    """
+
+    def __init__(self, database, archive, retention_days=HISTORY_RETENTION_DAYS,
+                 interval=ARCHIVE_INTERVAL, chunk_rows=ARCHIVE_CHUNK_ROWS):
+        self.db = database
+        self.archive = archive
+        self.retention_days = retention_days
+        self.interval = interval
+        self.chunk_rows = chunk_rows
+        self._task = None
+        self.rows_archived = 0
+
+    def start(self):
+        """Start compacting every `interval` seconds; a retention of 0 keeps all history live."""
+        if self._task is None and self.retention_days > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.compact()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("History compaction failed")
+            await asyncio.sleep(self.interval)
+
+    async def compact(self):
+        """Archive every row older than the retention window. Returns the number archived."""
+        cutoff = time.strftime('%Y-%m-%d %H:%M:%S',
+                               time.gmtime(time.time() - self.retention_days * 86400))
+        archive = self.archive
+        archive.refresh()
+        await self._delete_archived()
+
+        archived = 0
+        while True:
+            # The archive holds an id prefix: stop at the first row that is still recent
+            rows = await self.db._fetchall(
+                f'SELECT {HISTORY_COLUMNS} FROM game_history WHERE id > ? ORDER BY id LIMIT ?',
+                (archive.max_id, self.chunk_rows)
+            )
+            old = []
+            for row in rows:
+                if row[8] >= cutoff:
+                    break
+                old.append(row)
+            if not old:
+                break
+
+            await asyncio.to_thread(archive.append, old)
+            await self._delete_archived()
+            archived += len(old)
+            if len(old) < len(rows) or len(rows) < self.chunk_rows:
+                break
+
+        if archived:
+            self.rows_archived += archived
+            async with self.db._write_lock(WRITE_BACKGROUND):
+                async with self.db._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)'):
+                    pass
+            logger.info(f"Archived {archived} game_history rows up to id {archive.max_id}")
+        return archived
+
+    async def _delete_archived(self):
+        db = self.db._conn
+        while True:
+            async with self.db._write_lock(WRITE_BACKGROUND):
+                async with db.execute(
+                    'DELETE FROM game_history WHERE id IN '
+                    '(SELECT id FROM game_history WHERE id <= ? ORDER BY id LIMIT ?)',
+                    (self.archive.max_id, DELETE_BATCH)
+                ) as cursor:
+                    deleted = cursor.rowcount
+                await db.commit()
+            if deleted < DELETE_BATCH:
+                return
+
+
+async def _main():
+    import argparse
+    from .db_manager import GameDatabase
+
+    parser = argparse.ArgumentParser(description="Compact old game history into the archive")
+    parser.add_argument('--db', default=DATABASE_PATH)
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR,
+                        help="default: 'archive' next to the database file")
+    parser.add_argument('--days', type=float, default=HISTORY_RETENTION_DAYS,
+                        help="days of history to keep in the live database")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    database = GameDatabase(args.db, archive_dir=args.archive_dir)
+    await database.open()
+    try:
+        archive = database.archive
+        archived = await HistoryCompactor(database, archive, args.days).compact()
+        print(f"archived {archived} rows; archive now holds ids up to {archive.max_id} "
+              f"in {len(archive.members)} members")
+    finally:
+        await database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,132 +1,730 @@
-import aiosqlite
+import asyncio
+import os
+from array import array
+import time
 import logging
-from ..config.settings import DATABASE_PATH, INITIAL_CREDITS
+from ..config.settings import (
+    DATABASE_PATH, INITIAL_CREDITS, DB_READ_POOL_SIZE,
+    HISTORY_FLUSH_INTERVAL_MS, HISTORY_FLUSH_MAX_ROWS, HISTORY_QUEUE_SIZE, HISTORY_PAGE_SIZE, ARCHIVE_DIR
+)
+from ..monitoring.instruments import DB_QUERY_LATENCY, DB_QUERY_ERRORS, timed_query
+from .archive import HistoryArchive, HistoryCompactor
+from .leaderboard import Leaderboard
+from .migrations import migrate
+from .pool import WRITE_BACKGROUND, ReaderPool, WriteLock, connect
+from .rank_index import CreditRankIndex
+from .user_cache import UserCache, UserRecord
 
 logger = logging.getLogger(__name__)
 
+HISTORY_INSERT_SQL = '''
+    INSERT INTO game_history
+    (user_id, category, bet_amount, guessed_number, winning_number, won, payout, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+ROLLUP_UPSERT_SQL = '''
+    INSERT INTO user_category_stats (user_id, category, games, wins, wagered, payout)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, category) DO UPDATE SET
+        games = games + excluded.games,
+        wins = wins + excluded.wins,
+        wagered = wagered + excluded.wagered,
+        payout = payout + excluded.payout
+'''
+
+_STOP = object()
+
+RANK_SCAN_CHUNK_ROWS = 50000  # Users read per query while building the rank index
+
+
+def history_timestamp():
+    """Current UTC time in the same format as SQLite's CURRENT_TIMESTAMP."""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+
+async def write_history(conn, rows):
+    """Insert game_history rows and fold them into the per-category rollups.
+
+    Runs inside the caller's transaction, so the rollups always match the
+    history. Rows are in HISTORY_INSERT_SQL column order.
+    """
+    await conn.executemany(HISTORY_INSERT_SQL, rows)
+    rollups = {}
+    for user_id, category, bet_amount, _, _, won, payout, _ in rows:
+        key = (user_id, category)
+        totals = rollups.get(key)
+        if totals is None:
+            rollups[key] = [1, 1 if won else 0, bet_amount, payout]
+        else:
+            totals[0] += 1
+            totals[1] += 1 if won else 0
+            totals[2] += bet_amount
+            totals[3] += payout
+    await conn.executemany(ROLLUP_UPSERT_SQL, [key + tuple(totals) for key, totals in rollups.items()])
+
+
+class HistoryWriter:
+    """Write-behind queue that group-commits game_history rows.
+
+    Rows are flushed with a single executemany per transaction once
+    HISTORY_FLUSH_MAX_ROWS are waiting or HISTORY_FLUSH_INTERVAL_MS after the
+    first row of a batch arrived, whichever comes first. The queue is bounded,
+    so producers wait when the writer falls behind.
+    """
+
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, database, flush_interval_ms=HISTORY_FLUSH_INTERVAL_MS,
+                 max_rows=HISTORY_FLUSH_MAX_ROWS, queue_size=HISTORY_QUEUE_SIZE):
+        self.db = database
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_rows = max_rows
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._task = None
+        # Rows queued and rows handled so far; the queue is FIFO, so row n is
+        # handled once _handled >= n. Flushes wait on _progress for their row.
+        self._queued = 0
+        self._handled = 0
+        self._latest = {}  # user_id -> number of the user's last row not handled yet
+        self._progress = asyncio.Condition()
+        self.rows_written = 0
+        self.batches_written = 0
+
+    @property
+    def pending(self):
+        """Number of rows waiting to be written."""
+        return self._queue.qsize()
+
+    def start(self):
+        """Start the background flush task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, row):
+        """Queue a game_history row, waiting if the queue is full."""
+        await self._queue.put(row)
+        self._queued += 1
+        self._latest[row[0]] = self._queued
+
+    async def flush(self, user_id=None):
+        """Wait until the rows queued before the call have been committed.
+
+        With a user_id, only that user's rows are waited for. Rows queued
+        later are not, so a flush returns under steady load.
+        """
+        if self._task is None:
+            return
+        target = self._queued if user_id is None else self._latest.get(user_id, 0)
+        if self._handled >= target:
+            return
+        async with self._progress:
+            await self._progress.wait_for(lambda: self._handled >= target)
+
+    async def stop(self):
+        """Drain the queue and stop the flush task."""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_rows:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    self._queue.task_done()
+                    break
+                batch.append(item)
+
+            await self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+            self._handled += len(batch)
+            for row in batch:
+                if self._latest.get(row[0], 0) <= self._handled:
+                    self._latest.pop(row[0], None)
+            async with self._progress:
+                self._progress.notify_all()
+
+    async def _write(self, batch):
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            start = time.perf_counter()
+            try:
+                # Settlements waiting for the writer go first
+                async with self.db._write_lock(WRITE_BACKGROUND):
+                    await write_history(self.db._conn, batch)
+                    await self.db._conn.commit()
+                DB_QUERY_LATENCY.labels('history_flush').observe(time.perf_counter() - start)
+                self.rows_written += len(batch)
+                self.batches_written += 1
+                return
+            except Exception:
+                DB_QUERY_ERRORS.labels('history_flush').inc()
+                logger.exception(f"Failed to write {len(batch)} history rows (attempt {attempt})")
+                try:
+                    await self.db._conn.rollback()
+                except Exception:
+                    pass
+                await asyncio.sleep(0.1 * attempt)
+        logger.error(f"Dropped {len(batch)} history rows after {self.MAX_ATTEMPTS} attempts")
+
+
 class GameDatabase:
-    def __init__(self, db_path=DATABASE_PATH):
+    def __init__(self, db_path=DATABASE_PATH, archive_dir=ARCHIVE_DIR, shard=None,
+                 read_pool_size=DB_READ_POOL_SIZE):
         self.db_path = db_path
-    
-    async def init_db(self):
-        """Initialize the database and create tables if they don't exist."""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(f'''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    credits INTEGER DEFAULT {INITIAL_CREDITS},
-                    games_played INTEGER DEFAULT 0,
-                    games_won INTEGER DEFAULT 0,
-                    total_wagered INTEGER DEFAULT 0,
-                    total_winnings INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS game_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    category TEXT,
-                    bet_amount INTEGER,
-                    guessed_number INTEGER,
-                    winning_number INTEGER,
-                    won BOOLEAN,
-                    payout INTEGER,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
-            
+        # (index, count) in a sharded deployment, whose workers share the database file
+        self.shard = shard
+        # The writer connection. Reads go to the reader pool, or here if it is empty.
+        self._conn = None
+        self.readers = ReaderPool(db_path, read_pool_size)
+        # aiosqlite runs every statement on the connection's own thread, but
+        # separate coroutines can still interleave statements of their
+        # transactions; writers take this lock for the whole transaction.
+        self._write_lock = WriteLock()
+        self.history_writer = HistoryWriter(self)
+        self.archive = HistoryArchive(archive_dir or os.path.join(os.path.dirname(db_path), 'archive'))
+        self.compactor = HistoryCompactor(self, self.archive)
+        self.user_cache = UserCache()
+        self.leaderboard = Leaderboard()
+        self.rank_index = CreditRankIndex()
+
+    async def open(self):
+        """Open the connections only, for tools that run next to a live bot."""
+        if self._conn is None:
+            self._conn = await connect(self.db_path)
+            await self.readers.open()
+
+    @property
+    def writes_waiting(self):
+        """Write transactions queued for the writer connection."""
+        return self._write_lock.pending
+
+    @property
+    def writer_busy(self):
+        """Whether a write transaction holds the writer connection."""
+        return self._write_lock.locked()
+
+    async def _fetchall(self, sql, parameters=()):
+        """Run a read query outside any write transaction.
+
+        On the writer it runs as a single call on the connection's thread. A
+        statement left open between calls holds a read transaction, and a
+        write landing in between then fails at once if another process holds
+        the database lock.
+        """
+        if self.readers.size:
+            return await self.readers.fetchall(sql, parameters)
+        return await self._conn.execute_fetchall(sql, parameters)
+
+    async def init_db(self, warm=None):
+        """Open the connections, migrate the schema and load the in-memory indexes.
+
+        `warm` is a WarmSnapshot taken at the last clean shutdown; its rank
+        index and user cache are used instead of scanning the users table.
+        """
+        await self.open()
+        db = self._conn
+
+        async with self._write_lock:
+            await migrate(db)
+            refunded = await self._refund_tournament_entries()
             await db.commit()
-            logger.info("Database initialized successfully")
-    
+        await self._reload_leaderboard()
+        if warm is not None and not refunded and warm.restore_rank_index(self.rank_index):
+            warm.restore_user_cache(self.user_cache)
+        else:
+            await self._build_rank_index()
+            logger.info(f"Rank index built over {self.rank_index.total} users")
+        self.history_writer.start()
+        logger.info("Database initialized successfully")
+
+    async def close(self):
+        """Drain pending history writes and close the connections, the writer last."""
+        if self._conn is None:
+            return
+        await self.compactor.stop()
+        await self.history_writer.stop()
+        await self.readers.close()
+        async with self._write_lock:
+            await self._conn.close()
+            self._conn = None
+        logger.info("Database connection closed")
+
+    @timed_query
     async def get_user(self, user_id: int, username: str = None):
         """Get user data or create new user if doesn't exist."""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)) as cursor:
-                user = await cursor.fetchone()
-            
+        record = self.user_cache.get(user_id)
+        if record is not None:
+            return record
+
+        read_seq = self.user_cache.begin_read(user_id)
+        try:
+            db = self._conn
+            rows = await self._fetchall('SELECT * FROM users WHERE user_id = ?', (user_id,))
+            user = rows[0] if rows else None
+
             if user is None:
                 # Create new user
-                await db.execute(
-                    'INSERT INTO users (user_id, username, credits) VALUES (?, ?, ?)',
-                    (user_id, username, INITIAL_CREDITS)
-                )
-                await db.commit()
+                async with self._write_lock:
+                    async with db.execute(
+                        'INSERT OR IGNORE INTO users (user_id, username, credits) VALUES (?, ?, ?)',
+                        (user_id, username, INITIAL_CREDITS)
+                    ) as cursor:
+                        created = cursor.rowcount == 1
+                    await db.commit()
+                    if not created:
+                        # A concurrent call created the user first
+                        async with db.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)) as cursor:
+                            user = await cursor.fetchone()
+
+            if user is None:
                 logger.info(f"Created new user: {user_id} ({username})")
-                return {
-                    'user_id': user_id,
-                    'username': username,
-                    'credits': INITIAL_CREDITS,
-                    'games_played': 0,
-                    'games_won': 0,
-                    'total_wagered': 0,
-                    'total_winnings': 0
-                }
-            
-            return {
-                'user_id': user[0],
-                'username': user[1],
-                'credits': user[2],
-                'games_played': user[3],
-                'games_won': user[4],
-                'total_wagered': user[5],
-                'total_winnings': user[6]
-            }
-    
+                record = UserRecord(user_id, username, INITIAL_CREDITS)
+                await self._user_changed(user_id, username, None, INITIAL_CREDITS, 0, 0)
+            else:
+                record = UserRecord.from_row(user)
+
+            self.user_cache.put(record, read_seq)
+        finally:
+            self.user_cache.end_read(user_id)
+        return record
+
+    @timed_query
     async def update_credits(self, user_id: int, new_credits: int):
         """Update user's credits."""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                'UPDATE users SET credits = ? WHERE user_id = ?',
+        async with self._write_lock:
+            async with self._conn.execute(
+                'SELECT credits FROM users WHERE user_id = ?', (user_id,)
+            ) as cursor:
+                old = await cursor.fetchone()
+            async with self._conn.execute(
+                'UPDATE users SET credits = ? WHERE user_id = ? '
+                'RETURNING username, games_played, games_won',
                 (new_credits, user_id)
-            )
-            await db.commit()
-    
-    async def record_game(self, user_id: int, category: str, bet_amount: int, 
+            ) as cursor:
+                row = await cursor.fetchone()
+            await self._conn.commit()
+
+        record = self.user_cache.for_update(user_id)
+        if record is not None:
+            record.credits = new_credits
+        if row is not None:
+            await self._user_changed(user_id, row[0], old[0], new_credits, row[1], row[2])
+
+    @timed_query
+    async def record_game(self, user_id: int, category: str, bet_amount: int,
                          guessed_number: int, winning_number: int, won: bool, payout: int):
         """Record a game in the history and update user stats."""
-        async with aiosqlite.connect(self.db_path) as db:
+        db = self._conn
+        async with self._write_lock:
             # Record game history
-            await db.execute('''
-                INSERT INTO game_history 
-                (user_id, category, bet_amount, guessed_number, winning_number, won, payout)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (user_id, category, bet_amount, guessed_number, winning_number, won, payout))
-            
+            await write_history(db, [(user_id, category, bet_amount, guessed_number, winning_number,
+                                      won, payout, history_timestamp())])
+
             # Update user stats
             games_won_increment = 1 if won else 0
             total_winnings_increment = payout if won else 0
-            
-            await db.execute('''
-                UPDATE users SET 
+
+            async with db.execute('''
+                UPDATE users SET
                     games_played = games_played + 1,
                     games_won = games_won + ?,
                     total_wagered = total_wagered + ?,
                     total_winnings = total_winnings + ?
                 WHERE user_id = ?
-            ''', (games_won_increment, bet_amount, total_winnings_increment, user_id))
-            
+                RETURNING username, credits, games_played, games_won
+            ''', (games_won_increment, bet_amount, total_winnings_increment, user_id)) as cursor:
+                row = await cursor.fetchone()
+
+            await db.commit()
+
+        record = self.user_cache.for_update(user_id)
+        if record is not None:
+            record.games_played += 1
+            record.games_won += games_won_increment
+            record.total_wagered += bet_amount
+            record.total_winnings += total_winnings_increment
+        if row is not None:
+            username, credits, games_played, games_won = row
+            await self._user_changed(user_id, username, credits, credits, games_played, games_won)
+
+    @timed_query
+    async def settle_game(self, user_id: int, category: str, bet_amount: int,
+                          guessed_number: int, winning_number: int, won: bool, payout: int):
+        """Settle a finished game in a single transaction.
+
+        The balance is changed relative to its current value and only if it
+        still covers the bet, so concurrent settlements cannot lose updates.
+        The game_history row is handed to the write-behind queue.
+        Returns the new balance, or None if the user can't cover the bet.
+        """
+        db = self._conn
+        async with self._write_lock:
+            async with db.execute('''
+                UPDATE users SET
+                    credits = credits - ? + ?,
+                    games_played = games_played + 1,
+                    games_won = games_won + ?,
+                    total_wagered = total_wagered + ?,
+                    total_winnings = total_winnings + ?
+                WHERE user_id = ? AND credits >= ?
+                RETURNING credits, games_played, games_won, total_wagered, total_winnings, username
+            ''', (bet_amount, payout, 1 if won else 0, bet_amount, payout,
+                  user_id, bet_amount)) as cursor:
+                row = await cursor.fetchone()
+
+            if row is None:
+                await db.rollback()
+                return None
+
+            await db.commit()
+
+        credits = await self._settled(user_id, row, payout - bet_amount)
+
+        await self.history_writer.put((
+            user_id, category, bet_amount, guessed_number, winning_number, won, payout,
+            history_timestamp()
+        ))
+        return credits
+
+    @timed_query
+    async def settle_batch(self, user_id: int, category: str, games, required_credits: int):
+        """Settle a sequence of games played back to back in a single transaction.
+
+        `games` holds (bet_amount, guessed_number, winning_number, won, payout)
+        tuples in play order. `required_credits` is the lowest starting
+        balance that covers every bet of the sequence; the batch is settled
+        in full only if the balance is still at least that, or not at all.
+        The game_history rows are written in the same transaction.
+        Returns the new balance, or None if the balance no longer suffices.
+        """
+        wagered = sum(game[0] for game in games)
+        winnings = sum(game[4] for game in games)
+        wins = sum(1 for game in games if game[3])
+        timestamp = history_timestamp()
+        history = [
+            (user_id, category, bet_amount, guessed_number, winning_number, won, payout, timestamp)
+            for bet_amount, guessed_number, winning_number, won, payout in games
+        ]
+
+        db = self._conn
+        async with self._write_lock:
+            try:
+                async with db.execute('''
+                    UPDATE users SET
+                        credits = credits - ? + ?,
+                        games_played = games_played + ?,
+                        games_won = games_won + ?,
+                        total_wagered = total_wagered + ?,
+                        total_winnings = total_winnings + ?
+                    WHERE user_id = ? AND credits >= ?
+                    RETURNING credits, games_played, games_won, total_wagered, total_winnings, username
+                ''', (wagered, winnings, len(games), wins, wagered, winnings,
+                      user_id, required_credits)) as cursor:
+                    row = await cursor.fetchone()
+
+                if row is None:
+                    await db.rollback()
+                    return None
+
+                await write_history(db, history)
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+
+        return await self._settled(user_id, row, winnings - wagered)
+
+    @timed_query
+    async def escrow_tournament_bet(self, round_id: int, user_id: int, category: str,
+                                    guess: int, bet_amount: int):
+        """Take a tournament bet from the balance and record the entry.
+
+        Returns the new balance, or None if the user can't cover the bet.
+        """
+        db = self._conn
+        async with self._write_lock:
+            async with db.execute('''
+                UPDATE users SET credits = credits - ?
+                WHERE user_id = ? AND credits >= ?
+                RETURNING credits, games_played, games_won, total_wagered, total_winnings, username
+            ''', (bet_amount, user_id, bet_amount)) as cursor:
+                row = await cursor.fetchone()
+
+            if row is None:
+                await db.rollback()
+                return None
+
+            await db.execute(
+                'INSERT INTO tournament_entries (round_id, user_id, category, guess, bet_amount) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (round_id, user_id, category, guess, bet_amount)
+            )
             await db.commit()
-    
+
+        return await self._settled(user_id, row, -bet_amount)
+
+    @timed_query
+    async def settle_tournament(self, round_id: int, games, payouts):
+        """Settle every escrowed entry of a tournament round in one transaction.
+
+        `games` holds one (user_id, category, bet_amount, guessed_number,
+        winning_number, won, payout) tuple per entry and `payouts` maps the
+        winners' user ids to their payouts. Bets were taken from the balances
+        at entry; here every entrant's stats are updated in one set-based
+        UPDATE, the winners are paid, and the history rows are written.
+        Returns {user_id: new balance}.
+        """
+        timestamp = history_timestamp()
+        db = self._conn
+        async with self._write_lock:
+            try:
+                await db.execute('''
+                    UPDATE users SET
+                        games_played = games_played + 1,
+                        total_wagered = total_wagered + e.bet_amount
+                    FROM tournament_entries AS e
+                    WHERE e.round_id = ? AND users.user_id = e.user_id
+                ''', (round_id,))
+                await db.executemany('''
+                    UPDATE users SET
+                        credits = credits + ?,
+                        games_won = games_won + 1,
+                        total_winnings = total_winnings + ?
+                    WHERE user_id = ?
+                ''', [(payout, payout, user_id) for user_id, payout in payouts.items()])
+                await write_history(db, [game + (timestamp,) for game in games])
+
+                async with db.execute('''
+                    SELECT u.user_id, u.credits, u.games_played, u.games_won,
+                           u.total_wagered, u.total_winnings, u.username
+                    FROM tournament_entries AS e JOIN users AS u ON u.user_id = e.user_id
+                    WHERE e.round_id = ?
+                ''', (round_id,)) as cursor:
+                    rows = await cursor.fetchall()
+
+                await db.execute('DELETE FROM tournament_entries WHERE round_id = ?', (round_id,))
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise
+
+        balances = {}
+        for row in rows:
+            user_id = row[0]
+            balances[user_id] = await self._settled(user_id, row[1:], payouts.get(user_id, 0))
+        return balances
+
+    async def _refund_tournament_entries(self):
+        """Give back bets of tournament rounds a previous run left unsettled; returns the users refunded."""
+        db = self._conn
+        # A shard worker only refunds its own users; other workers' rounds may still be open
+        index, count = self.shard or (0, 1)
+        async with db.execute('''
+            UPDATE users SET credits = credits + r.amount
+            FROM (SELECT user_id, SUM(bet_amount) AS amount
+                  FROM tournament_entries WHERE user_id % ? = ? GROUP BY user_id) AS r
+            WHERE users.user_id = r.user_id
+        ''', (count, index)) as cursor:
+            refunded = cursor.rowcount
+        await db.execute('DELETE FROM tournament_entries WHERE user_id % ? = ?', (count, index))
+        if refunded > 0:
+            logger.warning(f"Refunded unsettled tournament bets to {refunded} users")
+        return refunded
+
+    async def _settled(self, user_id, row, net):
+        """Write a settlement's RETURNING row through to the cache and indexes.
+
+        `net` is the change of the balance. Returns the new balance.
+        """
+        credits, games_played, games_won, total_wagered, total_winnings, username = row
+        record = self.user_cache.for_update(user_id)
+        if record is not None:
+            record.credits = credits
+            record.games_played = games_played
+            record.games_won = games_won
+            record.total_wagered = total_wagered
+            record.total_winnings = total_winnings
+        await self._user_changed(user_id, username, credits - net, credits, games_played, games_won)
+        return credits
+
+    async def get_meta(self, key: str):
+        """Get a value stored in the meta table, or None."""
+        rows = await self._fetchall('SELECT value FROM meta WHERE key = ?', (key,))
+        return rows[0][0] if rows else None
+
+    async def set_meta(self, key: str, value: str):
+        """Store a value in the meta table."""
+        async with self._write_lock(WRITE_BACKGROUND):
+            await self._conn.execute(
+                'INSERT INTO meta (key, value) VALUES (?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET value = excluded.value',
+                (key, value)
+            )
+            await self._conn.commit()
+
+    @timed_query
     async def get_user_stats(self, user_id: int):
         """Get detailed user statistics."""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute('''
-                SELECT credits, games_played, games_won, total_wagered, total_winnings
-                FROM users WHERE user_id = ?
-            ''', (user_id,)) as cursor:
-                return await cursor.fetchone()
-    
+        record = self.user_cache.get(user_id)
+        if record is not None:
+            return record.stats()
+
+        rows = await self._fetchall('''
+            SELECT credits, games_played, games_won, total_wagered, total_winnings
+            FROM users WHERE user_id = ?
+        ''', (user_id,))
+        return rows[0] if rows else None
+
+    @timed_query
+    async def get_category_stats(self, user_id: int):
+        """Get a user's (category, games, wins, wagered, payout) rollups."""
+        await self.history_writer.flush(user_id)
+        return list(await self._fetchall('''
+            SELECT category, games, wins, wagered, payout
+            FROM user_category_stats WHERE user_id = ?
+        ''', (user_id,)))
+
+    @timed_query
+    async def get_history(self, user_id: int, before_id: int = None, after_id: int = None,
+                          limit: int = HISTORY_PAGE_SIZE):
+        """Get a page of a user's games, newest first.
+
+        Pages are addressed by keyset: games older than `before_id`, or the
+        `limit` games right after `after_id`, or else the latest ones. Games
+        compacted out of game_history are read from the archive. Returns
+        (rows, has_older, has_newer); rows are (id, category, bet_amount,
+        guessed_number, winning_number, won, payout, timestamp).
+        """
+        await self.history_writer.flush(user_id)
+        # Ids up to archived_upto live in the archive, later ones in game_history
+        self.archive.refresh()
+        archived_upto = self.archive.max_id
+        if after_id is not None:
+            rows = []
+            if after_id < archived_upto:
+                rows = await self._archived_history(user_id, after_id=after_id, limit=limit + 1)
+            if len(rows) <= limit:
+                rows += await self._live_history(user_id, max(after_id, archived_upto), None, False,
+                                                 limit + 1 - len(rows))
+            more = len(rows) > limit
+            rows = rows[:limit]
+            rows.reverse()
+            return rows, True, more
+
+        rows = []
+        if before_id is None or before_id > archived_upto:
+            rows = await self._live_history(user_id, archived_upto, before_id, True, limit + 1)
+        if len(rows) <= limit and archived_upto:
+            before_archived = archived_upto + 1 if before_id is None else min(before_id, archived_upto + 1)
+            rows += await self._archived_history(user_id, before_id=before_archived,
+                                                 limit=limit + 1 - len(rows))
+        more = len(rows) > limit
+        return rows[:limit], more, before_id is not None
+
+    async def _live_history(self, user_id, after_id, before_id, newest_first, limit):
+        where, params = 'user_id = ? AND id > ?', [user_id, after_id]
+        if before_id is not None:
+            where += ' AND id < ?'
+            params.append(before_id)
+        query = f'''
+            SELECT id, category, bet_amount, guessed_number, winning_number, won, payout, timestamp
+            FROM game_history WHERE {where}
+            ORDER BY id {'DESC' if newest_first else ''} LIMIT ?
+        '''
+        return list(await self._fetchall(query, (*params, limit)))
+
+    async def _archived_history(self, user_id, before_id=None, after_id=None, limit=HISTORY_PAGE_SIZE):
+        rows = await asyncio.to_thread(self.archive.user_history, user_id, before_id, after_id, limit)
+        # Archived rows carry user_id as their second column
+        return [(row[0], *row[2:]) for row in rows]
+
+    @timed_query
     async def get_leaderboard(self, limit: int = 10):
         """Get top users by credits."""
-        async with aiosqlite.connect(self.db_path) as db:
-            async with db.execute('''
-                SELECT username, credits, games_played, games_won
-                FROM users 
-                ORDER BY credits DESC 
-                LIMIT ?
-            ''', (limit,)) as cursor:
-                return await cursor.fetchall() 
+        if limit <= self.leaderboard.size:
+            return self.leaderboard.top()[:limit]
+
+        return list(await self._fetchall('''
+            SELECT username, credits, games_played, games_won
+            FROM users
+            ORDER BY credits DESC, user_id
+            LIMIT ?
+        ''', (limit,)))
+
+    @timed_query
+    async def get_rank(self, user_id: int, username: str = None):
+        """Get a user's balance, 1-based rank by credits and the number of ranked users."""
+        user = await self.get_user(user_id, username)
+        return user.credits, self.rank_index.rank(user.credits), self.rank_index.total
+
+    async def _user_changed(self, user_id, username, old_credits, credits, games_played, games_won):
+        """Propagate a committed change of a user row to the in-memory indexes.
+
+        `old_credits` is None for a newly created user.
+        """
+        if old_credits is None:
+            self.rank_index.add(credits)
+        else:
+            self.rank_index.move(old_credits, credits)
+        self.leaderboard.update(user_id, username, credits, games_played, games_won)
+        if self.leaderboard.needs_reload:
+            await self._reload_leaderboard()
+
+    async def _reload_leaderboard(self):
+        """Rebuild the in-memory leaderboard from the covering index."""
+        rows = await self._fetchall('''
+            SELECT user_id, username, credits, games_played, games_won
+            FROM users
+            ORDER BY credits DESC, user_id
+            LIMIT ?
+        ''', (self.leaderboard.capacity,))
+        self.leaderboard.load(rows)
+
+    async def _build_rank_index(self):
+        """Rebuild the credit rank index from every user's balance."""
+        balances = array('q')
+        last = -1
+        # In keyset chunks, so the scan does not keep a connection to itself
+        while True:
+            rows = await self._fetchall(
+                'SELECT user_id, credits FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?',
+                (last, RANK_SCAN_CHUNK_ROWS)
+            )
+            balances.extend(row[1] for row in rows)
+            if len(rows) < RANK_SCAN_CHUNK_ROWS:
+                break
+            last = rows[-1][0]
+        self.rank_index.build(balances)
+
+    async def refresh_indexes(self):
+        """Reload the leaderboard and rebuild the rank index from the users table.
+
+        For processes sharing the database, whose indexes otherwise only
+        follow their own writes. Balance changes made here during the
+        rebuild show in ranks again after the next refresh.
+        """
+        await self._reload_leaderboard()
+        await self._build_rank_index()
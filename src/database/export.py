@@ -0,0 +1,188 @@
+"""
+Streaming export of users and game_history for offline analysis.
+
+Rows are read in keyset-paginated chunks through async generators and
+written as they arrive, so memory stays flat however large the tables are.
+Every chunk is its own short read; nothing takes the write lock, so
+exporting next to a running bot does not hold up settlement.
+
+    python -m src.database.export history -o history.ndjson.gz --since 2026-01-01 --category hard
+    python -m src.database.export history --format csv --include-archive -o history.csv
+    python -m src.database.export users --format csv -o users.csv
+"""
+
+import argparse
+import asyncio
+import csv
+import gzip
+import json
+import logging
+import sys
+import time
+from datetime import datetime
+
+from ..config.settings import ARCHIVE_DIR, CATEGORIES, DATABASE_PATH
+from .archive import HISTORY_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+USER_COLUMNS = ('user_id', 'username', 'credits', 'games_played', 'games_won',
+                'total_wagered', 'total_winnings', 'created_at')
+HISTORY_FIELDS = tuple(HISTORY_COLUMNS.split(', '))
+EXPORT_CHUNK_ROWS = 5000
+
+
+def _filters(column, since, until, categories):
+    where, params = [], []
+    if since is not None:
+        where.append(f'{column} >= ?')
+        params.append(since)
+    if until is not None:
+        where.append(f'{column} < ?')
+        params.append(until)
+    if categories:
+        where.append(f"category IN ({', '.join('?' * len(categories))})")
+        params.extend(categories)
+    return ''.join(f' AND {condition}' for condition in where), params
+
+
+async def _chunks(database, query, params, chunk_rows, after=-1):
+    """Run a keyset query (first parameter: the last key seen) chunk by chunk."""
+    last = after
+    while True:
+        rows = await database._fetchall(query, (last, *params, chunk_rows))
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+        if len(rows) < chunk_rows:
+            return
+
+
+async def iter_users(database, since=None, until=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield chunks of users rows, by user_id, optionally by creation time."""
+    where, params = _filters('created_at', since, until, None)
+    query = f'''
+        SELECT {', '.join(USER_COLUMNS)} FROM users
+        WHERE user_id > ?{where} ORDER BY user_id LIMIT ?
+    '''
+    async for rows in _chunks(database, query, params, chunk_rows):
+        yield rows
+
+
+async def iter_history(database, since=None, until=None, categories=None, include_archive=False,
+                       chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield chunks of game_history rows in id order, archived games first if asked.
+
+    `since` and `until` are 'YYYY-MM-DD HH:MM:SS' UTC bounds, `until` exclusive.
+    """
+    archive = database.archive
+    archive.refresh()
+    archived_upto = archive.max_id
+    if include_archive:
+        for member in sorted(archive.members, key=lambda member: member['min_id']):
+            # Skip members wholly outside the time range without reading them
+            if since is not None and member['last'] < since:
+                continue
+            if until is not None and member['first'] >= until:
+                continue
+            rows = await asyncio.to_thread(archive.read_member, member)
+            rows = [
+                row for row in rows
+                if (since is None or row[8] >= since) and (until is None or row[8] < until)
+                and (not categories or row[2] in categories)
+            ]
+            if rows:
+                yield rows
+
+    where, params = _filters('timestamp', since, until, categories)
+    query = f'''
+        SELECT {HISTORY_COLUMNS} FROM game_history
+        WHERE id > ?{where} ORDER BY id LIMIT ?
+    '''
+    async for rows in _chunks(database, query, params, chunk_rows, after=archived_upto):
+        yield rows
+
+
+async def write_ndjson(chunks, columns, fh):
+    """Write row chunks as one JSON object per line. Returns the row count."""
+    count = 0
+    async for rows in chunks:
+        fh.write(''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows))
+        count += len(rows)
+    return count
+
+
+async def write_csv(chunks, columns, fh):
+    """Write row chunks as CSV with a header line. Returns the row count."""
+    writer = csv.writer(fh)
+    writer.writerow(columns)
+    count = 0
+    async for rows in chunks:
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+def _timestamp(value):
+    """Normalize an ISO date or datetime to the stored 'YYYY-MM-DD HH:MM:SS' form."""
+    try:
+        return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not an ISO date or datetime: {value!r}")
+
+
+def _open_output(path, compress):
+    if path == '-':
+        if compress:
+            return gzip.open(sys.stdout.buffer, 'wt', encoding='utf-8', newline='')
+        return open(sys.stdout.fileno(), 'w', encoding='utf-8', newline='', closefd=False)
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+async def _main():
+    from .db_manager import GameDatabase
+
+    parser = argparse.ArgumentParser(description="Stream users or game history to NDJSON or CSV")
+    parser.add_argument('table', choices=('history', 'users'))
+    parser.add_argument('-o', '--output', default='-', help="output file, '-' for stdout")
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+    parser.add_argument('--gzip', action='store_true', help="compress; implied by a .gz output name")
+    parser.add_argument('--since', type=_timestamp, help="first date/time included (UTC)")
+    parser.add_argument('--until', type=_timestamp, help="first date/time excluded (UTC)")
+    parser.add_argument('--category', action='append', choices=list(CATEGORIES),
+                        help="only these categories (history; repeatable)")
+    parser.add_argument('--include-archive', action='store_true',
+                        help="also export games compacted into the archive (history)")
+    parser.add_argument('--db', default=DATABASE_PATH)
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    parser.add_argument('--chunk-rows', type=int, default=EXPORT_CHUNK_ROWS)
+    args = parser.parse_args()
+    if args.table == 'users' and (args.category or args.include_archive):
+        parser.error("--category and --include-archive apply to history only")
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    database = GameDatabase(args.db, archive_dir=args.archive_dir)
+    await database.open()
+    start = time.perf_counter()
+    try:
+        if args.table == 'users':
+            columns = USER_COLUMNS
+            chunks = iter_users(database, args.since, args.until, args.chunk_rows)
+        else:
+            columns = HISTORY_FIELDS
+            chunks = iter_history(database, args.since, args.until, args.category,
+                                  args.include_archive, args.chunk_rows)
+        write = write_csv if args.format == 'csv' else write_ndjson
+        with _open_output(args.output, args.gzip or args.output.endswith('.gz')) as fh:
+            count = await write(chunks, columns, fh)
+    finally:
+        await database.close()
+    logger.info(f"Exported {count} {args.table} rows in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
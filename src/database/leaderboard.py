@@ -0,0 +1,70 @@
+from ..config.settings import LEADERBOARD_SIZE, LEADERBOARD_SLACK
+
+
+class Leaderboard:
+    """Incrementally maintained top-N of users by credits.
+
+    Tracks up to `size + slack` of the richest users. Every user that is not
+    tracked is known to have at most `floor` credits, so a balance change
+    only needs to touch the database when so many tracked users fall below
+    the floor that fewer than `size` remain; `needs_reload` is set then.
+    `version` changes only when the visible top `size` rows change.
+    """
+
+    def __init__(self, size=LEADERBOARD_SIZE, slack=LEADERBOARD_SLACK):
+        self.size = size
+        self.capacity = size + slack
+        self._entries = {}  # user_id -> (credits, username, games_played, games_won)
+        self._floor = None  # None while every user is tracked
+        self._top = []
+        self.version = 0
+        self.needs_reload = True
+
+    def load(self, rows):
+        """Replace the tracked set with `(user_id, username, credits, games_played, games_won)`
+        rows ordered by credits descending, at most `capacity` of them."""
+        self._entries = {
+            user_id: (credits, username, games_played, games_won)
+            for user_id, username, credits, games_played, games_won in rows
+        }
+        self._floor = rows[-1][2] if len(rows) >= self.capacity else None
+        self.needs_reload = False
+        self._refresh()
+
+    def update(self, user_id, username, credits, games_played, games_won):
+        """Apply a change to one user's row."""
+        if self._floor is None or credits > self._floor:
+            self._entries[user_id] = (credits, username, games_played, games_won)
+            if len(self._entries) > self.capacity:
+                self._trim()
+        elif user_id in self._entries:
+            del self._entries[user_id]
+            if len(self._entries) < self.size:
+                self.needs_reload = True
+        else:
+            return
+        self._refresh()
+
+    def top(self):
+        """Return the top rows as `(username, credits, games_played, games_won)` tuples."""
+        return self._top
+
+    def _trim(self):
+        ranked = sorted(self._entries.items(), key=_rank_key)
+        for user_id, entry in ranked[self.capacity:]:
+            del self._entries[user_id]
+            if self._floor is None or entry[0] > self._floor:
+                self._floor = entry[0]
+
+    def _refresh(self):
+        ranked = sorted(self._entries.items(), key=_rank_key)[:self.size]
+        top = [(username, credits, games_played, games_won)
+               for _, (credits, username, games_played, games_won) in ranked]
+        if top != self._top:
+            self._top = top
+            self.version += 1
+
+
+def _rank_key(item):
+    user_id, entry = item
+    return (-entry[0], user_id)
@@ -0,0 +1,155 @@
+"""
+Versioned schema migrations, tracked in the database's PRAGMA user_version.
+
+Migration N brings the schema from version N - 1 to N and runs at most once
+per database, in its own transaction together with the version bump. An
+up-to-date database costs a single PRAGMA read at startup. Migrations use
+IF NOT EXISTS, so databases created before versioning (all at version 0)
+are migrated safely. Append new migrations to MIGRATIONS; never edit or
+reorder released ones.
+"""
+
+import logging
+
+from ..config.settings import INITIAL_CREDITS
+
+logger = logging.getLogger(__name__)
+
+
+async def _create_base_tables(db):
+    await db.execute(f'''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            credits INTEGER DEFAULT {INITIAL_CREDITS},
+            games_played INTEGER DEFAULT 0,
+            games_won INTEGER DEFAULT 0,
+            total_wagered INTEGER DEFAULT 0,
+            total_winnings INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS game_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            category TEXT,
+            bet_amount INTEGER,
+            guessed_number INTEGER,
+            winning_number INTEGER,
+            won BOOLEAN,
+            payout INTEGER,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+    # Covering index for the leaderboard query
+    await db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_leaderboard
+        ON users (credits DESC, user_id, username, games_played, games_won)
+    ''')
+
+
+async def _add_history_user_index(db):
+    # Keyset pagination of a user's history
+    await db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_game_history_user
+        ON game_history (user_id, id)
+    ''')
+
+
+async def _add_category_rollups(db):
+    # Per-user, per-category totals, maintained by write_history()
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS user_category_stats (
+            user_id INTEGER,
+            category TEXT,
+            games INTEGER NOT NULL DEFAULT 0,
+            wins INTEGER NOT NULL DEFAULT 0,
+            wagered INTEGER NOT NULL DEFAULT 0,
+            payout INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, category)
+        ) WITHOUT ROWID
+    ''')
+
+    # Build the rollups from existing history if they are missing
+    async with db.execute('''
+        SELECT EXISTS (SELECT 1 FROM game_history)
+           AND NOT EXISTS (SELECT 1 FROM user_category_stats)
+    ''') as cursor:
+        (missing,) = await cursor.fetchone()
+    if missing:
+        await db.execute('''
+            INSERT INTO user_category_stats (user_id, category, games, wins, wagered, payout)
+            SELECT user_id, category, COUNT(*), SUM(won), SUM(bet_amount), SUM(payout)
+            FROM game_history
+            GROUP BY user_id, category
+        ''')
+        logger.info("Built per-category stats from game history")
+
+
+async def _add_tournament_entries(db):
+    # Escrowed bets of tournament rounds that are not settled yet
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS tournament_entries (
+            round_id INTEGER,
+            user_id INTEGER,
+            category TEXT,
+            guess INTEGER,
+            bet_amount INTEGER,
+            PRIMARY KEY (round_id, user_id)
+        )
+    ''')
+
+
+async def _add_meta(db):
+    # Small key/value state kept across restarts, e.g. the bot command menu hash
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        ) WITHOUT ROWID
+    ''')
+
+
+# Migration N is MIGRATIONS[N - 1]
+MIGRATIONS = [
+    _create_base_tables,
+    _add_history_user_index,
+    _add_category_rollups,
+    _add_tournament_entries,
+    _add_meta,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+async def schema_version(db):
+    async with db.execute('PRAGMA user_version') as cursor:
+        (version,) = await cursor.fetchone()
+    return version
+
+
+async def migrate(db):
+    """Apply the migrations the database has not had yet. Returns how many ran."""
+    version = await schema_version(db)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than this code supports ({SCHEMA_VERSION})"
+        )
+    for number in range(version + 1, SCHEMA_VERSION + 1):
+        await db.execute('BEGIN IMMEDIATE')
+        try:
+            if await schema_version(db) >= number:
+                # Another process sharing the database applied it first
+                await db.rollback()
+                continue
+            await MIGRATIONS[number - 1](db)
+            await db.execute(f'PRAGMA user_version = {number}')
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        logger.info(f"Migrated database schema to version {number} ({MIGRATIONS[number - 1].__name__})")
+    return SCHEMA_VERSION - version
@@ -0,0 +1,181 @@
+"""
+The connections of a GameDatabase: one writer and a pool of read-only readers.
+
+In WAL mode SQLite lets any number of readers run alongside the one writer,
+each on its own connection. aiosqlite runs every connection on its own
+thread, so with a reader pool a long read no longer queues on the writer's
+thread in front of a settlement, and a commit does not hold up reads.
+
+Writes take the WriteLock for their whole transaction. It is granted by
+priority, so a settlement a player is waiting on goes before history
+flushes and maintenance that arrived earlier, though only a bounded number
+of times in a row.
+"""
+
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import os
+from urllib.request import pathname2url
+
+import aiosqlite
+
+from ..config.settings import (
+    DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_BUSY_TIMEOUT_MS, DB_READ_POOL_SIZE, DB_BACKGROUND_WRITE_AFTER
+)
+
+logger = logging.getLogger(__name__)
+
+# Write priorities, lowest first
+WRITE_SETTLEMENT = 0  # Balance changes and user creation
+WRITE_BACKGROUND = 1  # History flushes, compaction and bookkeeping
+
+
+class WriteLock:
+    """Exclusive use of the writer connection, granted by priority, then in arrival order.
+
+    `async with lock:` waits at WRITE_SETTLEMENT priority; `async with
+    lock(priority):` at another one. Once `overtake_limit` higher-priority
+    grants in a row have passed over a waiting lower-priority transaction,
+    the earliest such one goes next, so a steady stream of settlements
+    cannot starve history flushes.
+    """
+
+    def __init__(self, overtake_limit=DB_BACKGROUND_WRITE_AFTER):
+        self.overtake_limit = overtake_limit
+        self._held = False
+        self._waiters = []  # Heap of (priority, arrival, future)
+        self._arrivals = itertools.count()
+        self._overtaken = 0  # Grants in a row while a lower-priority transaction waited
+
+    @property
+    def pending(self):
+        """Number of transactions waiting for the writer."""
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def locked(self):
+        return self._held
+
+    async def acquire(self, priority=WRITE_SETTLEMENT):
+        if not self._held and not self._waiters:
+            self._held = True
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted at the moment of cancellation: pass it on
+                self.release()
+            raise
+
+    def release(self):
+        # The lock passes straight to the next waiter, so no one can cut in
+        while self._waiters:
+            entry = self._waiters[0]
+            if self._overtaken >= self.overtake_limit:
+                entry = self._earliest_lower(entry[0])
+            if entry is self._waiters[0]:
+                heapq.heappop(self._waiters)
+            else:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            priority, _, future = entry
+            if future.done():
+                continue
+            if any(waiting[0] > priority and not waiting[2].done() for waiting in self._waiters):
+                self._overtaken += 1
+            else:
+                self._overtaken = 0
+            future.set_result(None)
+            return
+        self._held = False
+        self._overtaken = 0
+
+    def _earliest_lower(self, priority):
+        """The earliest waiter of a lower priority than `priority`, else the head of the heap."""
+        lower = [entry for entry in self._waiters if entry[0] > priority and not entry[2].done()]
+        return min(lower, key=lambda entry: entry[1]) if lower else self._waiters[0]
+
+    @contextlib.asynccontextmanager
+    async def __call__(self, priority):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+async def connect(db_path, read_only=False):
+    """Open a connection to the database file with the tuning pragmas applied."""
+    if read_only:
+        db = await aiosqlite.connect(f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro", uri=True)
+    else:
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = await aiosqlite.connect(db_path)
+        await db.execute('PRAGMA journal_mode=WAL')
+        await db.execute('PRAGMA synchronous=NORMAL')
+    await db.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+    await db.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+    await db.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    await db.execute('PRAGMA temp_store=MEMORY')
+    return db
+
+
+class ReaderPool:
+    """Read-only connections, each lent to one query at a time.
+
+    Open it after the writer, which creates the database and its WAL.
+    """
+
+    def __init__(self, db_path, size=DB_READ_POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self.connections = []
+        self.waiting = 0  # Queries waiting for a connection
+        self._idle = asyncio.Queue()
+
+    @property
+    def in_use(self):
+        return len(self.connections) - self._idle.qsize()
+
+    async def open(self):
+        while len(self.connections) < self.size:
+            db = await connect(self.db_path, read_only=True)
+            self.connections.append(db)
+            self._idle.put_nowait(db)
+
+    async def close(self):
+        """Close every connection once the queries using them are done."""
+        for _ in self.connections:
+            await self._idle.get()
+        for db in self.connections:
+            await db.close()
+        self.connections = []
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        self.waiting += 1
+        try:
+            db = await self._idle.get()
+        finally:
+            self.waiting -= 1
+        try:
+            yield db
+        finally:
+            self._idle.put_nowait(db)
+
+    async def fetchall(self, sql, parameters=()):
+        async with self.connection() as db:
+            return await db.execute_fetchall(sql, parameters)
@@ -0,0 +1,111 @@
+from array import array
+from bisect import bisect_right, insort
+from ..config.settings import RANK_INDEX_MAX_CREDITS
+
+
+class CreditRankIndex:
+    """Order-statistic index over all user balances.
+
+    A Fenwick tree counts balances in [0, max_credits) exactly; the rare
+    balances at or above max_credits are kept in a sorted list. Both
+    updates and rank queries are O(log max_credits) for ordinary balances.
+    """
+
+    def __init__(self, max_credits=RANK_INDEX_MAX_CREDITS):
+        self.max_credits = max_credits
+        self._tree = array('q', bytes(8 * (max_credits + 1)))
+        self._overflow = []
+        self.total = 0
+
+    def build(self, balances):
+        """Rebuild the index from an iterable of balances in O(n + max_credits)."""
+        size = self.max_credits
+        tree = array('q', bytes(8 * (size + 1)))
+        overflow = []
+        total = 0
+        for credits in balances:
+            credits = max(credits, 0)
+            if credits < size:
+                tree[credits + 1] += 1
+            else:
+                overflow.append(credits)
+            total += 1
+
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+
+        overflow.sort()
+        self._tree = tree
+        self._overflow = overflow
+        self.total = total
+
+    def dump(self):
+        """Return the tree array, the overflow balances and the total, for a snapshot."""
+        return self._tree, self._overflow, self.total
+
+    def restore(self, tree, overflow, total):
+        """Load the index from what dump() returned, e.g. mapped from a snapshot."""
+        if len(tree) != self.max_credits + 1:
+            raise ValueError(f"Rank index of size {len(tree) - 1} does not fit max_credits={self.max_credits}")
+        self._tree = array('q')
+        self._tree.frombytes(memoryview(tree).cast('B'))
+        self._overflow = list(overflow)
+        self.total = total
+
+    def add(self, credits):
+        """Add one balance."""
+        self._adjust(credits, 1)
+        self.total += 1
+
+    def remove(self, credits):
+        """Remove one balance."""
+        self._adjust(credits, -1)
+        self.total -= 1
+
+    def move(self, old_credits, new_credits):
+        """Replace one balance with another."""
+        if old_credits != new_credits:
+            self._adjust(old_credits, -1)
+            self._adjust(new_credits, 1)
+
+    def count_above(self, credits):
+        """Number of balances strictly greater than `credits`."""
+        credits = max(credits, 0)
+        overflow = self._overflow
+        if credits >= self.max_credits:
+            return len(overflow) - bisect_right(overflow, credits)
+        in_tree = self.total - len(overflow)
+        return len(overflow) + in_tree - self._prefix(credits + 1)
+
+    def rank(self, credits):
+        """1-based rank of a balance; ties share the best rank."""
+        return self.count_above(credits) + 1
+
+    def _prefix(self, index):
+        # Number of balances in [0, index)
+        tree = self._tree
+        count = 0
+        while index > 0:
+            count += tree[index]
+            index &= index - 1
+        return count
+
+    def _adjust(self, credits, delta):
+        credits = max(credits, 0)
+        if credits >= self.max_credits:
+            if delta > 0:
+                insort(self._overflow, credits)
+            else:
+                position = bisect_right(self._overflow, credits) - 1
+                if position >= 0 and self._overflow[position] == credits:
+                    del self._overflow[position]
+            return
+
+        tree = self._tree
+        size = self.max_credits
+        index = credits + 1
+        while index <= size:
+            tree[index] += delta
+            index += index & -index
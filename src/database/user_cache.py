@@ -0,0 +1,170 @@
+import time
+from collections import OrderedDict
+from ..config.settings import USER_CACHE_SIZE, USER_CACHE_TTL
+
+
+class UserRecord:
+    """A row of the users table."""
+
+    __slots__ = ('user_id', 'username', 'credits', 'games_played', 'games_won',
+                 'total_wagered', 'total_winnings', 'cached_at')
+
+    def __init__(self, user_id, username, credits, games_played=0, games_won=0,
+                 total_wagered=0, total_winnings=0):
+        self.user_id = user_id
+        self.username = username
+        self.credits = credits
+        self.games_played = games_played
+        self.games_won = games_won
+        self.total_wagered = total_wagered
+        self.total_winnings = total_winnings
+        self.cached_at = 0.0
+
+    @classmethod
+    def from_row(cls, row):
+        """Build a record from a `SELECT * FROM users` row."""
+        return cls(row[0], row[1], row[2], row[3], row[4], row[5], row[6])
+
+    def stats(self):
+        """Return the tuple get_user_stats has always returned."""
+        return (self.credits, self.games_played, self.games_won,
+                self.total_wagered, self.total_winnings)
+
+    def __repr__(self):
+        return f"UserRecord(user_id={self.user_id}, username={self.username!r}, credits={self.credits})"
+
+
+class UserCache:
+    """Bounded LRU cache of UserRecords with a time-to-live.
+
+    GameDatabase writes through it on every change to a user row, so a
+    cached record is never older than the database, only possibly evicted.
+    After a warm restart, records from the snapshot are looked up on a miss.
+    """
+
+    def __init__(self, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._records = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bumped on every write. For users whose row is being read from the
+        # database, the sequence of their last write is kept, so a read that
+        # a write to the same user overtook is not cached over the newer value.
+        self.write_seq = 0
+        self._reads = {}  # user_id -> database reads in flight
+        self._written = {}  # user_id -> write_seq of the last write during a read
+        self._restored = None  # SnapshotTable from a warm restart, see restore()
+        self._restored_at = 0.0
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, user_id):
+        return user_id in self._records
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, user_id):
+        """Return the cached record for a user, or None on a miss."""
+        record = self._records.get(user_id)
+        if record is None and self._restored is not None:
+            record = self._take_restored(user_id)
+        if record is None:
+            self.misses += 1
+            return None
+        if time.monotonic() - record.cached_at > self.ttl:
+            del self._records[user_id]
+            self.misses += 1
+            return None
+        self._records.move_to_end(user_id)
+        self.hits += 1
+        return record
+
+    def peek(self, user_id):
+        """Return the cached record without touching LRU order or counters."""
+        return self._records.get(user_id)
+
+    def begin_read(self, user_id):
+        """Note a database read of a user's row; returns the sequence number to pass to put().
+
+        Every begin_read must be followed by an end_read.
+        """
+        self._reads[user_id] = self._reads.get(user_id, 0) + 1
+        return self.write_seq
+
+    def end_read(self, user_id):
+        pending = self._reads.pop(user_id) - 1
+        if pending:
+            self._reads[user_id] = pending
+        else:
+            self._written.pop(user_id, None)
+
+    def for_update(self, user_id):
+        """Note a write to a user's row and return the cached record, if any."""
+        self.write_seq += 1
+        if user_id in self._reads:
+            self._written[user_id] = self.write_seq
+        record = self._records.get(user_id)
+        if record is None and self._restored is not None:
+            record = self._take_restored(user_id)
+        return record
+
+    def put(self, record, read_seq=None):
+        """Insert or replace a record, evicting the least recently used if full.
+
+        When read_seq is given (from begin_read), the record is only cached
+        if the user's row has not been written since.
+        """
+        if read_seq is not None and self._written.get(record.user_id, 0) > read_seq:
+            return
+        if self._restored is not None:
+            self._restored.discard(record.user_id)
+        record.cached_at = time.monotonic()
+        self._insert(record)
+
+    def invalidate(self, user_id):
+        """Drop a user's record."""
+        if self._restored is not None:
+            self._restored.discard(user_id)
+        self._records.pop(user_id, None)
+
+    def clear(self):
+        self._records.clear()
+        self._restored = None
+
+    def restore(self, table):
+        """Serve the records of a warm-restart snapshot until they are used or expire."""
+        self._restored = table
+        self._restored_at = time.monotonic()
+
+    def export(self):
+        """Return the current monotonic time and every cached record, for a snapshot."""
+        if self._restored is not None:
+            for record in self._restored.take_all():
+                record.cached_at += self._restored_at
+                self._insert(record)
+            self._restored = None
+        # In table order rather than LRU order, which is a slow linked-list walk
+        return time.monotonic(), list(dict.values(self._records))
+
+    def _take_restored(self, user_id):
+        if time.monotonic() >= self._restored_at + self._restored.lifetime:
+            self._restored = None
+            return None
+        record = self._restored.take(user_id)
+        if record is not None:
+            record.cached_at += self._restored_at
+            self._insert(record)
+        return record
+
+    def _insert(self, record):
+        self._records[record.user_id] = record
+        self._records.move_to_end(record.user_id)
+        while len(self._records) > self.max_size:
+            self._records.popitem(last=False)
+            self.evictions += 1
@@ -1,13 +1,34 @@
 import random
 import logging
-from ..config.settings import CATEGORIES, MIN_BET
+from ..config.settings import AUTOPLAY_MAX_ROUNDS, CATEGORIES, MIN_BET
+from .session_store import create_session_store
 
 logger = logging.getLogger(__name__)
 
+
+# Settlement rules, shared with the simulator. They only use arithmetic and
+# comparisons, so they work on plain ints and elementwise on NumPy arrays.
+
+def is_winning_guess(guess, winning_number):
+    """A guess wins when it hits the drawn number exactly."""
+    return guess == winning_number
+
+
+def compute_payout(bet_amount, multiplier, won):
+    """Credits paid out for a bet: bet times the multiplier on a win, else nothing."""
+    return bet_amount * multiplier * won
+
+
+def settle_credits(credits, bet_amount, payout):
+    """Balance after a bet is taken and its payout credited."""
+    return credits - bet_amount + payout
+
+
 class NumberGuessingGame:
-    def __init__(self, database):
+    def __init__(self, database, sessions=None):
         self.db = database
-        self.user_sessions = {}  # Store active game sessions
+        # Active game sessions
+        self.sessions = sessions if sessions is not None else create_session_store()
     
     def get_categories_info(self):
         """Get formatted information about all game categories."""
@@ -42,62 +63,71 @@ class NumberGuessingGame:
         
         return True, "Valid guess"
     
-    def start_game_session(self, user_id: int, category: str, bet_amount: int):
+    async def start_game_session(self, user_id: int, category: str, bet_amount: int):
         """Start a new game session for a user."""
-        self.user_sessions[user_id] = {
-            'category': category,
-            'bet_amount': bet_amount,
-            'stage': 'waiting_for_guess'
-        }
-        logger.info(f"Started game session for user {user_id}: {category} with bet {bet_amount}")
+        await self.sessions.put(user_id, 'waiting_for_guess', category, bet_amount)
+        logger.debug("Started game session for user %s: %s with bet %s", user_id, category, bet_amount)
+    
+    async def start_custom_bet_session(self, user_id: int, category: str):
+        """Start a session that waits for the user to type a bet amount."""
+        await self.sessions.put(user_id, 'waiting_for_custom_bet', category)
+    
+    async def confirm_custom_bet(self, user_id: int, category: str, bet_amount: int):
+        """Move a custom bet session on to waiting for a guess.
+        
+        Returns False if the session is no longer waiting for a custom bet.
+        """
+        session = await self.sessions.compare_and_set(
+            user_id, 'waiting_for_custom_bet', 'waiting_for_guess', category, bet_amount
+        )
+        if session is None:
+            return False
+        logger.debug("Started game session for user %s: %s with bet %s", user_id, category, bet_amount)
+        return True
     
-    def get_user_session(self, user_id: int):
+    async def get_user_session(self, user_id: int):
         """Get current game session for a user."""
-        return self.user_sessions.get(user_id)
+        return await self.sessions.get(user_id)
     
-    def end_game_session(self, user_id: int):
+    async def end_game_session(self, user_id: int):
         """End the game session for a user."""
-        if user_id in self.user_sessions:
-            del self.user_sessions[user_id]
+        await self.sessions.pop(user_id)
     
     async def play_game(self, user_id: int, guess: int):
         """Execute the game logic and return results."""
-        session = self.get_user_session(user_id)
-        if not session:
+        session = await self.get_user_session(user_id)
+        if not session or session.stage != 'waiting_for_guess':
             return None, "No active game session!"
         
-        category = session['category']
-        bet_amount = session['bet_amount']
+        category = session.category
         
         # Validate guess
         is_valid, message = self.validate_guess(guess, category)
         if not is_valid:
             return None, message
         
+        # Claim the session so a concurrent guess can't settle it twice
+        session = await self.sessions.take(user_id, 'waiting_for_guess')
+        if session is None or session.category != category:
+            return None, "No active game session!"
+        
+        bet_amount = session.bet_amount
+        
         # Generate winning number
         min_num, max_num = CATEGORIES[category]['range']
         winning_number = random.randint(min_num, max_num)
         
         # Check if user won
-        won = (guess == winning_number)
-        payout = 0
-        
-        if won:
-            multiplier = CATEGORIES[category]['multiplier']
-            payout = bet_amount * multiplier
-            
-        # Update user credits
-        user = await self.db.get_user(user_id)
-        new_credits = user['credits'] - bet_amount + payout
-        await self.db.update_credits(user_id, new_credits)
-        
-        # Record the game
-        await self.db.record_game(
+        won = is_winning_guess(guess, winning_number)
+        payout = compute_payout(bet_amount, CATEGORIES[category]['multiplier'], won)
+        
+        # Settle credits, stats and history in one transaction
+        new_credits = await self.db.settle_game(
             user_id, category, bet_amount, guess, winning_number, won, payout
         )
         
-        # End session
-        self.end_game_session(user_id)
+        if new_credits is None:
+            return None, "You don't have enough credits!"
         
         # Prepare result
         result = {
@@ -111,9 +141,76 @@ class NumberGuessingGame:
             'category_info': CATEGORIES[category]
         }
         
-        logger.info(f"Game result for user {user_id}: {result}")
+        logger.debug("Game result for user %s: %s", user_id, result)
         return result, "Game completed"
     
+    async def autoplay(self, user_id: int, username: str, category: str, bet_amount: int,
+                       rounds: int, guess: int = None):
+        """Play up to `rounds` games with the same bet and settle them as one batch.
+        
+        With no `guess` a random number is guessed every round. Play stops
+        early once the balance can no longer cover the bet.
+        """
+        if category not in CATEGORIES:
+            return None, "Invalid category!"
+        if not 1 <= rounds <= AUTOPLAY_MAX_ROUNDS:
+            return None, f"Rounds must be between 1 and {AUTOPLAY_MAX_ROUNDS}!"
+        if guess is not None:
+            is_valid, message = self.validate_guess(guess, category)
+            if not is_valid:
+                return None, message
+        
+        user_data = await self.db.get_user(user_id, username)
+        is_valid, message = self.validate_bet(user_data.credits, bet_amount, category)
+        if not is_valid:
+            return None, message
+        
+        # Draw every round's numbers in one go
+        min_num, max_num = CATEGORIES[category]['range']
+        numbers = range(min_num, max_num + 1)
+        winning_numbers = random.choices(numbers, k=rounds)
+        guesses = random.choices(numbers, k=rounds) if guess is None else [guess] * rounds
+        multiplier = CATEGORIES[category]['multiplier']
+        
+        credits = user_data.credits
+        required_credits = bet_amount  # lowest starting balance that covers every bet
+        games = []
+        wins = 0
+        for guessed, winning_number in zip(guesses, winning_numbers):
+            if credits < bet_amount:
+                break
+            required_credits = max(required_credits, user_data.credits - credits + bet_amount)
+            won = is_winning_guess(guessed, winning_number)
+            payout = compute_payout(bet_amount, multiplier, won)
+            credits = settle_credits(credits, bet_amount, payout)
+            games.append((bet_amount, guessed, winning_number, won, payout))
+            wins += won
+        
+        new_credits = await self.db.settle_batch(user_id, category, games, required_credits)
+        if new_credits is None:
+            return None, "You don't have enough credits!"
+        
+        wagered = bet_amount * len(games)
+        paid = sum(game[4] for game in games)
+        result = {
+            'category': category,
+            'category_info': CATEGORIES[category],
+            'guess': guess,
+            'bet_amount': bet_amount,
+            'rounds': rounds,
+            'played': len(games),
+            'wins': wins,
+            'wagered': wagered,
+            'paid': paid,
+            'net': paid - wagered,
+            'new_credits': new_credits,
+            'stopped_early': len(games) < rounds,
+        }
+        
+        logger.debug("Autoplay for user %s: %s/%s rounds of %s with bet %s, net %+d",
+                     user_id, len(games), rounds, category, bet_amount, paid - wagered)
+        return result, "Autoplay completed"
+    
     def format_game_result(self, result):
         """Format the game result into a nice message."""
         if not result:
@@ -153,9 +250,13 @@ class NumberGuessingGame:
         help_text += "**Commands:**\n"
         help_text += "• `/start` - Start the bot\n"
         help_text += "• `/play` - Start a new game\n"
+        help_text += "• `/autoplay <category> <bet> <rounds> [guess]` - Play many rounds at once\n"
+        help_text += "• `/tournament <category> <bet> <guess>` - Join the shared-draw round\n"
         help_text += "• `/balance` - Check your credits\n"
         help_text += "• `/stats` - View your statistics\n"
+        help_text += "• `/history` - Browse your past games\n"
         help_text += "• `/leaderboard` - Top players\n"
+        help_text += "• `/rank` - Your position among all players\n"
         help_text += "• `/help` - Show this help\n"
         
         return help_text 
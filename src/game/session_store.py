@@ -0,0 +1,366 @@
+import heapq
+import itertools
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+import aiosqlite
+from ..config.settings import (
+    SESSION_TTL, MAX_SESSIONS, SESSION_BACKEND, SESSION_DB_PATH, DB_BUSY_TIMEOUT_MS
+)
+
+logger = logging.getLogger(__name__)
+
+
+class GameSession:
+    """An in-progress game: waiting for a custom bet or for a guess."""
+
+    __slots__ = ('user_id', 'stage', 'category', 'bet_amount', 'expires_at')
+
+    def __init__(self, user_id, stage, category, bet_amount=None, expires_at=0.0):
+        self.user_id = user_id
+        self.stage = stage
+        self.category = category
+        self.bet_amount = bet_amount
+        self.expires_at = expires_at
+
+    def __repr__(self):
+        return (f"GameSession(user_id={self.user_id}, stage={self.stage!r}, "
+                f"category={self.category!r}, bet_amount={self.bet_amount})")
+
+
+class SessionStore(ABC):
+    """Interface for game session storage.
+
+    Stage transitions go through compare_and_set and take, which only
+    succeed if the session is still in the expected stage, so two
+    handlers (or two processes) can never both act on the same session.
+    """
+
+    async def open(self):
+        """Prepare the store for use."""
+
+    async def close(self):
+        """Release any resources held by the store."""
+
+    @abstractmethod
+    async def get(self, user_id):
+        """Return the user's live session, or None."""
+
+    @abstractmethod
+    async def put(self, user_id, stage, category, bet_amount=None):
+        """Create or replace the user's session and return it."""
+
+    @abstractmethod
+    async def pop(self, user_id):
+        """Remove and return the user's session, or None."""
+
+    @abstractmethod
+    async def compare_and_set(self, user_id, expected_stage, stage, category, bet_amount=None):
+        """Replace the session only if it is live and in `expected_stage`.
+
+        Returns the new session, or None if the session was not in that stage.
+        """
+
+    @abstractmethod
+    async def take(self, user_id, expected_stage):
+        """Remove and return the session only if it is live and in `expected_stage`."""
+
+    @abstractmethod
+    def stats(self):
+        """Return session counters."""
+
+
+class MemorySessionStore(SessionStore):
+    """Bounded in-process store of sessions that expire after a time-to-live.
+
+    Expiry times are kept in a min-heap, so expired sessions are dropped from
+    the front of the heap as the store is used instead of by scanning every
+    session. Heap entries for sessions that were replaced or ended are
+    skipped lazily. When the store is full the session closest to expiry
+    is evicted.
+
+    After a warm restart, sessions from the snapshot are looked up on a
+    miss and moved into the store as their users come back.
+    """
+
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._clock = clock
+        self._sessions = {}
+        self._heap = []  # (expires_at, seq, session)
+        self._seq = itertools.count()
+        self._restored = None  # SnapshotTable from a warm restart, see restore()
+        self._restored_at = 0.0
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    @property
+    def active(self):
+        restored = self._restored.remaining if self._restored is not None else 0
+        return len(self._sessions) + restored
+
+    async def get(self, user_id):
+        return self._get(user_id)
+
+    async def put(self, user_id, stage, category, bet_amount=None):
+        return self._put(user_id, stage, category, bet_amount)
+
+    async def pop(self, user_id):
+        if self._restored is not None:
+            self._restored.discard(user_id)
+        return self._sessions.pop(user_id, None)
+
+    async def compare_and_set(self, user_id, expected_stage, stage, category, bet_amount=None):
+        session = self._get(user_id)
+        if session is None or session.stage != expected_stage:
+            return None
+        return self._put(user_id, stage, category, bet_amount)
+
+    async def take(self, user_id, expected_stage):
+        session = self._get(user_id)
+        if session is None or session.stage != expected_stage:
+            return None
+        del self._sessions[user_id]
+        return session
+
+    def purge_expired(self, now=None):
+        """Drop every session whose time-to-live has passed."""
+        if now is None:
+            now = self._clock()
+        if self._restored is not None and now >= self._restored_at + self._restored.lifetime:
+            self.expired += self._restored.remaining
+            self._restored = None
+        heap = self._heap
+        sessions = self._sessions
+        while heap and heap[0][0] <= now:
+            _, _, session = heapq.heappop(heap)
+            if sessions.get(session.user_id) is session:
+                del sessions[session.user_id]
+                self.expired += 1
+
+    def restore(self, table):
+        """Serve the sessions of a warm-restart snapshot alongside the live ones."""
+        self._restored = table
+        self._restored_at = self._clock()
+
+    def export(self):
+        """Return the clock's current time and every live session, for a snapshot."""
+        now = self._clock()
+        self.purge_expired(now)
+        if self._restored is not None:
+            for session in self._restored.take_all():
+                self._adopt(session)
+            self._restored = None
+        return now, [session for session in self._sessions.values() if session.expires_at > now]
+
+    def stats(self):
+        return {
+            'active': self.active,
+            'created': self.created,
+            'expired': self.expired,
+            'evicted': self.evicted,
+        }
+
+    def _get(self, user_id):
+        now = self._clock()
+        self.purge_expired(now)
+        session = self._sessions.get(user_id)
+        if session is None and self._restored is not None:
+            session = self._restored.take(user_id)
+            if session is not None:
+                self._adopt(session)
+        if session is not None and session.expires_at <= now:
+            del self._sessions[user_id]
+            self.expired += 1
+            return None
+        return session
+
+    def _put(self, user_id, stage, category, bet_amount):
+        now = self._clock()
+        self.purge_expired(now)
+        if self._restored is not None:
+            self._restored.discard(user_id)
+        session = GameSession(user_id, stage, category, bet_amount, now + self.ttl)
+        self._sessions[user_id] = session
+        heapq.heappush(self._heap, (session.expires_at, next(self._seq), session))
+        self.created += 1
+
+        while len(self._sessions) > self.max_sessions:
+            self._evict_one()
+        if len(self._heap) > 2 * len(self._sessions) + 1024:
+            self._compact()
+        return session
+
+    def _adopt(self, session):
+        # A session taken from the snapshot; its expiry is relative to the restore
+        session.expires_at += self._restored_at
+        self._sessions[session.user_id] = session
+        heapq.heappush(self._heap, (session.expires_at, next(self._seq), session))
+
+    def _evict_one(self):
+        heap = self._heap
+        sessions = self._sessions
+        while heap:
+            _, _, session = heapq.heappop(heap)
+            if sessions.get(session.user_id) is session:
+                del sessions[session.user_id]
+                self.evicted += 1
+                return
+
+    def _compact(self):
+        # Drop heap entries for sessions that were ended or replaced
+        sessions = self._sessions
+        self._heap = [entry for entry in self._heap if sessions.get(entry[2].user_id) is entry[2]]
+        heapq.heapify(self._heap)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Session store in a local SQLite table that several bot processes can share.
+
+    Every operation is a single autocommitted statement, and stage
+    transitions are conditional UPDATE/DELETE ... RETURNING statements, so
+    they are atomic across processes. Expiry uses wall-clock time and an
+    index on expires_at; expired rows are deleted at most once per
+    PURGE_INTERVAL seconds, and the oldest sessions beyond max_sessions
+    are evicted at the same time.
+    """
+
+    PURGE_INTERVAL = 30
+
+    def __init__(self, db_path=SESSION_DB_PATH, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS,
+                 clock=time.time):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._clock = clock
+        self._conn = None
+        self._next_purge = 0.0
+        self.active = 0
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    async def open(self):
+        if self._conn is not None:
+            return
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        db = await aiosqlite.connect(self.db_path, isolation_level=None)
+        await db.execute('PRAGMA journal_mode=WAL')
+        await db.execute('PRAGMA synchronous=NORMAL')
+        await db.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                user_id INTEGER PRIMARY KEY,
+                stage TEXT NOT NULL,
+                category TEXT NOT NULL,
+                bet_amount INTEGER,
+                expires_at REAL NOT NULL
+            )
+        ''')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)')
+        self._conn = db
+        await self._purge(self._clock())
+
+    async def close(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    async def get(self, user_id):
+        now = self._clock()
+        async with self._conn.execute(
+            'SELECT stage, category, bet_amount, expires_at FROM sessions '
+            'WHERE user_id = ? AND expires_at > ?', (user_id, now)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return GameSession(user_id, *row) if row else None
+
+    async def put(self, user_id, stage, category, bet_amount=None):
+        now = self._clock()
+        expires_at = now + self.ttl
+        await self._conn.execute(
+            'INSERT OR REPLACE INTO sessions (user_id, stage, category, bet_amount, expires_at) '
+            'VALUES (?, ?, ?, ?, ?)', (user_id, stage, category, bet_amount, expires_at)
+        )
+        self.created += 1
+        await self._maybe_purge(now)
+        return GameSession(user_id, stage, category, bet_amount, expires_at)
+
+    async def pop(self, user_id):
+        async with self._conn.execute(
+            'DELETE FROM sessions WHERE user_id = ? '
+            'RETURNING stage, category, bet_amount, expires_at', (user_id,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None or row[3] <= self._clock():
+            return None
+        return GameSession(user_id, *row)
+
+    async def compare_and_set(self, user_id, expected_stage, stage, category, bet_amount=None):
+        now = self._clock()
+        expires_at = now + self.ttl
+        async with self._conn.execute(
+            'UPDATE sessions SET stage = ?, category = ?, bet_amount = ?, expires_at = ? '
+            'WHERE user_id = ? AND stage = ? AND expires_at > ? RETURNING user_id',
+            (stage, category, bet_amount, expires_at, user_id, expected_stage, now)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        return GameSession(user_id, stage, category, bet_amount, expires_at)
+
+    async def take(self, user_id, expected_stage):
+        async with self._conn.execute(
+            'DELETE FROM sessions WHERE user_id = ? AND stage = ? AND expires_at > ? '
+            'RETURNING stage, category, bet_amount, expires_at',
+            (user_id, expected_stage, self._clock())
+        ) as cursor:
+            row = await cursor.fetchone()
+        return GameSession(user_id, *row) if row else None
+
+    def stats(self):
+        return {
+            'active': self.active,
+            'created': self.created,
+            'expired': self.expired,
+            'evicted': self.evicted,
+        }
+
+    async def _maybe_purge(self, now):
+        if now >= self._next_purge:
+            await self._purge(now)
+
+    async def _purge(self, now):
+        self._next_purge = now + self.PURGE_INTERVAL
+        async with self._conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,)) as cursor:
+            self.expired += max(cursor.rowcount, 0)
+        async with self._conn.execute('SELECT COUNT(*) FROM sessions') as cursor:
+            (self.active,) = await cursor.fetchone()
+
+        excess = self.active - self.max_sessions
+        if excess > 0:
+            async with self._conn.execute(
+                'DELETE FROM sessions WHERE user_id IN '
+                '(SELECT user_id FROM sessions ORDER BY expires_at LIMIT ?)', (excess,)
+            ) as cursor:
+                evicted = max(cursor.rowcount, 0)
+            self.evicted += evicted
+            self.active -= evicted
+
+
+def create_session_store(backend=SESSION_BACKEND):
+    """Build the session store selected by SESSION_BACKEND."""
+    if backend == 'memory':
+        return MemorySessionStore()
+    if backend == 'sqlite':
+        return SQLiteSessionStore()
+    raise ValueError(f"Unknown session backend: {backend}")
@@ -0,0 +1,199 @@
+"""
+Monte Carlo simulator for the game's payout economics.
+
+Plays many players through many rounds at once with NumPy, settling every
+bet with the same rules as NumberGuessingGame.play_game, and reports the
+house edge, how fast balances go bust from INITIAL_CREDITS and how much
+results vary under a betting strategy. Category ranges and multipliers can
+be overridden to try out a change before making it in settings.py.
+
+    python -m src.game.simulator --players 10000 --rounds 1000 --strategy flat --bet 100
+    python -m src.game.simulator --category medium --multiplier 5 --json medium_x5.json
+
+Needs NumPy, which the bot itself does not: pip install numpy
+"""
+
+import argparse
+import json
+import time
+
+from ..config.settings import CATEGORIES, INITIAL_CREDITS, MIN_BET
+from .game_logic import compute_payout, is_winning_guess, settle_credits
+
+STRATEGIES = ('flat', 'fraction', 'martingale')
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+# Rounds of random numbers drawn per NumPy call
+DRAW_BLOCK = 64
+
+
+def _bets(np, strategy, balances, losing_streaks, bet, fraction):
+    if strategy == 'flat':
+        return np.full(len(balances), bet, dtype=np.int64)
+    if strategy == 'fraction':
+        return (balances * fraction).astype(np.int64)
+    # martingale: double the bet after every loss, back to the base bet after a win
+    return np.left_shift(np.int64(bet), np.minimum(losing_streaks, 40))
+
+
+def simulate(category_info, players=10000, rounds=1000, strategy='flat', bet=100,
+             fraction=0.01, initial_credits=INITIAL_CREDITS, seed=None, checkpoints=10):
+    """Simulate `players` players each playing up to `rounds` games of one category.
+
+    Bets are at least MIN_BET and at most the player's balance, as the bot
+    enforces; a player whose balance falls below MIN_BET is bust and stops.
+    Returns a dict of summary statistics and distributions.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    low, high = category_info['range']
+    multiplier = category_info['multiplier']
+
+    balances = np.full(players, initial_credits, dtype=np.int64)
+    losing_streaks = np.zeros(players, dtype=np.int64)
+    bust_round = np.zeros(players, dtype=np.int64)  # 0 while still playing
+    games = wagered = paid = wins = 0
+    returns_sum = returns_sq_sum = 0.0  # per-game net return per credit bet
+    checkpoint_every = max(1, rounds // checkpoints)
+    bust_curve = []
+
+    start = time.perf_counter()
+    rounds_played = 0
+    for round_number in range(rounds):
+        if round_number % DRAW_BLOCK == 0:
+            block = min(DRAW_BLOCK, rounds - round_number)
+            guesses = rng.integers(low, high + 1, size=(block, players))
+            winning_numbers = rng.integers(low, high + 1, size=(block, players))
+
+        playing = np.flatnonzero(balances >= MIN_BET)
+        if len(playing) == 0:
+            break
+        rounds_played = round_number + 1
+        row = round_number % DRAW_BLOCK
+        credits = balances[playing]
+
+        bets = _bets(np, strategy, credits, losing_streaks[playing], bet, fraction)
+        bets = np.minimum(np.maximum(bets, MIN_BET), credits)
+        won = is_winning_guess(guesses[row, playing], winning_numbers[row, playing])
+        payouts = compute_payout(bets, multiplier, won)
+        balances[playing] = settle_credits(credits, bets, payouts)
+        losing_streaks[playing] = np.where(won, 0, losing_streaks[playing] + 1)
+
+        games += len(playing)
+        wagered += int(bets.sum())
+        paid += int(payouts.sum())
+        wins += int(np.count_nonzero(won))
+        net_returns = (payouts - bets) / bets
+        returns_sum += float(net_returns.sum())
+        returns_sq_sum += float(np.dot(net_returns, net_returns))
+
+        busted = playing[balances[playing] < MIN_BET]
+        bust_round[busted] = round_number + 1
+        if rounds_played % checkpoint_every == 0:
+            bust_curve.append((rounds_played, float(np.count_nonzero(bust_round) / players)))
+    elapsed = time.perf_counter() - start
+    if not bust_curve or bust_curve[-1][0] != rounds_played:
+        bust_curve.append((rounds_played, float(np.count_nonzero(bust_round) / players)))
+
+    win_probability = 1 / (high - low + 1)
+    mean_return = returns_sum / games if games else 0.0
+    return_std = (returns_sq_sum / games - mean_return ** 2) ** 0.5 if games else 0.0
+    busted = bust_round[bust_round > 0]
+    counts, edges = np.histogram(balances, bins=20)
+
+    return {
+        'category': category_info,
+        'strategy': strategy,
+        'players': players,
+        'rounds': rounds,
+        'games': games,
+        'seconds': round(elapsed, 3),
+        'games_per_sec': round(games / elapsed) if elapsed else None,
+        'wagered': wagered,
+        'paid': paid,
+        'win_rate': wins / games if games else 0.0,
+        'house_edge': 1 - paid / wagered if wagered else 0.0,
+        'theoretical_house_edge': 1 - multiplier * win_probability,
+        'return_per_game': {'mean': mean_return, 'std': return_std},
+        'bust_fraction': float(len(busted) / players),
+        'bust_round_percentiles': (
+            {p: int(v) for p, v in zip(PERCENTILES, np.percentile(busted, PERCENTILES))}
+            if len(busted) else {}
+        ),
+        'bust_curve': bust_curve,
+        'final_balance': {
+            'mean': float(balances.mean()),
+            'std': float(balances.std()),
+            'percentiles': {p: int(v) for p, v in zip(PERCENTILES, np.percentile(balances, PERCENTILES))},
+            'histogram': {'counts': counts.tolist(), 'edges': [round(e, 1) for e in edges.tolist()]},
+        },
+    }
+
+
+def format_summary(results):
+    """Human-readable summary of one simulate() result."""
+    info = results['category']
+    low, high = info['range']
+    lines = [
+        f"{info['emoji']} {info['name']} ({low}-{high}, {info['multiplier']}x), "
+        f"{results['strategy']} strategy",
+        f"  {results['games']:,} games in {results['seconds']}s ({results['games_per_sec']:,} games/s)",
+        f"  house edge {results['house_edge']:+.2%} "
+        f"(theoretical {results['theoretical_house_edge']:+.2%}), win rate {results['win_rate']:.3%}",
+        f"  return per game: mean {results['return_per_game']['mean']:+.4f}, "
+        f"std {results['return_per_game']['std']:.3f} per credit bet",
+        f"  bust: {results['bust_fraction']:.1%} of {results['players']:,} players "
+        f"within {results['rounds']} rounds",
+    ]
+    if results['bust_round_percentiles']:
+        q = results['bust_round_percentiles']
+        lines.append(f"  bust round: p5 {q[5]}, p50 {q[50]}, p95 {q[95]}")
+    final = results['final_balance']
+    q = final['percentiles']
+    lines.append(f"  final balance: mean {final['mean']:,.0f}, std {final['std']:,.0f}, "
+                 f"p5 {q[5]:,}, p50 {q[50]:,}, p95 {q[95]:,}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo simulation of the game's payout economics")
+    parser.add_argument('--category', choices=[*CATEGORIES, 'all'], default='all')
+    parser.add_argument('--players', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=1000, help="games per player, at most")
+    parser.add_argument('--strategy', choices=STRATEGIES, default='flat')
+    parser.add_argument('--bet', type=int, default=100, help="flat bet, or the martingale base bet")
+    parser.add_argument('--fraction', type=float, default=0.01,
+                        help="share of the balance bet each game with --strategy fraction")
+    parser.add_argument('--initial-credits', type=int, default=INITIAL_CREDITS)
+    parser.add_argument('--multiplier', type=int, help="override the category multiplier")
+    parser.add_argument('--range', type=int, nargs=2, metavar=('LOW', 'HIGH'),
+                        help="override the category number range")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--json', help="write all results, with distributions, to this file")
+    args = parser.parse_args()
+
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        parser.exit(1, "The simulator needs NumPy: pip install numpy\n")
+
+    categories = list(CATEGORIES) if args.category == 'all' else [args.category]
+    all_results = {}
+    for category in categories:
+        info = dict(CATEGORIES[category])
+        if args.multiplier is not None:
+            info['multiplier'] = args.multiplier
+        if args.range is not None:
+            info['range'] = tuple(args.range)
+        results = simulate(info, args.players, args.rounds, args.strategy, args.bet, args.fraction,
+                           args.initial_credits, args.seed)
+        all_results[category] = results
+        print(format_summary(results))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump(all_results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
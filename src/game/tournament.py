@@ -0,0 +1,170 @@
+import asyncio
+import itertools
+import logging
+import random
+import time
+
+from ..config.settings import CATEGORIES, MIN_BET, TOURNAMENT_WINDOW
+from .game_logic import compute_payout, is_winning_guess
+
+logger = logging.getLogger(__name__)
+
+
+class TournamentEntry:
+    __slots__ = ('user_id', 'category', 'guess', 'bet_amount')
+
+    def __init__(self, user_id, category, guess, bet_amount):
+        self.user_id = user_id
+        self.category = category
+        self.guess = guess
+        self.bet_amount = bet_amount
+
+
+class TournamentRound:
+    """One open round: its entries, indexed by category and guess."""
+
+    def __init__(self, round_id, closes_at):
+        self.round_id = round_id
+        self.closes_at = closes_at  # time.time() when entries close
+        self.closed = False
+        self.entries = {}  # user_id -> TournamentEntry
+        self.bettors = {}  # category -> guess -> [TournamentEntry]
+        self._entering = 0  # entries whose escrow is still being committed
+        self._entered = asyncio.Event()
+        self._entered.set()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, entry):
+        self.entries[entry.user_id] = entry
+        self.bettors.setdefault(entry.category, {}).setdefault(entry.guess, []).append(entry)
+
+
+class TournamentManager:
+    """Shared-draw rounds: everyone's bets in a window settle against one draw.
+
+    The first entry opens a round, which closes TOURNAMENT_WINDOW seconds
+    later. Each bet is taken from the balance (escrowed) when the user
+    enters, so settlement cannot fail on a balance that moved meanwhile. At
+    close, one number is drawn per category, winners are looked up in the
+    guess -> bettors index, and the whole round is settled in one database
+    transaction. Results are handed to `notify`, a coroutine function
+    taking (round, results), in a background task.
+    """
+
+    def __init__(self, database, notify=None, window=TOURNAMENT_WINDOW, shard=None):
+        self.db = database
+        self.notify = notify
+        self.window = window
+        self.current = None
+        # Shard workers run their own rounds; interleaved ids keep them apart in tournament_entries
+        index, count = shard or (0, 1)
+        self._round_ids = itertools.count(int(time.time() * 1000) * count + index, count)
+        self._timer = None
+        self._tasks = set()
+
+    async def enter(self, user_id: int, username: str, category: str, bet_amount: int, guess: int):
+        """Enter the current round, opening one if none is open.
+
+        Returns (round, credits after the escrow) or (None, error message).
+        """
+        if category not in CATEGORIES:
+            return None, "Invalid category!"
+        if bet_amount < MIN_BET:
+            return None, f"Minimum bet is {MIN_BET} credits!"
+        min_num, max_num = CATEGORIES[category]['range']
+        if guess < min_num or guess > max_num:
+            return None, f"Number must be between {min_num} and {max_num}!"
+
+        round_ = self.current
+        if round_ is None:
+            round_ = self._open_round()
+        if user_id in round_.entries:
+            return None, "You already entered this round!"
+
+        entry = TournamentEntry(user_id, category, guess, bet_amount)
+        # Reserve the slot before awaiting, so the round can't close under us
+        round_.entries[user_id] = entry
+        round_._entering += 1
+        round_._entered.clear()
+        try:
+            await self.db.get_user(user_id, username)
+            credits = await self.db.escrow_tournament_bet(round_.round_id, user_id, category, guess, bet_amount)
+        except Exception:
+            del round_.entries[user_id]
+            raise
+        finally:
+            round_._entering -= 1
+            if not round_._entering:
+                round_._entered.set()
+
+        if credits is None:
+            del round_.entries[user_id]
+            return None, "You don't have enough credits!"
+        round_.add(entry)
+        return round_, credits
+
+    async def stop(self):
+        """Settle the open round now and wait for its notifications to be queued."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.current is not None:
+            await self._settle(self.current)
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _open_round(self):
+        round_ = TournamentRound(next(self._round_ids), time.time() + self.window)
+        self.current = round_
+        self._timer = asyncio.create_task(self._close_after(round_))
+        logger.info(f"Tournament round {round_.round_id} opened for {self.window}s")
+        return round_
+
+    async def _close_after(self, round_):
+        await asyncio.sleep(self.window)
+        # From here on stop() waits for the settlement instead of cancelling it
+        self._timer = None
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        try:
+            await self._settle(round_)
+        except Exception:
+            logger.exception(f"Failed to settle tournament round {round_.round_id}")
+
+    async def _settle(self, round_):
+        round_.closed = True
+        if self.current is round_:
+            self.current = None
+        await round_._entered.wait()
+        if not round_.entries:
+            return
+
+        start = time.perf_counter()
+        # One draw per category that has bets
+        winning_numbers = {
+            category: random.randint(*CATEGORIES[category]['range']) for category in round_.bettors
+        }
+        payouts = {}
+        for category, by_guess in round_.bettors.items():
+            multiplier = CATEGORIES[category]['multiplier']
+            for entry in by_guess.get(winning_numbers[category], ()):
+                payouts[entry.user_id] = compute_payout(entry.bet_amount, multiplier, True)
+
+        games = []
+        for entry in round_.entries.values():
+            winning_number = winning_numbers[entry.category]
+            games.append((entry.user_id, entry.category, entry.bet_amount, entry.guess, winning_number,
+                          is_winning_guess(entry.guess, winning_number), payouts.get(entry.user_id, 0)))
+
+        balances = await self.db.settle_tournament(round_.round_id, games, payouts)
+        logger.info(f"Tournament round {round_.round_id} settled: {len(games)} entries, "
+                    f"{len(payouts)} winners in {time.perf_counter() - start:.3f}s")
+
+        if self.notify is not None:
+            results = [(game, balances.get(game[0])) for game in games]
+            task = asyncio.create_task(self.notify(round_, results))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
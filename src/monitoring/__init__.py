@@ -0,0 +1,5 @@
+# __init__.py files to make directories into Python packages
+
+"""
+Monitoring package for Telegram Number Guessing Game
+"""
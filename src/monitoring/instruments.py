@@ -0,0 +1,78 @@
+"""
+The bot's metrics, and helpers that record them around handlers and queries.
+"""
+
+import functools
+import time
+
+from .metrics import Counter, Gauge, Histogram
+from .profiler import CURRENT_TRACE
+
+HANDLER_LATENCY = Histogram('bot_handler_seconds', "Time spent in an update handler", ('handler',))
+HANDLER_ERRORS = Counter('bot_handler_errors_total', "Update handlers that raised", ('handler',))
+
+DB_QUERY_LATENCY = Histogram('bot_db_query_seconds', "Time spent in a GameDatabase call", ('query',))
+DB_QUERY_ERRORS = Counter('bot_db_query_errors_total', "GameDatabase calls that raised", ('query',))
+
+SEND_LATENCY = Histogram('bot_send_seconds', "Bot API call latency of outbound sends", ('method',))
+SEND_RESULTS = Counter('bot_sends_total', "Outbound sends by result", ('method', 'result'))
+
+QUEUE_DEPTH = Gauge('bot_queue_depth', "Items waiting in an internal queue", ('queue',))
+ACTIVE_SESSIONS = Gauge('bot_active_sessions', "Game sessions waiting for a bet or a guess")
+ACTIVE_USERS = Gauge('bot_active_users', "Users with an update running or waiting")
+
+DB_CONNECTIONS = Gauge('bot_db_connections', "Open database connections by pool", ('pool',))
+DB_CONNECTIONS_IN_USE = Gauge('bot_db_connections_in_use', "Database connections running a query or transaction",
+                              ('pool',))
+
+SHARD_RESTARTS = Counter('bot_shard_restarts_total', "Shard worker processes restarted after exiting", ('shard',))
+
+
+def instrument_handler(name, callback):
+    """Wrap a python-telegram-bot callback to record its latency and errors."""
+    latency = HANDLER_LATENCY.labels(name)
+    errors = HANDLER_ERRORS.labels(name)
+    step = callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        trace = CURRENT_TRACE.get()
+        if trace is not None:
+            trace.handlers.append(step)
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+def timed_query(func):
+    """Record latency and errors of an async GameDatabase method, by method name.
+
+    The call is also listed on the trace of the update being profiled, if any.
+    """
+    name = func.__name__
+    latency = DB_QUERY_LATENCY.labels(name)
+    errors = DB_QUERY_ERRORS.labels(name)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            latency.observe(elapsed)
+            trace = CURRENT_TRACE.get()
+            if trace is not None:
+                trace.db_calls.append((name, elapsed))
+
+    return wrapper
@@ -0,0 +1,197 @@
+"""
+Sampling profiler for update processing.
+
+While enabled, a background thread samples the event loop thread's stack
+every PROFILE_INTERVAL_MS and charges each sample to the update whose
+coroutine is on the stack, so concurrent updates are profiled separately.
+Handlers and GameDatabase calls record themselves on the update's trace
+through a context variable. A trace is written out when the update was
+picked by the PROFILE_SAMPLE_RATE lottery or took PROFILE_SLOW_MS or more;
+all others are dropped.
+
+Dumps are folded stacks ("frame;frame;frame count" lines, readable by
+flamegraph.pl and speedscope) under a header naming the update, its
+handlers and its DB calls. Only the newest PROFILE_MAX_FILES are kept.
+"""
+
+import collections
+import contextvars
+import functools
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+from ..config.settings import (
+    PROFILE_DIR, PROFILE_SAMPLE_RATE, PROFILE_SLOW_MS, PROFILE_INTERVAL_MS, PROFILE_MAX_FILES
+)
+
+logger = logging.getLogger(__name__)
+
+# The trace of the update being processed in the current task, if profiled
+CURRENT_TRACE = contextvars.ContextVar('current_trace', default=None)
+
+
+class UpdateTrace:
+    __slots__ = ('update_id', 'user_id', 'started', 'start', 'elapsed', 'sampled',
+                 'handlers', 'db_calls', 'samples')
+
+    def __init__(self, update, sampled):
+        self.update_id = getattr(update, 'update_id', None)
+        user = getattr(update, 'effective_user', None)
+        self.user_id = user.id if user is not None else None
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.elapsed = None
+        self.sampled = sampled
+        self.handlers = []  # e.g. ['button_callback', 'handle_bet_selection']
+        self.db_calls = []  # (GameDatabase method, seconds)
+        self.samples = {}  # folded stack -> sample count
+
+
+def profile_step(func):
+    """Name an async handler step on the current update's trace."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        trace = CURRENT_TRACE.get()
+        if trace is not None:
+            trace.handlers.append(name)
+        return await func(*args, **kwargs)
+
+    return wrapper
+
+
+class UpdateProfiler:
+    """Profiles updates passed through `run()` while enabled; toggled at runtime."""
+
+    def __init__(self, directory=PROFILE_DIR, sample_rate=PROFILE_SAMPLE_RATE, slow_ms=PROFILE_SLOW_MS,
+                 interval_ms=PROFILE_INTERVAL_MS, max_files=PROFILE_MAX_FILES):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.interval = interval_ms / 1000
+        self.max_files = max_files
+        self.enabled = False
+        self.traced = 0
+        self.dumped = 0
+        self._active = {}  # frame of a running run() -> UpdateTrace
+        self._lock = threading.Lock()
+        self._finished = collections.deque()
+        self._thread = None
+        self._stop = threading.Event()
+        self._loop_thread = None
+
+    def enable(self):
+        """Start sampling updates of the calling (event loop) thread."""
+        if self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._loop_thread = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, name='update-profiler', daemon=True)
+        self._thread.start()
+        self.enabled = True
+        logger.info(f"Update profiler on: sampling {self.sample_rate:.1%} of updates "
+                    f"and any over {self.slow_ms} ms into {self.directory}")
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._write_finished()
+        logger.info("Update profiler off")
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'slow_ms': self.slow_ms,
+            'traced': self.traced,
+            'dumped': self.dumped,
+            'directory': self.directory,
+        }
+
+    async def run(self, update, coroutine):
+        """Await `coroutine`, which processes `update`, profiling it if enabled."""
+        if not self.enabled:
+            return await coroutine
+        trace = UpdateTrace(update, random.random() < self.sample_rate)
+        frame = sys._getframe()
+        token = CURRENT_TRACE.set(trace)
+        with self._lock:
+            self._active[frame] = trace
+        try:
+            return await coroutine
+        finally:
+            with self._lock:
+                del self._active[frame]
+            CURRENT_TRACE.reset(token)
+            trace.elapsed = time.perf_counter() - trace.start
+            self.traced += 1
+            if trace.sampled or trace.elapsed * 1000 >= self.slow_ms:
+                self._finished.append(trace)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = []
+            with self._lock:
+                if self._active:
+                    while frame is not None:
+                        trace = self._active.get(frame)
+                        if trace is not None:
+                            key = ';'.join(reversed(stack))
+                            trace.samples[key] = trace.samples.get(key, 0) + 1
+                            break
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                        frame = frame.f_back
+            self._write_finished()
+
+    def _write_finished(self):
+        while self._finished:
+            trace = self._finished.popleft()
+            try:
+                self._write(trace)
+            except OSError:
+                logger.exception("Failed to write an update profile")
+
+    def _write(self, trace):
+        elapsed_ms = trace.elapsed * 1000
+        handlers = ' > '.join(trace.handlers) or 'unhandled'
+        reason = 'slow' if elapsed_ms >= self.slow_ms else 'sampled'
+        name = (f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(trace.started))}-{trace.update_id}-"
+                f"{re.sub(r'[^A-Za-z0-9_]+', '-', handlers)}-{elapsed_ms:.0f}ms.folded")
+        db_time = sum(seconds for _, seconds in trace.db_calls)
+        lines = [
+            f"# update {trace.update_id} from user {trace.user_id} at "
+            f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(trace.started))}",
+            f"# handlers: {handlers}",
+            f"# elapsed: {elapsed_ms:.1f} ms ({reason})",
+            f"# db calls: {len(trace.db_calls)}, {db_time * 1000:.1f} ms: "
+            + ', '.join(f"{query} {seconds * 1000:.1f} ms" for query, seconds in trace.db_calls),
+            f"# samples: {sum(trace.samples.values())} every {self.interval * 1000:g} ms "
+            f"(time awaiting I/O is not sampled)",
+        ]
+        lines.extend(f"{stack} {count}" for stack, count in
+                     sorted(trace.samples.items(), key=lambda item: item[1], reverse=True))
+        with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as fh:
+            fh.write('\n'.join(lines) + '\n')
+        self.dumped += 1
+        self._rotate()
+
+    def _rotate(self):
+        dumps = sorted(entry for entry in os.listdir(self.directory) if entry.endswith('.folded'))
+        for entry in dumps[:max(0, len(dumps) - self.max_files)]:
+            try:
+                os.remove(os.path.join(self.directory, entry))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,58 @@
+import asyncio
+import logging
+
+from ..config.settings import METRICS_LISTEN, METRICS_PORT
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsServer:
+    """Local HTTP endpoint serving the registry at GET /metrics for Prometheus to scrape."""
+
+    def __init__(self, registry=REGISTRY, host=METRICS_LISTEN, port=METRICS_PORT, path='/metrics'):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.path = path
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # Pick up the real port when listening on port 0
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Metrics available at http://{self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass  # Headers are not needed
+            parts = request_line.decode('latin-1').split()
+            if len(parts) != 3:
+                status, body = '400 Bad Request', b''
+            elif parts[1].split('?', 1)[0] != self.path:
+                status, body = '404 Not Found', b''
+            elif parts[0] != 'GET':
+                status, body = '405 Method Not Allowed', b''
+            else:
+                status, body = '200 OK', self.registry.render().encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()